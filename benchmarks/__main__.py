@@ -0,0 +1,120 @@
+"""Benchmark suite of the parallel robot simulation.
+
+Run from the repository root:
+
+    python -m benchmarks run [--quick] [--output results.json] [names...]
+    python -m benchmarks compare benchmarks/baseline.json results.json
+
+compare exits with status 1 when a result is worse than the baseline by
+more than the threshold (20% by default, noisy results set their own).
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+
+from .suite import BENCHMARKS
+
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+
+
+def run(names, quick):
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results.update(BENCHMARKS[name](quick))
+    return {
+        'metadata': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns the names of the results worse than baseline by threshold."""
+    regressions = []
+    if baseline['metadata']['quick'] != current['metadata']['quick']:
+        print("Warning: comparing quick and full runs.")
+    print(f"{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:40} {'-':>12} {result['value']:12.4g}")
+            continue
+        reference = baseline['results'][name]['value']
+        value = result['value']
+        # Relative change, positive when better
+        if reference == 0:
+            change = 0.0 if value == 0 else (
+                np.inf if result['higher_is_better'] else -np.inf)
+        elif result['higher_is_better']:
+            change = value / reference - 1.0
+        else:
+            change = reference / value - 1.0 if value else np.inf
+        flag = ''
+        if change < -result.get('threshold', threshold):
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print(f"{name:40} {reference:12.4g} {value:12.4g} {change:+8.1%}"
+              f"{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('names',
+                            nargs='*',
+                            help='benchmarks to run, all by default: ' +
+                            ', '.join(BENCHMARKS))
+    run_parser.add_argument('--quick',
+                            action='store_true',
+                            help='fewer repetitions and shorter runs')
+    run_parser.add_argument('--output', help='JSON file of the results')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='flag regressions against a baseline')
+    compare_parser.add_argument('baseline', nargs='?',
+                                default=DEFAULT_BASELINE)
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold',
+                                type=float,
+                                default=0.2,
+                                help='allowed relative slowdown')
+
+    arguments = parser.parse_args()
+    if arguments.command == 'run':
+        unknown = set(arguments.names) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        results = run(arguments.names or list(BENCHMARKS), arguments.quick)
+        output = json.dumps(results, indent=2)
+        if arguments.output:
+            with open(arguments.output, 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            print(output)
+        return 0
+
+    with open(arguments.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(arguments.current) as current_file:
+        current = json.load(current_file)
+    regressions = compare(baseline, current, arguments.threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
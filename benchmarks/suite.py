@@ -0,0 +1,460 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+from parallel_robot.compiled_job import CompiledJob, compile_job
+from parallel_robot.jobs import load_csv_job
+from parallel_robot.kernels import get_available_backends
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.planner import MotionLimits
+from parallel_robot.robot import ParallelRobot
+from parallel_robot.server import RobotClient
+from parallel_robot.simulation import SAMPLING_TIME, Simulation
+from parallel_robot.sweep import configuration_grid, sweep_configurations
+from parallel_robot.tools import (Command, CommandSharer, RobotConfiguration,
+                                  Telemetry, TelemetrySharer, TimeManager,
+                                  VirtualTimeManager)
+from parallel_robot.trajectories import constant_velocity
+from parallel_robot.validation import validate_commands
+
+ROBOT_CONFIGURATION = RobotConfiguration(0.08, 0.08, 0.12,
+                                         np.array([0.0, 0.0]),
+                                         np.array([np.pi / 2, np.pi / 2]))
+
+
+def measure(function, number, repeat=5):
+    """Returns the best time per call of function over repeat runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+# Results are {'value', 'unit', 'higher_is_better'} dictionaries, with an
+# optional 'threshold' overriding the relative change flagged by compare
+
+
+def seconds(value):
+    return {'value': value, 'unit': 's', 'higher_is_better': False}
+
+
+def rate(value):
+    return {'value': value, 'unit': '1/s', 'higher_is_better': True}
+
+
+def workspace_points(number_of_points, seed=0):
+    """Returns random (N, 2) points inside the benchmark robot workspace."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack((rng.uniform(0.0, 0.08, number_of_points),
+                            rng.uniform(0.08, 0.16, number_of_points)))
+
+
+def kinematics(quick):
+    robot = ParallelRobot(*ROBOT_CONFIGURATION)
+    points = workspace_points(10**4 if quick else 10**5)
+    joint_positions = robot.inverse_kinematics_batch(points)
+    number = 2000 if quick else 20000
+    return {
+        'forward_kinematics_scalar':
+        seconds(
+            measure(lambda: robot.forward_kinematics(joint_positions[0]),
+                    number)),
+        'inverse_kinematics_scalar':
+        seconds(measure(lambda: robot.inverse_kinematics(points[0]), number)),
+        'forward_kinematics_batch_per_point':
+        seconds(
+            measure(lambda: robot.forward_kinematics_batch(joint_positions),
+                    10) / len(points)),
+        'inverse_kinematics_batch_per_point':
+        seconds(
+            measure(lambda: robot.inverse_kinematics_batch(points), 10) /
+            len(points)),
+    }
+
+
+def kinematics_backends(quick):
+    # The tick path of the simulation and the batches, per backend
+    points = workspace_points(10**4 if quick else 10**5)
+    number = 2000 if quick else 20000
+    results = {}
+    for backend in get_available_backends():
+        robot = ParallelRobot(*ROBOT_CONFIGURATION, backend=backend)
+        results[f'{backend}_set_cartesian_position'] = seconds(
+            measure(lambda: robot.set_cartesian_position(points[0]),
+                    number))
+        results[f'{backend}_in_workspace'] = seconds(
+            measure(lambda: robot.in_workspace(points[0]), number))
+        joint_positions = robot.inverse_kinematics_batch(points)
+        results[f'{backend}_ik_batch_per_point'] = seconds(
+            measure(lambda: robot.inverse_kinematics_batch(points), 10) /
+            len(points))
+        results[f'{backend}_fk_batch_per_point'] = seconds(
+            measure(lambda: robot.forward_kinematics_batch(joint_positions),
+                    10) / len(points))
+    return results
+
+
+def trajectories(quick):
+    initial = np.array([0.04, 0.1])
+    number = 200 if quick else 2000
+    return {
+        # 5 samples and 2500 samples at 0.2 m/s
+        'constant_velocity_short':
+        seconds(
+            measure(
+                lambda: constant_velocity(initial, initial + (0.001, 0.0),
+                                          0.2, SAMPLING_TIME), number)),
+        'constant_velocity_long':
+        seconds(
+            measure(
+                lambda: constant_velocity(initial, initial + (0.3, 0.4), 0.2,
+                                          SAMPLING_TIME), number // 10)),
+    }
+
+
+def run_concurrently(workers, duration):
+    """Runs worker(stop_event) in threads for duration seconds."""
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(stop_event, ))
+        for worker in workers
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+
+
+def telemetry_sharer(quick, number_of_readers=4):
+    duration = 0.5 if quick else 2.0
+    sharer = TelemetrySharer()
+    reads = [0] * number_of_readers
+    joint_position = np.array([1.0, 2.0])
+    cartesian_position = np.array([0.04, 0.1])
+
+    def writer(stop_event):
+        while not stop_event.is_set():
+            sharer.publish(joint_position, cartesian_position, True)
+
+    def reader(index):
+
+        def read(stop_event):
+            telemetry = Telemetry(np.zeros(2), np.zeros(2), False)
+            while not stop_event.is_set():
+                sharer.read_telemetry(telemetry)
+                reads[index] += 1
+
+        return read
+
+    run_concurrently([writer] + [reader(i) for i in range(number_of_readers)],
+                     duration)
+    return {
+        'telemetry_publish_rate': rate(sharer.get_sequence() / duration),
+        'telemetry_read_rate': rate(sum(reads) / duration),
+    }
+
+
+def command_sharer(quick, number_of_readers=4):
+    duration = 0.5 if quick else 2.0
+    sharer = CommandSharer(2**16)
+    command = Command(np.array([0.04, 0.1]), True)
+    added = [0]
+    taken = [0]
+
+    def producer(stop_event):
+        while not stop_event.is_set():
+            if sharer.add_command(command, block=True, timeout=0.01):
+                added[0] += 1
+
+    def consumer(stop_event):
+        while not stop_event.is_set():
+            if sharer.get_command() is not None:
+                sharer.task_done()
+                taken[0] += 1
+
+    def reader(stop_event):
+        while not stop_event.is_set():
+            sharer.get_number_of_unfinished_commands()
+            sharer.get_executing_command_index()
+
+    run_concurrently([producer, consumer] + [reader] * number_of_readers,
+                     duration)
+    return {
+        'command_add_rate': rate(added[0] / duration),
+        'command_take_rate': rate(taken[0] / duration),
+    }
+
+
+def fit_to_workspace(points):
+    """Scales and moves the points into the benchmark robot workspace."""
+    minimum = points.min(axis=0)
+    size = np.ptp(points, axis=0).max()
+    return (points - minimum) / size * 0.08 + (0.0, 0.08)
+
+
+def drawing_job(quick, csv_file_path='drawing.csv'):
+    points, drawing = load_csv_job(csv_file_path)
+    points = fit_to_workspace(points)
+
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer()
+    command_sharer.add_commands(points, drawing)
+    simulation = Simulation(telemetry_sharer, command_sharer,
+                            ROBOT_CONFIGURATION)
+    time_manager = VirtualTimeManager(SAMPLING_TIME)
+    start = time.perf_counter()
+    simulation.run_until_idle(threading.Event(), time_manager)
+    elapsed = time.perf_counter() - start
+    return {
+        'drawing_job_time': seconds(elapsed),
+        'drawing_job_sample_rate': rate(telemetry_sharer.get_sequence() /
+                                        elapsed),
+    }
+
+
+def motion_planner(quick, csv_file_path='drawing.csv'):
+    # Simulated duration of the drawing job with constant velocity moves
+    # and with the default MotionLimits, which limit the acceleration
+    points, drawing = load_csv_job(csv_file_path)
+    points = fit_to_workspace(points)
+    results = {}
+    for name, motion_limits in (('constant_velocity', None),
+                                ('planned', MotionLimits())):
+        command_sharer = CommandSharer()
+        telemetry_sharer = TelemetrySharer()
+        command_sharer.add_commands(points, drawing)
+        simulation = Simulation(telemetry_sharer, command_sharer,
+                                ROBOT_CONFIGURATION,
+                                motion_limits=motion_limits)
+        time_manager = VirtualTimeManager(SAMPLING_TIME)
+        start = time.perf_counter()
+        simulation.run_until_idle(threading.Event(), time_manager)
+        elapsed = time.perf_counter() - start
+        results[f'{name}_job_duration'] = seconds(
+            telemetry_sharer.get_sequence() * SAMPLING_TIME)
+        results[f'{name}_job_sample_rate'] = rate(
+            telemetry_sharer.get_sequence() / elapsed)
+    return results
+
+
+def validation(quick, csv_file_path='drawing.csv'):
+    points, drawing = load_csv_job(csv_file_path)
+    points = fit_to_workspace(points)
+    repeats = 10 if quick else 100
+    job_points = np.tile(points, (repeats, 1))
+    job_drawing = np.tile(drawing, repeats)
+    initial_position = ParallelRobot(*ROBOT_CONFIGURATION).get_state()[1]
+    start = time.perf_counter()
+    result = validate_commands(initial_position, job_points, job_drawing,
+                               ROBOT_CONFIGURATION)
+    validation_time = time.perf_counter() - start
+
+    # The drawing job without the per sample workspace check
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer()
+    command_sharer.add_commands(result.points[:len(points)],
+                                result.drawing[:len(points)],
+                                validated_start=initial_position)
+    simulation = Simulation(telemetry_sharer, command_sharer,
+                            ROBOT_CONFIGURATION)
+    time_manager = VirtualTimeManager(SAMPLING_TIME)
+    start = time.perf_counter()
+    simulation.run_until_idle(threading.Event(), time_manager)
+    elapsed = time.perf_counter() - start
+    return {
+        'validation_command_rate': rate(len(job_points) / validation_time),
+        'validated_job_sample_rate': rate(telemetry_sharer.get_sequence() /
+                                          elapsed),
+    }
+
+
+def compiled_job_replay(quick, csv_file_path='drawing.csv'):
+    points, drawing = load_csv_job(csv_file_path)
+    points = fit_to_workspace(points)
+
+    # The job is short, so the best of a few runs as in measure()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'drawing.job')
+        compile_time = measure(
+            lambda: compile_job(path, points, drawing, ROBOT_CONFIGURATION),
+            1)
+
+        elapsed = float('inf')
+        for _ in range(5):
+            telemetry_sharer = TelemetrySharer()
+            simulation = Simulation(telemetry_sharer, CommandSharer(),
+                                    ROBOT_CONFIGURATION)
+            simulation.replay(CompiledJob(path, ROBOT_CONFIGURATION))
+            time_manager = VirtualTimeManager(SAMPLING_TIME)
+            start = time.perf_counter()
+            simulation.run_until_idle(threading.Event(), time_manager)
+            elapsed = min(elapsed, time.perf_counter() - start)
+            # Releases the memory map before the file is removed
+            del simulation
+    results = {
+        'compiled_job_compile_time': seconds(compile_time),
+        'compiled_job_replay_sample_rate': rate(
+            telemetry_sharer.get_sequence() / elapsed),
+    }
+    # Both vary by a third between processes, even as the best of runs
+    for result in results.values():
+        result['threshold'] = 0.4
+    return results
+
+
+def sweep(quick, csv_file_path='drawing.csv'):
+    # Per process, so the rate does not depend on the number of cores
+    points, drawing = load_csv_job(csv_file_path)
+    points = fit_to_workspace(points)
+    robot_configurations = configuration_grid(
+        np.linspace(0.04, 0.16, 4), np.linspace(0.06, 0.14, 4 if quick else 8),
+        np.linspace(0.08, 0.2, 4 if quick else 8))
+    start = time.perf_counter()
+    for _ in sweep_configurations(robot_configurations,
+                                  points,
+                                  drawing,
+                                  max_workers=1):
+        pass
+    return {
+        'sweep_configuration_rate':
+        rate(len(robot_configurations) / (time.perf_counter() - start)),
+    }
+
+
+def loop_jitter(quick):
+    duration = 1.0 if quick else 5.0
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer()
+    # Keeps the robot moving during the whole run
+    points = workspace_points(int(duration * 100))
+    command_sharer.add_commands(points, True)
+
+    # Same loop as simulation() on the real-time clock
+    stop_event = threading.Event()
+    time_manager = TimeManager(SAMPLING_TIME)
+    thread = threading.Thread(
+        target=Simulation(telemetry_sharer, command_sharer,
+                          ROBOT_CONFIGURATION).run,
+        args=(stop_event, time_manager))
+    thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    thread.join()
+
+    statistics = time_manager.get_statistics()
+    # Scheduling noise is large, so only flag when the jitter doubles: a
+    # lower is better result is worse by threshold when it grows by
+    # 1 / (1 - threshold)
+    results = {
+        'loop_mean_period_error':
+        seconds(abs(statistics.mean_period - SAMPLING_TIME)),
+        'loop_p99_period_error':
+        seconds(abs(statistics.percentiles[99.0] - SAMPLING_TIME)),
+        'loop_overrun_ratio': {
+            'value':
+            statistics.number_of_overruns /
+            max(statistics.number_of_periods, 1),
+            'unit': '',
+            'higher_is_better': False
+        },
+    }
+    for result in results.values():
+        result['threshold'] = 0.5
+    return results
+
+
+def server(quick, number_of_subscribers=4):
+    # Clients on the main thread, the server on its own loop and the
+    # simulation in real time, over a Unix domain socket
+    robot_simulation = ParallelRobotSimulation(
+        *ROBOT_CONFIGURATION, visualization=False)
+    telemetry_sharer = robot_simulation.get_telemetry_sharer()
+    robot_simulation.start()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'robot.sock')
+    robot_simulation.start_server(path)
+
+    number_of_commands = 2 * 10**4 if quick else 10**5
+    number_of_pings = 1000 if quick else 10000
+    points = workspace_points(number_of_commands)
+
+    async def subscriber(latencies):
+        # Age of the newest sample of a frame when it is received
+        client = await RobotClient.connect(path)
+        await client.subscribe(1)
+        try:
+            async for samples in client.telemetry():
+                latencies.append((telemetry_sharer.get_sequence() -
+                                  samples['sequence'][-1]) * SAMPLING_TIME)
+        finally:
+            await client.close()
+
+    async def main():
+        client = await RobotClient.connect(path)
+        start = time.perf_counter()
+        for i in range(0, number_of_commands, 1000):
+            await client.add_commands(points[i:i + 1000], True)
+        command_time = time.perf_counter() - start
+
+        latencies = []
+        subscribers = [
+            asyncio.create_task(subscriber(latencies))
+            for _ in range(number_of_subscribers)
+        ]
+        round_trips = []
+        for _ in range(number_of_pings):
+            start = time.perf_counter()
+            await client.ping()
+            round_trips.append(time.perf_counter() - start)
+        for task in subscribers:
+            task.cancel()
+        await asyncio.gather(*subscribers, return_exceptions=True)
+        await client.close()
+        return command_time, round_trips, latencies
+
+    command_time, round_trips, latencies = asyncio.run(main())
+    robot_simulation.stop()
+    os.rmdir(directory)
+
+    results = {
+        'server_command_rate': rate(number_of_commands / command_time),
+        'server_ping_median_round_trip': seconds(np.median(round_trips)),
+        'server_ping_p99_round_trip':
+        seconds(np.percentile(round_trips, 99)),
+        'server_telemetry_mean_latency': seconds(np.mean(latencies)),
+    }
+    # From the spread of repeated runs. The latency is a whole number of
+    # sampling periods, mostly 0, so its mean varies up to threefold
+    thresholds = {
+        'server_command_rate': 0.5,
+        'server_ping_median_round_trip': 0.3,
+        'server_ping_p99_round_trip': 0.5,
+        'server_telemetry_mean_latency': 0.75,
+    }
+    for name, threshold in thresholds.items():
+        results[name]['threshold'] = threshold
+    return results
+
+
+BENCHMARKS = {
+    'kinematics': kinematics,
+    'kinematics_backends': kinematics_backends,
+    'trajectories': trajectories,
+    'telemetry_sharer': telemetry_sharer,
+    'command_sharer': command_sharer,
+    'drawing_job': drawing_job,
+    'motion_planner': motion_planner,
+    'validation': validation,
+    'compiled_job_replay': compiled_job_replay,
+    'sweep': sweep,
+    'loop_jitter': loop_jitter,
+    'server': server,
+}
@@ -1,9 +1,9 @@
-import csv
 import numpy as np
 from time import sleep
 from scipy.optimize import fsolve
 
-from parallel_robot import ParallelRobotSimulation, Command, RobotConfiguration
+from parallel_robot import ParallelRobotSimulation, RobotConfiguration
+from parallel_robot.jobs import load_csv_job, optimize_job
 
 
 def printing_area_function(h, robot_configuration: RobotConfiguration, ratio):
@@ -17,23 +17,6 @@ def printing_area_function(h, robot_configuration: RobotConfiguration, ratio):
                                robot_configuration.link_arm_length) - h * ratio
 
 
-def load_points_from_csv(csv_file_path):
-    points_array = []
-    drawing_array = []
-    with open(csv_file_path) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            # Convert x and y to float, and the boolean according to its truth value
-            x = float(row[0])
-            y = float(row[1])
-            draw = True if row[2] == 'true' else False
-            points_array.append([x, y])
-            drawing_array.append(draw)
-    # Convert to a structured NumPy array for easier manipulation
-    points_array = np.array(points_array, dtype=np.float64)
-    return points_array, drawing_array
-
-
 def process_points(points_array, robot_configuration):
     # Extract x, y coordinates, and drawing boolean
     x_coords = points_array[:, 0]
@@ -86,17 +69,27 @@ def main():
                                                LINK_ARM_LENGTH, TCP_OFFSET)
     robot_configuration = robot_simulation.get_robot_configuration()
 
-    points_array, drawing_array = load_points_from_csv('drawing.csv')
+    points_array, drawing_array = load_csv_job('drawing.csv')
     transformed_points_array = process_points(
         points_array=points_array, robot_configuration=robot_configuration)
 
-    for point, draw in zip(transformed_points_array, drawing_array):
-        robot_simulation.add_command(Command(point, draw))
+    transformed_points_array, drawing_array, optimization = optimize_job(
+        transformed_points_array, drawing_array)
+    print(f"Commands: {optimization.number_of_commands_before} -> "
+          f"{optimization.number_of_commands_after}")
+    print(f"Estimated time: {optimization.execution_time_before:.1f} s -> "
+          f"{optimization.execution_time_after:.1f} s")
+
+    robot_simulation.add_commands(transformed_points_array, drawing_array)
 
     robot_simulation.start()
-    robot_simulation.wait_until_no_commands()
-    sleep(5.0)
-    robot_simulation.stop()
+    try:
+        robot_simulation.wait_until_no_commands()
+        sleep(5.0)
+    except KeyboardInterrupt:
+        print("Ctrl+C exiting the program.")
+    finally:
+        robot_simulation.stop()
 
 
 if __name__ == "__main__":
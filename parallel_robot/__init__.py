@@ -1,4 +1,46 @@
-from .parallel_robot_simulation import ParallelRobotSimulation
-from .tools import Command, Telemetry, RobotConfiguration
+import importlib
 
-__all__ = ['ParallelRobotSimulation', 'Command', 'Telemetry', 'RobotConfiguration']
\ No newline at end of file
+# Module of every public name, imported on first access so that importing
+# the package does not load NumPy, pygame or SciPy
+_EXPORTS = {
+    'ParallelRobotSimulation': '.parallel_robot_simulation',
+    'FleetSimulation': '.fleet',
+    'MotionLimits': '.planner',
+    'OfflineRenderer': '.rendering',
+    'CompiledJob': '.compiled_job',
+    'compile_job': '.compiled_job',
+    'TelemetryRecorder': '.recorder',
+    'TelemetryLog': '.recorder',
+    'RobotServer': '.server',
+    'RobotClient': '.server',
+    'SweepResult': '.sweep',
+    'configuration_grid': '.sweep',
+    'configuration_samples': '.sweep',
+    'sweep_configurations': '.sweep',
+    'InvalidCommand': '.validation',
+    'ValidationResult': '.validation',
+    'validate_commands': '.validation',
+    'VisualizationBackend': '.visualization_backends',
+    'get_visualization_backend': '.visualization_backends',
+    'WorkspaceGrid': '.workspace_grid',
+    'get_workspace_grid': '.workspace_grid',
+    'Command': '.tools',
+    'Telemetry': '.tools',
+    'RobotConfiguration': '.tools',
+    'TELEMETRY_DTYPE': '.tools',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
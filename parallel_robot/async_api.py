@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+import itertools
+import numpy as np
+
+from .simulation import SAMPLING_TIME
+
+
+class AsyncParallelRobotSimulation:
+    """asyncio facade of a real-time, threaded ParallelRobotSimulation.
+
+    Command completion is signalled by the simulation thread through the
+    CommandSharer finished callbacks, which wake the waiting coroutines on
+    their event loop, so nothing is polled. Use it from a single event loop
+    and call close() when done.
+    """
+
+    def __init__(self, robot_simulation, loop=None):
+        if (not robot_simulation.is_real_time() or
+                robot_simulation.is_process()):
+            raise ValueError(
+                "The asyncio API needs the real-time thread backend.")
+        self._robot_simulation = robot_simulation
+        self._command_sharer = robot_simulation.get_command_sharer()
+        self._telemetry_sharer = robot_simulation.get_telemetry_sharer()
+        self._loop = loop or asyncio.get_running_loop()
+
+        # (last command index + 1, tie breaker, future) of every waiter
+        self._waiters = []
+        self._tie_breaker = itertools.count()
+        self._idle_waiters = []
+        self._number_of_finished_commands = \
+            self._command_sharer.get_number_of_finished_commands()
+
+        self._command_sharer.add_finished_callback(self._finished_callback)
+
+    def close(self):
+        self._command_sharer.remove_finished_callback(self._finished_callback)
+
+    def _finished_callback(self, number_of_finished_commands):
+        # Runs in the simulation thread
+        self._loop.call_soon_threadsafe(self._on_finished,
+                                        number_of_finished_commands)
+
+    def _on_finished(self, number_of_finished_commands):
+        self._number_of_finished_commands = max(
+            self._number_of_finished_commands, number_of_finished_commands)
+        self._resolve()
+
+    def _resolve(self):
+        finished = self._number_of_finished_commands
+        while self._waiters and self._waiters[0][0] <= finished:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+        if self._command_sharer.get_number_of_unfinished_commands() == 0:
+            for future in self._idle_waiters:
+                if not future.done():
+                    future.set_result(None)
+            self._idle_waiters = []
+
+    async def _wait_for(self, number_of_finished_commands):
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters, (number_of_finished_commands,
+                                       next(self._tie_breaker), future))
+        # The commands may have finished before the waiter was registered
+        self._number_of_finished_commands = max(
+            self._number_of_finished_commands,
+            self._command_sharer.get_number_of_finished_commands())
+        self._resolve()
+        await future
+
+    async def add_commands(self, points, drawing):
+        """Enqueues (N, 2) points and returns once all of them are executed.
+
+        Waits for space in a bounded queue in an executor thread. With
+        validation the rejected commands are not waited for.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                                  (len(points), ))
+        # Through the simulation, which validates the commands if enabled
+        added, end_index = self._robot_simulation.put_commands(points,
+                                                               drawing,
+                                                               block=False)
+        if added < len(points):
+            # Commands finish in order, so waiting for the last one is enough
+            _, end_index = await self._loop.run_in_executor(
+                None, self._robot_simulation.put_commands, points[added:],
+                drawing[added:])
+        await self._wait_for(end_index)
+
+    async def add_command(self, command):
+        """Enqueues a command and returns once its trajectory is executed."""
+        await self.add_commands([command.cartesian_position],
+                                [command.drawing])
+
+    async def wait_idle(self):
+        """Returns once the command queue is drained and the robot stopped."""
+        future = self._loop.create_future()
+        self._idle_waiters.append(future)
+        self._resolve()
+        await future
+
+    async def telemetry(self, decimation=1):
+        """Yields every decimation-th telemetry sample (TELEMETRY_DTYPE row).
+
+        Samples are read from the telemetry history once per decimation
+        sampling periods. Samples overwritten before they were read are
+        skipped.
+        """
+        sequence = self._telemetry_sharer.get_sequence()
+        sequence -= sequence % decimation
+        while True:
+            await asyncio.sleep(decimation * SAMPLING_TIME)
+            samples, last_sequence, _ = \
+                self._telemetry_sharer.get_telemetry_since(sequence)
+            for sample in samples[samples['sequence'] % decimation == 0]:
+                yield sample
+            sequence = last_sequence
@@ -0,0 +1,223 @@
+import hashlib
+import numpy as np
+
+from .robot import ParallelRobot
+from .simulation import SAMPLING_TIME
+from .trajectories import constant_velocity
+
+COMPILED_JOB_MAGIC = b'PRJOB'
+COMPILED_JOB_VERSION = 1
+
+# The command table starts at HEADER_SIZE and the setpoints follow it
+HEADER_SIZE = 256
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', np.uint32),
+    ('configuration_hash', 'S64'),
+    ('sampling_time', np.float64),
+    ('max_velocity', np.float64),
+    ('number_of_commands', np.int64),
+    ('number_of_setpoints', np.int64),
+    ('initial_joint_position', np.float64, (2, )),
+    ('initial_cartesian_position', np.float64, (2, )),
+], align=True)
+
+COMMAND_DTYPE = np.dtype([
+    ('first_setpoint', np.int64),
+    ('number_of_setpoints', np.int64),
+    ('number_of_rejected_samples', np.int64),
+])
+
+SETPOINT_DTYPE = np.dtype([
+    ('joint_position', np.float64, (2, )),
+    ('cartesian_position', np.float64, (2, )),
+    ('drawing', np.bool_),
+], align=True)
+
+
+def configuration_hash(robot_configuration):
+    """Returns the hex SHA-256 of the values of a RobotConfiguration."""
+    values = np.concatenate([
+        np.ravel(np.asarray(value, dtype=np.float64))
+        for value in robot_configuration
+    ])
+    return hashlib.sha256(values.tobytes()).hexdigest()
+
+
+def _setpoints_offset(number_of_commands):
+    return HEADER_SIZE + number_of_commands * COMMAND_DTYPE.itemsize
+
+
+def compile_job(path,
+                points,
+                drawing,
+                robot_configuration,
+                max_velocity=0.2,
+                sampling_time=SAMPLING_TIME,
+                chunk_size=4096):
+    """Writes the setpoints of (N, 2) points and drawing flags to path.
+
+    The setpoints are the robot states after every sampling period of
+    Simulation: the samples of a constant velocity move per command, where
+    samples outside the workspace hold the previous position, and one more
+    period holding the end of the command. The setpoints are written
+    chunk_size commands at a time. Returns the number of setpoints.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                              (len(points), ))
+    robot = ParallelRobot(*robot_configuration)
+    initial_joint_position, position, _ = robot.get_state()
+
+    commands = np.zeros(len(points), dtype=COMMAND_DTYPE)
+    number_of_setpoints = 0
+    with open(path, 'wb') as job_file:
+        job_file.seek(_setpoints_offset(len(points)))
+        for start in range(0, len(points), chunk_size):
+            end = min(start + chunk_size, len(points))
+            trajectories = []
+            for index in range(start, end):
+                trajectory = constant_velocity(position, points[index],
+                                               max_velocity, sampling_time)
+                inside = robot.in_workspace_batch(trajectory)
+                if not inside.all():
+                    # Index of the last accepted position, 0 for the start
+                    held = np.maximum.accumulate(
+                        np.where(inside, np.arange(1,
+                                                   len(trajectory) + 1), 0))
+                    trajectory = np.concatenate(
+                        (position[None], trajectory))[held]
+                trajectory = np.concatenate((trajectory, trajectory[-1:]))
+                position = trajectory[-1]
+                commands[index] = (number_of_setpoints, len(trajectory),
+                                   np.count_nonzero(~inside))
+                number_of_setpoints += len(trajectory)
+                trajectories.append(trajectory)
+
+            cartesian_positions = np.concatenate(trajectories)
+            setpoints = np.zeros(len(cartesian_positions),
+                                 dtype=SETPOINT_DTYPE)
+            setpoints['cartesian_position'] = cartesian_positions
+            setpoints['joint_position'] = robot.inverse_kinematics_batch(
+                cartesian_positions)
+            setpoints['drawing'] = np.repeat(
+                drawing[start:end], commands['number_of_setpoints'][start:end])
+            setpoints.tofile(job_file)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = COMPILED_JOB_MAGIC
+        header['version'] = COMPILED_JOB_VERSION
+        header['configuration_hash'] = configuration_hash(
+            robot_configuration).encode()
+        header['sampling_time'] = sampling_time
+        header['max_velocity'] = max_velocity
+        header['number_of_commands'] = len(points)
+        header['number_of_setpoints'] = number_of_setpoints
+        header['initial_joint_position'] = initial_joint_position
+        header['initial_cartesian_position'] = robot.forward_kinematics(
+            initial_joint_position)
+        job_file.seek(0)
+        header.tofile(job_file)
+        job_file.seek(HEADER_SIZE)
+        commands.tofile(job_file)
+    return number_of_setpoints
+
+
+class CompiledJob:
+    """Compiled job file, read through memory maps.
+
+    The setpoints are SETPOINT_DTYPE rows paged in from the file as they
+    are replayed. The command table holds the first setpoint of every
+    command, so seeking to a command is a single lookup. With a
+    robot_configuration, raises ValueError if the job was compiled for
+    another robot.
+    """
+
+    def __init__(self, path, robot_configuration=None):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header['magic'][0] != COMPILED_JOB_MAGIC:
+            raise ValueError(f"{path} is not a compiled job.")
+        if header['version'][0] != COMPILED_JOB_VERSION:
+            raise ValueError(f"{path} has compiled job version "
+                             f"{header['version'][0]}, expected "
+                             f"{COMPILED_JOB_VERSION}.")
+        self._path = path
+        self._header = header[0]
+        if robot_configuration is not None:
+            self.check_configuration(robot_configuration)
+
+        number_of_commands = int(self._header['number_of_commands'])
+        number_of_setpoints = int(self._header['number_of_setpoints'])
+        # Empty parts of the file cannot be mapped
+        self._commands = np.empty(0, dtype=COMMAND_DTYPE)
+        self._setpoints = np.empty(0, dtype=SETPOINT_DTYPE)
+        if number_of_commands:
+            self._commands = np.memmap(path,
+                                       dtype=COMMAND_DTYPE,
+                                       mode='r',
+                                       offset=HEADER_SIZE,
+                                       shape=(number_of_commands, ))
+        if number_of_setpoints:
+            self._setpoints = np.memmap(
+                path,
+                dtype=SETPOINT_DTYPE,
+                mode='r',
+                offset=_setpoints_offset(number_of_commands),
+                shape=(number_of_setpoints, ))
+
+    def check_configuration(self, robot_configuration):
+        """Raises ValueError if the job is for another robot configuration."""
+        if (self._header['configuration_hash'].decode() !=
+                configuration_hash(robot_configuration)):
+            raise ValueError(f"{self._path} was compiled for another robot "
+                             "configuration.")
+
+    def get_sampling_time(self):
+        return float(self._header['sampling_time'])
+
+    def get_max_velocity(self):
+        return float(self._header['max_velocity'])
+
+    def get_number_of_commands(self):
+        return len(self._commands)
+
+    def get_number_of_setpoints(self):
+        return len(self._setpoints)
+
+    def get_commands(self):
+        """Returns the COMMAND_DTYPE table of the commands."""
+        return self._commands
+
+    def get_first_setpoint(self, command_index):
+        """Returns the index of the first setpoint of a command."""
+        if command_index == len(self._commands):
+            return len(self._setpoints)
+        return int(self._commands[command_index]['first_setpoint'])
+
+    def get_setpoints(self, start_command=0):
+        """Returns the setpoints from start_command to the end of the job."""
+        return self._setpoints[self.get_first_setpoint(start_command):]
+
+    def get_command_setpoints(self, command_index):
+        """Returns the setpoints of a single command."""
+        command = self._commands[command_index]
+        first = int(command['first_setpoint'])
+        return self._setpoints[first:first + command['number_of_setpoints']]
+
+    def get_command_index(self, setpoint_index):
+        """Returns the command of a setpoint."""
+        return int(
+            np.searchsorted(self._commands['first_setpoint'],
+                            setpoint_index,
+                            side='right')) - 1
+
+    def get_start_position(self, command_index):
+        """Returns the joint and cartesian positions a command starts from."""
+        first = self.get_first_setpoint(command_index)
+        if first == 0:
+            return (self._header['initial_joint_position'].copy(),
+                    self._header['initial_cartesian_position'].copy())
+        setpoint = self._setpoints[first - 1]
+        return (setpoint['joint_position'].copy(),
+                setpoint['cartesian_position'].copy())
+
@@ -0,0 +1,243 @@
+import threading
+import numpy as np
+
+from .robot import forward_kinematics, inverse_kinematics, in_workspace
+from .simulation import SAMPLING_TIME
+from .tools import (TelemetrySharer, CommandSharer, TimeManager,
+                    VirtualTimeManager, CommandResult)
+from .trajectories import constant_velocity_parameters
+
+
+class FleetSimulation:
+    """Simulates many parallel robots in a single loop.
+
+    The configurations and states of all the robots are kept as arrays with
+    one row per robot, and every tick advances the trajectories, inverse
+    kinematics and workspace checks of all the moving robots at once. Each
+    robot keeps its own command queue and telemetry sharer, and executes
+    exactly the same samples as a single robot Simulation with the default
+    python kinematics backend (the numba one may differ in the last bit).
+    """
+
+    def __init__(self,
+                 robot_configurations,
+                 real_time=True,
+                 history_capacity=10000,
+                 pacing='sleep'):
+        number_of_robots = len(robot_configurations)
+        self._number_of_robots = number_of_robots
+
+        # Configurations
+        self._motor_distances = np.array(
+            [c.motor_distance for c in robot_configurations], dtype=np.float64)
+        self._base_arm_lengths = np.array(
+            [c.base_arm_length for c in robot_configurations],
+            dtype=np.float64)
+        self._link_arm_lengths = np.array(
+            [c.link_arm_length for c in robot_configurations],
+            dtype=np.float64)
+        self._tcp_offsets = np.array(
+            [c.tcp_offset for c in robot_configurations], dtype=np.float64)
+
+        # States
+        self._joint_positions = np.array(
+            [c.initial_joint_position for c in robot_configurations],
+            dtype=np.float64).reshape(number_of_robots, 2)
+        self._cartesian_positions = forward_kinematics(
+            self._joint_positions, self._motor_distances,
+            self._base_arm_lengths, self._link_arm_lengths,
+            self._tcp_offsets)
+        self._drawings = np.zeros(number_of_robots, dtype=bool)
+
+        # Current constant velocity segment of every robot
+        self._initial_positions = np.zeros((number_of_robots, 2))
+        self._final_positions = np.zeros((number_of_robots, 2))
+        self._velocities = np.zeros((number_of_robots, 2))
+        self._counters = np.zeros(number_of_robots, dtype=np.int64)
+        self._trajectory_lengths = np.zeros(number_of_robots, dtype=np.int64)
+        self._number_of_samples = 0
+
+        # Commands are numbered from 0 per robot in the order they are
+        # taken, and the telemetry holds the command that reached the state
+        self._number_of_taken_commands = np.zeros(number_of_robots,
+                                                  dtype=np.int64)
+        self._command_indices = np.full(number_of_robots, -1, dtype=np.int64)
+
+        # Statistics of the command every robot is executing
+        self._start_times = np.zeros(number_of_robots)
+        self._number_of_rejected_samples = np.zeros(number_of_robots,
+                                                    dtype=np.int64)
+
+        self._telemetry_sharers = [
+            TelemetrySharer(history_capacity) for _ in range(number_of_robots)
+        ]
+        self._command_sharers = [
+            CommandSharer() for _ in range(number_of_robots)
+        ]
+
+        self._real_time = real_time
+        self._pacing = pacing
+        if real_time:
+            self._time_manager = TimeManager(SAMPLING_TIME, pacing)
+        else:
+            self._time_manager = VirtualTimeManager(SAMPLING_TIME)
+        self._stop_event = threading.Event()
+        self._simulation_thread = None
+
+    def get_number_of_robots(self):
+        return self._number_of_robots
+
+    def add_command(self, robot_index, command):
+        return self._command_sharers[robot_index].add_command(command)
+
+    def submit_command(self, robot_index, command, block=True, timeout=None):
+        return self._command_sharers[robot_index].submit_command(
+            command, block=block, timeout=timeout)
+
+    def add_commands(self, robot_index, points, drawing, block=True,
+                     timeout=None):
+        return self._command_sharers[robot_index].add_commands(
+            points, drawing, block=block, timeout=timeout)
+
+    def get_command_sharer(self, robot_index):
+        return self._command_sharers[robot_index]
+
+    def get_telemetry_sharer(self, robot_index):
+        return self._telemetry_sharers[robot_index]
+
+    def get_telemetry(self, robot_index):
+        return self._telemetry_sharers[robot_index].get_telemetry()
+
+    def get_telemetry_since(self, robot_index, sequence):
+        return self._telemetry_sharers[robot_index].get_telemetry_since(
+            sequence)
+
+    def is_idle(self):
+        """True when no robot has a trajectory running or a command queued."""
+        return all(command_sharer.get_number_of_unfinished_commands() == 0
+                   for command_sharer in self._command_sharers)
+
+    def _take_commands(self, timestamp):
+        for i in np.flatnonzero(self._counters == 0):
+            command = self._command_sharers[i].get_command()
+            if command is None:
+                continue
+            initial_position = self._cartesian_positions[i].copy()
+            final_position = np.asarray(command.cartesian_position,
+                                        dtype=np.float64)
+            velocity, trajectory_length = constant_velocity_parameters(
+                initial_position, final_position, 0.2, SAMPLING_TIME)
+            self._initial_positions[i] = initial_position
+            self._final_positions[i] = final_position
+            self._velocities[i] = velocity
+            self._trajectory_lengths[i] = trajectory_length
+            self._drawings[i] = command.drawing
+            self._command_indices[i] = self._number_of_taken_commands[i]
+            self._number_of_taken_commands[i] += 1
+            self._start_times[i] = timestamp
+            self._number_of_rejected_samples[i] = 0
+
+    def step(self):
+        """Runs a single sampling period of every robot."""
+        timestamp = self._number_of_samples * SAMPLING_TIME
+        # The last sample was executed in the previous period
+        finish_time = (self._number_of_samples - 1) * SAMPLING_TIME
+        for i, telemetry_sharer in enumerate(self._telemetry_sharers):
+            telemetry_sharer.publish(self._joint_positions[i],
+                                     self._cartesian_positions[i],
+                                     self._drawings[i], timestamp,
+                                     self._command_indices[i])
+        self._number_of_samples += 1
+
+        self._take_commands(timestamp)
+
+        moving = self._counters < self._trajectory_lengths
+        for i in np.flatnonzero(~moving & (self._trajectory_lengths > 0)):
+            trajectory_length = int(self._trajectory_lengths[i])
+            self._command_sharers[i].task_done(
+                CommandResult(float(self._start_times[i]), finish_time,
+                              trajectory_length,
+                              int(self._number_of_rejected_samples[i])))
+        self._counters[~moving] = 0
+        self._trajectory_lengths[~moving] = 0
+
+        robots = np.flatnonzero(moving)
+        if len(robots) == 0:
+            return
+
+        # Sample counter of every moving robot's constant velocity segment
+        counters = self._counters[robots]
+        t = (counters + 1) * SAMPLING_TIME
+        targets = self._initial_positions[robots] + \
+            self._velocities[robots] * t[:, None]
+        last = counters == self._trajectory_lengths[robots] - 1
+        targets[last] = self._final_positions[robots[last]]
+
+        reachable = in_workspace(targets, self._motor_distances[robots],
+                                 self._base_arm_lengths[robots],
+                                 self._link_arm_lengths[robots],
+                                 self._tcp_offsets[robots])
+        self._number_of_rejected_samples[robots[~reachable]] += 1
+        robots_in_workspace = robots[reachable]
+        targets = targets[reachable]
+        self._cartesian_positions[robots_in_workspace] = targets
+        self._joint_positions[robots_in_workspace] = inverse_kinematics(
+            targets, self._motor_distances[robots_in_workspace],
+            self._base_arm_lengths[robots_in_workspace],
+            self._link_arm_lengths[robots_in_workspace],
+            self._tcp_offsets[robots_in_workspace])
+
+        self._counters[robots] += 1
+
+    def run(self, stop_event, time_manager):
+        try:
+            while not stop_event.is_set():
+                self.step()
+                time_manager.adaptive_sleep()
+
+        except Exception as e:
+            print(f"Exception {e}. Stopping fleet simulation.")
+            stop_event.set()
+
+    def start(self):
+        if not self._real_time:
+            return
+
+        self._time_manager = TimeManager(SAMPLING_TIME, self._pacing)
+        self._simulation_thread = threading.Thread(
+            target=self.run,
+            daemon=True,
+            args=(
+                self._stop_event,
+                self._time_manager,
+            ))
+        self._simulation_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._simulation_thread:
+            self._simulation_thread.join()
+
+    def run_until_idle(self):
+        """Returns once every robot has finished its queued commands.
+
+        On the virtual clock the sampling periods are run in the calling
+        thread as fast as possible.
+        """
+        if not self._real_time:
+            while not self._stop_event.is_set() and not self.is_idle():
+                self.step()
+                self._time_manager.adaptive_sleep()
+            return
+        # Waits on the queue of every robot in turn, with a timeout to see
+        # the stop event
+        while not self._stop_event.is_set() and not self.is_idle():
+            for command_sharer in self._command_sharers:
+                if not command_sharer.wait_until_finished(0.1):
+                    break
+
+    def get_time(self):
+        return self._time_manager.get_time()
+
+    def get_loop_statistics(self):
+        return self._time_manager.get_statistics()
@@ -0,0 +1,318 @@
+import itertools
+import numpy as np
+from dataclasses import dataclass
+
+from .simulation import SAMPLING_TIME
+from .trajectories import constant_velocity_number_of_samples
+
+# One row per command: x, y and 'true' when drawing
+CSV_DTYPE = np.dtype([('x', np.float64), ('y', np.float64),
+                      ('drawing', 'U5')])
+
+
+def read_csv_chunks(csv_file_path, chunk_size=65536):
+    """Yields the (points, drawing) arrays of a CSV job in chunks.
+
+    Only chunk_size rows of the file are held in memory at a time.
+    """
+    with open(csv_file_path) as csv_file:
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_size))
+            if not lines:
+                return
+            rows = np.loadtxt(lines, delimiter=',', dtype=CSV_DTYPE, ndmin=1)
+            points = np.column_stack((rows['x'], rows['y']))
+            yield points, rows['drawing'] == 'true'
+
+
+def load_csv_job(csv_file_path, chunk_size=65536):
+    """Returns the (N, 2) points and N drawing flags of a CSV job."""
+    chunks = list(read_csv_chunks(csv_file_path, chunk_size))
+    if not chunks:
+        return np.empty((0, 2)), np.empty(0, dtype=bool)
+    points, drawing = zip(*chunks)
+    return np.concatenate(points), np.concatenate(drawing)
+
+
+def feed_job(chunks, robot_simulation, transform=None):
+    """Enqueues (points, drawing) chunks, e.g. from read_csv_chunks.
+
+    transform, if given, maps every chunk of points before it is enqueued.
+    With a bounded command queue each chunk waits for space, so a job of
+    any length is fed with bounded memory. Returns the number of commands.
+    """
+    number_of_commands = 0
+    for points, drawing in chunks:
+        if transform is not None:
+            points = transform(points)
+        number_of_commands += robot_simulation.add_commands(points, drawing)
+    return number_of_commands
+
+
+@dataclass
+class JobOptimization:
+    number_of_commands_before: int
+    number_of_commands_after: int
+    execution_time_before: float
+    execution_time_after: float
+
+
+def estimate_execution_time(points,
+                            initial_position,
+                            max_velocity=0.2,
+                            sampling_time=SAMPLING_TIME):
+    """Returns the time the simulation takes to execute the commands.
+
+    Every command takes its constant velocity samples plus the period in
+    which it is marked as finished.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return 0.0
+    previous_points = np.concatenate(
+        (np.asarray(initial_position, dtype=np.float64)[None], points[:-1]))
+    number_of_samples = constant_velocity_number_of_samples(
+        previous_points, points, max_velocity, sampling_time)
+    return float((number_of_samples + 1).sum() * sampling_time)
+
+
+def remove_zero_length_moves(points, drawing):
+    """Drops the commands to the position the previous one already reached."""
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    return points[keep], drawing[keep]
+
+
+def merge_collinear_moves(points, drawing, tolerance=1e-6):
+    """Merges consecutive drawing moves along the same line.
+
+    A run of drawing points is dropped when all of them lie within
+    tolerance of the segment joining the points around the run, in order,
+    so the drawn path moves by at most tolerance.
+    """
+    number_of_points = len(points)
+    if number_of_points < 3:
+        return points, drawing
+
+    # Points between two drawing moves that are locally collinear
+    previous_points, points_, next_points = (points[:-2], points[1:-1],
+                                             points[2:])
+    candidates = np.zeros(number_of_points, dtype=bool)
+    candidates[1:-1] = (drawing[1:-1] & drawing[2:] & _on_segment(
+        points_, previous_points, next_points, tolerance))
+
+    # Runs of candidates, checked against the segment joining their anchors
+    edges = np.diff(candidates.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    if len(run_starts) == 0:
+        return points, drawing
+    run_lengths = run_ends - run_starts
+    runs = np.repeat(np.arange(len(run_starts)), run_lengths)
+    indices = np.flatnonzero(candidates)
+    starts = points[run_starts - 1][runs]
+    ends = points[run_ends][runs]
+    directions = ends - starts
+    squared_lengths = np.maximum(np.sum(directions**2, axis=1),
+                                 np.finfo(np.float64).tiny)
+    projections = np.sum((points[indices] - starts) * directions,
+                         axis=1) / squared_lengths
+    valid = _on_segment(points[indices], starts, ends, tolerance)
+    # Moving backwards along the line would change the drawn path
+    backwards = np.zeros(len(indices), dtype=bool)
+    backwards[1:] = (np.diff(projections) < 0) & (runs[1:] == runs[:-1])
+    run_valid = np.logical_and.reduceat(valid & ~backwards,
+                                        np.cumsum(run_lengths) -
+                                        run_lengths)
+
+    keep = np.ones(number_of_points, dtype=bool)
+    keep[indices[run_valid[runs]]] = False
+    return points[keep], drawing[keep]
+
+
+def _on_segment(points, starts, ends, tolerance):
+    # True for the points within tolerance of the start to end segments
+    directions = ends - starts
+    squared_lengths = np.sum(directions**2, axis=1)
+    t = np.sum((points - starts) * directions, axis=1) / np.maximum(
+        squared_lengths, np.finfo(np.float64).tiny)
+    closest = starts + np.clip(t, 0.0, 1.0)[:, None] * directions
+    return ((np.sum((points - closest)**2, axis=1) <= tolerance**2) &
+            (t >= 0.0) & (t <= 1.0))
+
+
+def _chebyshev(a, b):
+    # Moves take a time proportional to their largest axis increment
+    return np.abs(a - b).max(axis=-1)
+
+
+def _nearest_neighbour_tour(entries, exits, start):
+    """Returns the stroke order and reversal flags of a greedy tour."""
+    # SciPy is only imported by the job optimizer
+    from scipy.spatial import cKDTree
+
+    number_of_strokes = len(entries)
+    endpoints = np.concatenate((entries, exits))
+    remaining = np.arange(2 * number_of_strokes)
+    tree = cKDTree(endpoints)
+    visited = np.zeros(number_of_strokes, dtype=bool)
+    order = np.empty(number_of_strokes, dtype=np.int64)
+    reversed_ = np.empty(number_of_strokes, dtype=bool)
+    position = start
+    for step in range(number_of_strokes):
+        # Rebuild the tree without the visited strokes once it is mostly them
+        if 2 * (number_of_strokes - step) < len(remaining) // 2:
+            remaining = remaining[~visited[remaining % number_of_strokes]]
+            tree = cKDTree(endpoints[remaining])
+        k = 8
+        while True:
+            k = min(k, len(remaining))
+            _, neighbours = tree.query(position, k=k, p=np.inf)
+            neighbours = remaining[np.atleast_1d(neighbours)]
+            unvisited = neighbours[~visited[neighbours % number_of_strokes]]
+            if len(unvisited) or k == len(remaining):
+                break
+            k *= 4
+        endpoint = unvisited[0]
+        stroke = endpoint % number_of_strokes
+        visited[stroke] = True
+        order[step] = stroke
+        # Entering a stroke through its exit draws it backwards
+        reversed_[step] = endpoint >= number_of_strokes
+        position = entries[stroke] if reversed_[step] else exits[stroke]
+    return order, reversed_
+
+
+def _two_opt(entries, exits, start, window=50, max_passes=5):
+    """Improves a tour by reversing sequences of up to window strokes.
+
+    entries and exits are in tour order and are updated in place. Returns
+    the tour permutation and the reversal flags relative to the input.
+    """
+    number_of_strokes = len(entries)
+    order = np.arange(number_of_strokes)
+    reversed_ = np.zeros(number_of_strokes, dtype=bool)
+    # Positions whose neighbourhood changed since they were last checked
+    active = np.ones(number_of_strokes, dtype=bool)
+    for _ in range(max_passes):
+        if not active.any():
+            break
+        for i in np.flatnonzero(active):
+            active[i] = False
+            # Reversing strokes i to j replaces the travel into i and out of
+            # j with the travel from before i to j's exit and from i's entry
+            # to the stroke after j
+            j = np.arange(i, min(i + window, number_of_strokes))
+            before = exits[i - 1] if i > 0 else start
+            after = np.minimum(j + 1, number_of_strokes - 1)
+            has_after = j + 1 < number_of_strokes
+            deltas = (_chebyshev(before, exits[j]) - _chebyshev(
+                before, entries[i]) + np.where(
+                    has_after,
+                    _chebyshev(entries[i], entries[after]) -
+                    _chebyshev(exits[j], entries[after]), 0.0))
+            best = int(np.argmin(deltas))
+            if deltas[best] >= -1e-12:
+                continue
+            j = i + best + 1
+            entries[i:j], exits[i:j] = (exits[i:j][::-1].copy(),
+                                        entries[i:j][::-1].copy())
+            order[i:j] = order[i:j][::-1].copy()
+            reversed_[i:j] = ~reversed_[i:j][::-1]
+            active[max(i - window, 0):j + 1] = True
+    return order, reversed_
+
+
+def reorder_strokes(points, drawing, initial_position=None, window=50):
+    """Reorders the strokes of a job to shorten the pen-up travel.
+
+    A stroke is a run of drawing moves together with the pen-up move to its
+    first point. The pen-up moves between strokes are replaced by a single
+    straight move, and strokes may be drawn backwards. The order is built
+    with a nearest neighbour tour improved by windowed 2-opt. Drawing moves
+    before the first pen-up move and the last pen-up move are kept in place.
+    """
+    number_of_points = len(points)
+    edges = np.diff(drawing.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    prefix = run_ends[0] if len(run_starts) and run_starts[0] == 0 else 0
+    if prefix:
+        run_starts, run_ends = run_starts[1:], run_ends[1:]
+    if len(run_starts) < 2:
+        return points, drawing
+
+    if prefix:
+        start = points[prefix - 1]
+    elif initial_position is not None:
+        start = np.asarray(initial_position, dtype=np.float64)
+    else:
+        start = points[0]
+
+    # Stroke k is points[run_starts[k] - 1:run_ends[k]]
+    stroke_starts = points[run_starts - 1]
+    stroke_ends = points[run_ends - 1]
+    order, reversed_ = _nearest_neighbour_tour(stroke_starts, stroke_ends,
+                                               start)
+    entries = np.where(reversed_[:, None], stroke_ends[order],
+                       stroke_starts[order])
+    exits = np.where(reversed_[:, None], stroke_starts[order],
+                     stroke_ends[order])
+    two_opt_order, two_opt_reversed = _two_opt(entries, exits, start, window)
+    order = order[two_opt_order]
+    reversed_ = reversed_[two_opt_order] ^ two_opt_reversed
+
+    # Point indices of the strokes in tour order
+    lengths = (run_ends - run_starts + 1)[order]
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths)
+    indices = np.where(np.repeat(reversed_, lengths),
+                       np.repeat(run_ends[order] - 1, lengths) - offsets,
+                       np.repeat(run_starts[order] - 1, lengths) + offsets)
+    stroke_drawing = offsets != 0
+
+    # Moves before the first stroke are replaced by the move to its start
+    indices = [np.arange(prefix), indices]
+    new_drawing = [drawing[:prefix], stroke_drawing]
+    if not drawing[-1]:
+        indices.append([number_of_points - 1])
+        new_drawing.append([False])
+    return (points[np.concatenate(indices).astype(np.int64)],
+            np.concatenate(new_drawing).astype(bool))
+
+
+def optimize_job(points,
+                 drawing,
+                 initial_position=None,
+                 tolerance=1e-6,
+                 reorder=True,
+                 max_velocity=0.2,
+                 sampling_time=SAMPLING_TIME):
+    """Returns the optimized points and drawing flags of a job.
+
+    Drops zero-length moves, merges collinear drawing moves within
+    tolerance and, with reorder, reorders the strokes to shorten the pen-up
+    travel. Points are in metres, e.g. after fitting them to the robot.
+    Also returns a JobOptimization with the command counts and the
+    estimated execution times before and after.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                              (len(points), ))
+    if initial_position is None and len(points):
+        initial_position = points[0]
+    execution_time_before = estimate_execution_time(points, initial_position,
+                                                    max_velocity,
+                                                    sampling_time)
+    number_of_commands_before = len(points)
+
+    points, drawing = remove_zero_length_moves(points, drawing)
+    points, drawing = merge_collinear_moves(points, drawing, tolerance)
+    if reorder:
+        points, drawing = reorder_strokes(points, drawing, initial_position)
+
+    return points, drawing, JobOptimization(
+        number_of_commands_before, len(points), execution_time_before,
+        estimate_execution_time(points, initial_position, max_velocity,
+                                sampling_time))
+
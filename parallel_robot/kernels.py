@@ -0,0 +1,236 @@
+import importlib.util
+import math
+import os
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable
+
+# Environment variable selecting the default backend: 'numba' or 'python'
+BACKEND_VARIABLE = 'PARALLEL_ROBOT_BACKEND'
+
+# Single point kernels on floats. They follow the operations of the NumPy
+# functions of robot.py, and are compiled as they are by the Numba backend,
+# so they only use the math module and NumPy scalar functions. The arctan
+# of NumPy differs from math.atan in the last bit, so it keeps the point
+# kernels of the python backend bit-identical to the NumPy functions.
+# Square roots of negative numbers and divisions by zero give NaN and
+# infinities as in NumPy.
+
+
+def forward_kinematics_point(theta1, theta4, motor_distance, base_arm_length,
+                             link_arm_length, tcp_x, tcp_y):
+    """Returns the cartesian position of a joint position as (x, y)."""
+    la = base_arm_length
+    lb = link_arm_length
+    lc = motor_distance
+
+    cos_theta1 = math.cos(theta1)
+    cos_theta4 = math.cos(theta4)
+    sin_theta4 = math.sin(theta4)
+
+    E = 2 * lb * (lc + la * (cos_theta4 - cos_theta1))
+    F = 2 * la * lb * (sin_theta4 - math.sin(theta1))
+    G = lc * lc + 2 * la * la + 2 * lc * la * cos_theta4 - \
+        2 * lc * la * cos_theta1 - 2 * la * la * math.cos(theta4 - theta1)
+
+    # Only the negative solution of the arctan is used (elbows out)
+    discriminant = E * E + F * F - G * G
+    root = math.sqrt(discriminant) if discriminant >= 0 else math.nan
+    numerator = -F - root
+    denominator = G - E
+    if denominator != 0:
+        ratio = numerator / denominator
+    elif numerator == 0 or numerator != numerator:
+        ratio = math.nan
+    else:
+        ratio = math.copysign(math.inf, numerator) * math.copysign(
+            1.0, denominator)
+    negative_arctan = 2 * float(np.arctan(ratio))
+
+    return (lc + la * cos_theta4 + lb * math.cos(negative_arctan) + tcp_x,
+            la * sin_theta4 + lb * math.sin(negative_arctan) + tcp_y)
+
+
+def inverse_kinematics_point(x, y, motor_distance, base_arm_length,
+                             link_arm_length, tcp_x, tcp_y):
+    """Returns the joint position of a cartesian position as (θ1, θ4)."""
+    la = base_arm_length
+    lb = link_arm_length
+    lc = motor_distance
+
+    x = x - tcp_x
+    y = y - tcp_y
+
+    E1 = -2 * la * x
+    F1 = -2 * la * y
+    G1 = la * la - lb * lb + x * x + y * y
+
+    E4 = 2 * la * (-x + lc)
+    F4 = -2 * la * y
+    G4 = lc * lc + la * la - lb * lb + x * x + y * y - 2 * lc * x
+
+    # Positive solution for θ1 and negative solution for θ4
+    discriminant = E1 * E1 + F1 * F1 - G1 * G1
+    root = math.sqrt(discriminant) if discriminant >= 0 else math.nan
+    numerator = -F1 + root
+    denominator = G1 - E1
+    if denominator != 0:
+        ratio = numerator / denominator
+    elif numerator == 0 or numerator != numerator:
+        ratio = math.nan
+    else:
+        ratio = math.copysign(math.inf, numerator) * math.copysign(
+            1.0, denominator)
+    theta1 = 2 * float(np.arctan(ratio))
+
+    discriminant = E4 * E4 + F4 * F4 - G4 * G4
+    root = math.sqrt(discriminant) if discriminant >= 0 else math.nan
+    numerator = -F4 - root
+    denominator = G4 - E4
+    if denominator != 0:
+        ratio = numerator / denominator
+    elif numerator == 0 or numerator != numerator:
+        ratio = math.nan
+    else:
+        ratio = math.copysign(math.inf, numerator) * math.copysign(
+            1.0, denominator)
+    theta4 = 2 * float(np.arctan(ratio))
+    return theta1, theta4
+
+
+def in_workspace_point(x, y, motor_distance, base_arm_length,
+                       link_arm_length, tcp_x, tcp_y):
+    """True if the cartesian position is inside the workspace."""
+    x = x - tcp_x
+    y = y - tcp_y
+
+    # Squares as products, which NumPy and Python round the same way
+    arm_difference = base_arm_length - link_arm_length
+    arm_sum = base_arm_length + link_arm_length
+    inner_radius = arm_difference * arm_difference
+    outer_radius = arm_sum * arm_sum
+    x_2 = x - motor_distance
+    distance_1 = x * x + y * y
+    distance_2 = x_2 * x_2 + y * y
+
+    return (distance_1 >= inner_radius and distance_2 >= inner_radius and
+            distance_1 <= outer_radius and distance_2 <= outer_radius)
+
+
+@dataclass(frozen=True)
+class KinematicsBackend:
+    """Kinematics kernels of a backend.
+
+    The point kernels take two floats and return a tuple. The batch kernels
+    take (N, 2) positions and return an (N, 2) array or an N mask. All of
+    them take the robot parameters as motor_distance, base_arm_length,
+    link_arm_length, tcp_x and tcp_y.
+    """
+    name: str
+    forward_kinematics_point: Callable
+    inverse_kinematics_point: Callable
+    in_workspace_point: Callable
+    forward_kinematics_batch: Callable
+    inverse_kinematics_batch: Callable
+    in_workspace_batch: Callable
+
+
+def _python_backend():
+    # NumPy for the batches, plain floats for the points
+    from . import robot
+
+    def forward_kinematics_batch(joint_positions, motor_distance,
+                                 base_arm_length, link_arm_length, tcp_x,
+                                 tcp_y):
+        return robot.forward_kinematics(joint_positions, motor_distance,
+                                        base_arm_length, link_arm_length,
+                                        np.array([tcp_x, tcp_y]))
+
+    def inverse_kinematics_batch(cartesian_positions, motor_distance,
+                                 base_arm_length, link_arm_length, tcp_x,
+                                 tcp_y):
+        return robot.inverse_kinematics(cartesian_positions, motor_distance,
+                                        base_arm_length, link_arm_length,
+                                        np.array([tcp_x, tcp_y]))
+
+    def in_workspace_batch(cartesian_positions, motor_distance,
+                           base_arm_length, link_arm_length, tcp_x, tcp_y):
+        return robot.in_workspace(cartesian_positions, motor_distance,
+                                  base_arm_length, link_arm_length,
+                                  np.array([tcp_x, tcp_y]))
+
+    return KinematicsBackend('python', forward_kinematics_point,
+                             inverse_kinematics_point, in_workspace_point,
+                             forward_kinematics_batch,
+                             inverse_kinematics_batch, in_workspace_batch)
+
+
+def _numba_backend():
+    if importlib.util.find_spec('numba') is None:
+        raise ImportError("The numba backend needs Numba.")
+    from .numba_kernels import (forward_kinematics_loop,
+                                forward_kinematics_point,
+                                in_workspace_loop, in_workspace_point,
+                                inverse_kinematics_loop,
+                                inverse_kinematics_point)
+
+    def batch(loop):
+        # A single array layout, so every kernel is compiled once
+
+        def kernel(positions, *parameters):
+            return loop(
+                np.ascontiguousarray(positions, dtype=np.float64),
+                *[float(parameter) for parameter in parameters])
+
+        return kernel
+
+    backend = KinematicsBackend('numba', forward_kinematics_point,
+                                inverse_kinematics_point, in_workspace_point,
+                                batch(forward_kinematics_loop),
+                                batch(inverse_kinematics_loop),
+                                batch(in_workspace_loop))
+    # Compiles, or loads from the cache, now rather than in the first tick
+    _warm_up(backend)
+    return backend
+
+
+def _warm_up(backend):
+    parameters = (0.08, 0.08, 0.12, 0.0, 0.0)
+    joint_position = backend.inverse_kinematics_point(0.04, 0.12, *parameters)
+    backend.forward_kinematics_point(*joint_position, *parameters)
+    backend.in_workspace_point(0.04, 0.12, *parameters)
+    points = np.array([[0.04, 0.12]])
+    backend.forward_kinematics_batch(
+        backend.inverse_kinematics_batch(points, *parameters), *parameters)
+    backend.in_workspace_batch(points, *parameters)
+
+
+_BACKEND_FACTORIES = {'numba': _numba_backend, 'python': _python_backend}
+_backends = {}
+
+
+def get_available_backends():
+    """Returns the names of the backends that can be used."""
+    return [
+        name for name in _BACKEND_FACTORIES
+        if name != 'numba' or importlib.util.find_spec('numba') is not None
+    ]
+
+
+def get_backend(name=None):
+    """Returns the KinematicsBackend of that name.
+
+    By default, the backend named by the PARALLEL_ROBOT_BACKEND environment
+    variable, else python, whose results are bit-identical to the NumPy
+    functions of robot.py. numba is faster per point but its libm may
+    differ in the last bit, so it is opt-in. Backends are created once.
+    """
+    if name is None:
+        name = os.environ.get(BACKEND_VARIABLE, 'python')
+    if name not in _BACKEND_FACTORIES:
+        raise ValueError(f"Unknown kinematics backend {name!r}, expected "
+                         f"one of {', '.join(_BACKEND_FACTORIES)}.")
+    if name not in _backends:
+        _backends[name] = _BACKEND_FACTORIES[name]()
+    return _backends[name]
+
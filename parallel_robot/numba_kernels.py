@@ -0,0 +1,49 @@
+import numba
+import numpy as np
+
+from . import kernels
+
+# The point kernels of kernels.py and loops over them, compiled on first
+# use and cached next to the module
+jit = numba.njit(cache=True)
+forward_kinematics_point = jit(kernels.forward_kinematics_point)
+inverse_kinematics_point = jit(kernels.inverse_kinematics_point)
+in_workspace_point = jit(kernels.in_workspace_point)
+
+
+@jit
+def forward_kinematics_loop(joint_positions, motor_distance, base_arm_length,
+                            link_arm_length, tcp_x, tcp_y):
+    cartesian_positions = np.empty_like(joint_positions)
+    for i in range(len(joint_positions)):
+        cartesian_positions[i, 0], cartesian_positions[i, 1] = \
+            forward_kinematics_point(joint_positions[i, 0],
+                                     joint_positions[i, 1], motor_distance,
+                                     base_arm_length, link_arm_length, tcp_x,
+                                     tcp_y)
+    return cartesian_positions
+
+
+@jit
+def inverse_kinematics_loop(cartesian_positions, motor_distance,
+                            base_arm_length, link_arm_length, tcp_x, tcp_y):
+    joint_positions = np.empty_like(cartesian_positions)
+    for i in range(len(cartesian_positions)):
+        joint_positions[i, 0], joint_positions[i, 1] = \
+            inverse_kinematics_point(cartesian_positions[i, 0],
+                                     cartesian_positions[i, 1],
+                                     motor_distance, base_arm_length,
+                                     link_arm_length, tcp_x, tcp_y)
+    return joint_positions
+
+
+@jit
+def in_workspace_loop(cartesian_positions, motor_distance, base_arm_length,
+                      link_arm_length, tcp_x, tcp_y):
+    inside = np.empty(len(cartesian_positions), dtype=np.bool_)
+    for i in range(len(cartesian_positions)):
+        inside[i] = in_workspace_point(cartesian_positions[i, 0],
+                                       cartesian_positions[i, 1],
+                                       motor_distance, base_arm_length,
+                                       link_arm_length, tcp_x, tcp_y)
+    return inside
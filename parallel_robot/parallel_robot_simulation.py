@@ -1,14 +1,28 @@
-from .simulation import simulation
-from .visualization import Visualization
-from .tools import TelemetrySharer, CommandSharer, RobotConfiguration
+from .simulation import Simulation, SAMPLING_TIME, PROFILING_STAGES
+from .visualization_backends import (VisualizationBackend,
+                                     get_visualization_backend)
+from .tools import (TelemetrySharer, CommandSharer, RobotConfiguration,
+                    TimeManager, VirtualTimeManager, PeriodStatistics,
+                    StageProfiler, Command, format_stage_statistics)
+from .robot import ParallelRobot
 
 import threading
 import numpy as np
-import signal
-import sys
-from time import sleep
+
 
 class ParallelRobotSimulation:
+    """Simulation of a parallel robot with an optional visualization.
+
+    visualization is the name of a visualization backend ('pygame', 'null'
+    or 'recorder'), a VisualizationBackend subclass, True for 'pygame' or
+    False for none. Backends are imported when used, with the keyword
+    arguments in visualization_options. Signals are left to the caller:
+    call stop(), e.g. on KeyboardInterrupt, to stop the threads.
+
+    validation is None, or the policy of validate_commands ('reject' or
+    'clip') applied to the commands when they are enqueued, with the
+    singularity margin max_condition_number.
+    """
 
     def __init__(self,
                  motor_distance: float,
@@ -17,7 +31,18 @@ class ParallelRobotSimulation:
                  tcp_offset: np.ndarray = np.array([0.0, 0.0]),
                  initial_joint_position: np.ndarray = np.array(
                      [np.pi / 2, np.pi / 2]),
-                 visualization=True):
+                 visualization=True,
+                 real_time=True,
+                 process=False,
+                 history_capacity=10000,
+                 command_capacity=None,
+                 simulation_pacing='sleep',
+                 visualization_pacing='sleep',
+                 visualization_frame_rate=60.0,
+                 motion_limits=None,
+                 visualization_options=None,
+                 validation=None,
+                 max_condition_number=20.0):
 
         self._robot_configuration = RobotConfiguration(motor_distance,
                                                        base_arm_length,
@@ -25,27 +50,118 @@ class ParallelRobotSimulation:
                                                        tcp_offset,
                                                        initial_joint_position)
 
-        self._telemetry_sharer = TelemetrySharer()
-        self._command_sharer = CommandSharer()
+        if process and not real_time:
+            raise ValueError(
+                "The process backend only runs on the real-time clock.")
+        if validation is not None:
+            from .validation import VALIDATION_POLICIES
+
+            if validation not in VALIDATION_POLICIES:
+                raise ValueError(f"Unknown validation policy {validation!r}, "
+                                 f"expected one of "
+                                 f"{', '.join(VALIDATION_POLICIES)}.")
+
+        # With process=True the simulation runs in a child process and the
+        # sharers are placed in shared memory (bounded command queue)
+        if process and command_capacity is None:
+            command_capacity = 2**18
+        self._process = process
+        self._history_capacity = history_capacity
+        self._command_capacity = command_capacity
+        self._simulation_pacing = simulation_pacing
+        # None keeps the constant velocity moves, a MotionLimits enables the
+        # look-ahead planner
+        self._motion_limits = motion_limits
+        self._telemetry_memory = None
+        self._command_memory = None
+        self._statistics_memory = None
+        self._simulation_statistics = None
+        if process:
+            import multiprocessing
+            from multiprocessing import shared_memory
+            from .process_backend import SharedMemoryCommandSharer
+
+            self._telemetry_memory = shared_memory.SharedMemory(
+                create=True,
+                size=TelemetrySharer.get_buffer_size(history_capacity))
+            self._command_memory = shared_memory.SharedMemory(
+                create=True,
+                size=SharedMemoryCommandSharer.get_buffer_size(
+                    command_capacity))
+            self._telemetry_sharer = TelemetrySharer(
+                history_capacity, self._telemetry_memory.buf)
+            self._command_sharer = SharedMemoryCommandSharer(
+                command_capacity, self._command_memory.buf)
+            # Period statistics followed by the stage profiler
+            self._statistics_memory = shared_memory.SharedMemory(
+                create=True,
+                size=PeriodStatistics.get_buffer_size() +
+                StageProfiler.get_buffer_size(len(PROFILING_STAGES)))
+            self._simulation_statistics = PeriodStatistics(
+                4 * SAMPLING_TIME, buffer=self._statistics_memory.buf)
+            self._profiler = StageProfiler(
+                PROFILING_STAGES, self._statistics_memory.buf[
+                    PeriodStatistics.get_buffer_size():])
+            self._stop_event = multiprocessing.Event()
+        else:
+            self._telemetry_sharer = TelemetrySharer(history_capacity)
+            self._command_sharer = CommandSharer(command_capacity)
+            self._profiler = StageProfiler(PROFILING_STAGES)
+            self._stop_event = threading.Event()
+
+        # With real_time=False the simulation runs on a virtual clock, driven
+        # from the caller's thread by run_until_idle()
+        self._real_time = real_time
+        self._simulation = None
+        if not process:
+            self._simulation = Simulation(self._telemetry_sharer,
+                                          self._command_sharer,
+                                          self._robot_configuration,
+                                          motion_limits, self._profiler)
+        if real_time:
+            self._time_manager = TimeManager(SAMPLING_TIME, simulation_pacing)
+        else:
+            self._time_manager = VirtualTimeManager(SAMPLING_TIME)
+
+        self._validation = validation
+        self._max_condition_number = max_condition_number
+        # Target of the last enqueued command, where the next move starts,
+        # and the commands rejected or clipped so far
+        self._validation_lock = threading.Lock()
+        self._last_target = None
+        if validation is not None:
+            self._last_target = ParallelRobot(
+                *self._robot_configuration).get_state()[1]
+        self._number_of_validated_commands = 0
+        self._invalid_commands = []
 
-        self._stop_event = threading.Event()
         self._visualization_thread = None
         self._simulation_thread = None
-
-        self._signal = signal.signal(signal.SIGINT, self._signal_handler)
+        self._stopped = False
+        self._recorder = None
+        self._server = None
+        self._profiling_dump_thread = None
+        self._profiling_dump_event = threading.Event()
 
         self._visualization = None
+        if visualization is True:
+            visualization = 'pygame'
+        if isinstance(visualization, str):
+            visualization = get_visualization_backend(visualization)
         if visualization:
-            self._visualization = Visualization(
+            if not (isinstance(visualization, type) and
+                    issubclass(visualization, VisualizationBackend)):
+                raise ValueError(f"{visualization!r} is not a visualization "
+                                 "backend.")
+            self._visualization = visualization(
                 self._stop_event,
                 self._telemetry_sharer,
                 self._robot_configuration,
+                visualization_pacing,
+                visualization_frame_rate,
+                **(visualization_options or {}),
             )
 
-    def _signal_handler(self, _sig, _frame):
-        print("Ctrl+C exiting the program.")
-        self.stop()
-
     def start(self):
         if self._visualization:
             self._visualization_thread = threading.Thread(
@@ -53,37 +169,379 @@ class ParallelRobotSimulation:
 
             self._visualization_thread.start()
 
-        self._simulation_thread = threading.Thread(
-            target=simulation,
-            daemon=True,
-            args=(
-                self._stop_event,
-                self._telemetry_sharer,
-                self._command_sharer,
-                self._robot_configuration,
-            ))
+        if not self._real_time:
+            return
+
+        self._time_manager = TimeManager(SAMPLING_TIME,
+                                         self._simulation_pacing)
+        if self._process:
+            import multiprocessing
+            from .process_backend import process_simulation
+
+            ready_event = multiprocessing.Event()
+            self._simulation_thread = multiprocessing.Process(
+                target=process_simulation,
+                daemon=True,
+                args=(
+                    self._stop_event,
+                    self._telemetry_memory.name,
+                    self._command_memory.name,
+                    self._statistics_memory.name,
+                    self._history_capacity,
+                    self._command_capacity,
+                    self._robot_configuration,
+                    self._simulation_pacing,
+                    self._motion_limits,
+                    ready_event,
+                ))
+        else:
+            self._simulation_thread = threading.Thread(
+                target=self._simulation.run,
+                daemon=True,
+                args=(
+                    self._stop_event,
+                    self._time_manager,
+                ))
 
         self._simulation_thread.start()
+        if self._process:
+            # Returns once the child runs its first period
+            while not ready_event.wait(0.1):
+                if not self._simulation_thread.is_alive():
+                    raise RuntimeError(
+                        "The simulation process exited before starting.")
 
     def stop(self):
+        """Stops the threads and releases the shared memory, once."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.disable_profiling()
+        self.stop_server()
+        self.stop_recording()
         self._stop_event.set()
 
-        if self._visualization:
+        if self._visualization_thread:
             self._visualization_thread.join()
 
-        self._simulation_thread.join()
+        if self._simulation_thread:
+            self._simulation_thread.join()
+
+        if self._process:
+            self._telemetry_memory.unlink()
+            self._command_memory.unlink()
+            self._statistics_memory.unlink()
 
-        sys.exit(0)
-    
     def wait_until_no_commands(self):
-        while self._command_sharer.get_number_of_commands() > 0:
-            sleep(0.5)
+        if not self._real_time:
+            self.run_until_idle()
+            return
+        while (not self._stop_event.is_set() and
+               not self._command_sharer.wait_until_no_commands(0.1)):
+            pass
+
+    def run_until_idle(self):
+        """Returns once the command queue is drained and the robot stopped.
+
+        On the virtual clock the sampling periods are run in the calling
+        thread as fast as possible.
+        """
+        if not self._real_time:
+            self._simulation.run_until_idle(self._stop_event,
+                                            self._time_manager)
+            return
+        while (not self._stop_event.is_set() and
+               not self._command_sharer.wait_until_finished(0.1)):
+            pass
+        # Compiled jobs do not go through the command queue
+        while (self._simulation is not None and
+               not self._simulation.is_idle() and
+               not self._stop_event.wait(0.01)):
+            pass
+
+    def get_time(self):
+        return self._time_manager.get_time()
+
+    def get_loop_statistics(self):
+        """Returns the LoopStatistics of the simulation and visualization."""
+        if self._process:
+            simulation_statistics = \
+                self._simulation_statistics.get_statistics()
+        else:
+            simulation_statistics = self._time_manager.get_statistics()
+        visualization_statistics = None
+        if self._visualization:
+            visualization_statistics = \
+                self._visualization.get_loop_statistics()
+        return {
+            'simulation': simulation_statistics,
+            'visualization': visualization_statistics,
+        }
+
+    def enable_profiling(self, dump_interval=None, dump=None):
+        """Times the stages of every simulation step from now on.
+
+        With dump_interval, dump is called with the profiling statistics
+        every dump_interval seconds from a daemon thread, by default to
+        print them.
+        """
+        self.disable_profiling()
+        self._profiler.enable()
+        if dump_interval is None:
+            return
+        if dump is None:
+
+            def dump(statistics):
+                print(format_stage_statistics(statistics))
+
+        def dump_loop():
+            while not self._profiling_dump_event.wait(dump_interval):
+                dump(self._profiler.get_statistics())
+
+        self._profiling_dump_event.clear()
+        self._profiling_dump_thread = threading.Thread(target=dump_loop,
+                                                       daemon=True)
+        self._profiling_dump_thread.start()
+
+    def disable_profiling(self):
+        self._profiler.disable()
+        if self._profiling_dump_thread is not None:
+            self._profiling_dump_event.set()
+            self._profiling_dump_thread.join()
+            self._profiling_dump_thread = None
+
+    def reset_profiling(self):
+        self._profiler.reset()
+
+    def get_profiling_statistics(self):
+        """Returns the StageStatistics of the simulation stages by name.
+
+        Durations are in seconds. The time between two stages counts in the
+        second one, and 'tick' is the whole simulation step.
+        """
+        return self._profiler.get_statistics()
 
     def add_command(self, command):
-        self._command_sharer.add_command(command)
+        """Enqueues a command without waiting, returns True if it was added.
+
+        With validation a rejected command is not added.
+        """
+        if self._validation is None:
+            return self._command_sharer.add_command(command)
+        _, added, _ = self._add_validated_commands(
+            [command.cartesian_position], [command.drawing], False, None)
+        return added == 1
+
+    def submit_command(self, command, block=True, timeout=None):
+        """Enqueues a command, returns a Future of its CommandResult.
+
+        Only available with the thread backend.
+        """
+        if self._process:
+            raise ValueError(
+                "Command futures are not available with the process backend.")
+        if self._validation is None:
+            return self._command_sharer.submit_command(command,
+                                                       block=block,
+                                                       timeout=timeout)
+        with self._validation_lock:
+            result = self._validate_commands([command.cartesian_position],
+                                             [command.drawing])
+            if not len(result.points):
+                self._record_validation(result, 1, None)
+                invalid_command = result.invalid_commands[0]
+                raise ValueError(
+                    f"Command rejected, sample {invalid_command.sample_index}"
+                    f" at {invalid_command.position} fails the "
+                    f"{invalid_command.reason} check.")
+            future = self._command_sharer.submit_command(
+                Command(result.points[0], bool(result.drawing[0]),
+                        self._last_target),
+                block=block,
+                timeout=timeout)
+            self._record_validation(result, 1, result.points[0])
+        return future
+
+    def get_executing_command_index(self):
+        """Returns the index of the command being executed, None if idle."""
+        return self._command_sharer.get_executing_command_index()
+
+    def add_commands(self, points, drawing, block=True, timeout=None):
+        """Enqueues (N, 2) points and drawing flags, returns the number added.
+
+        With a command_capacity, waits for space in the queue up to timeout
+        seconds unless block is False. With validation the invalid commands
+        are rejected or clipped, and the returned number counts the rejected
+        commands as added: it is less than N only if the queue stayed full.
+        """
+        if self._validation is None:
+            return self._command_sharer.add_commands(points,
+                                                     drawing,
+                                                     block=block,
+                                                     timeout=timeout)
+        return self._add_validated_commands(points, drawing, block,
+                                            timeout)[0]
+
+    def put_commands(self, points, drawing, block=True, timeout=None):
+        """Like add_commands, returns (number added, end index).
+
+        The added commands are finished once the number of finished commands
+        of the command sharer reaches the end index.
+        """
+        if self._validation is None:
+            return self._command_sharer.put_commands(points,
+                                                     drawing,
+                                                     block=block,
+                                                     timeout=timeout)
+        number_of_commands, _, end_index = self._add_validated_commands(
+            points, drawing, block, timeout)
+        return number_of_commands, end_index
+
+    def get_invalid_commands(self):
+        """Returns the InvalidCommand of every rejected or clipped command.
+
+        Their command_index counts all the commands passed to add_command,
+        add_commands and submit_command, rejected ones included.
+        """
+        with self._validation_lock:
+            return list(self._invalid_commands)
+
+    def _validate_commands(self, points, drawing):
+        from .validation import validate_commands
+
+        return validate_commands(self._last_target, points, drawing,
+                                 self._robot_configuration,
+                                 self._validation,
+                                 self._max_condition_number)
+
+    def _add_validated_commands(self, points, drawing, block, timeout):
+        # Returns the number of commands handled, the number enqueued and
+        # the end index of the enqueued commands
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        with self._validation_lock:
+            result = self._validate_commands(points, drawing)
+            added, end_index = self._command_sharer.put_commands(
+                result.points,
+                result.drawing,
+                block=block,
+                timeout=timeout,
+                validated_start=self._last_target)
+            if added < len(result.points):
+                # The rest is validated again when it is added
+                number_of_commands = int(result.command_indices[added])
+            else:
+                number_of_commands = len(points)
+            self._record_validation(
+                result, number_of_commands,
+                result.points[added - 1] if added else None)
+        return number_of_commands, added, end_index
+
+    def _record_validation(self, result, number_of_commands, last_target):
+        # Keeps the invalid commands among the first number_of_commands
+        # and the target the next move starts from
+        for invalid_command in result.invalid_commands:
+            if invalid_command.command_index >= number_of_commands:
+                break
+            invalid_command.command_index += \
+                self._number_of_validated_commands
+            self._invalid_commands.append(invalid_command)
+        self._number_of_validated_commands += number_of_commands
+        if last_target is not None:
+            self._last_target = last_target.copy()
+
+    def replay_job(self, compiled_job, start_command=0):
+        """Replays a CompiledJob, or the compiled job file at that path.
+
+        The job must be compiled for this robot configuration. Resumes an
+        interrupted job from start_command. Only available with the thread
+        backend, while no command is queued.
+        """
+        if self._process:
+            raise ValueError(
+                "Compiled jobs are not available with the process backend.")
+        from .compiled_job import CompiledJob
+
+        if isinstance(compiled_job, CompiledJob):
+            compiled_job.check_configuration(self._robot_configuration)
+        else:
+            compiled_job = CompiledJob(compiled_job,
+                                       self._robot_configuration)
+        self._simulation.replay(compiled_job, start_command)
+        if (self._validation is not None and
+                compiled_job.get_number_of_setpoints()):
+            # The next move starts at the end of the job
+            with self._validation_lock:
+                self._last_target = compiled_job.get_setpoints(
+                )[-1]['cartesian_position'].copy()
+
+    def get_replay_command_index(self):
+        """Returns the compiled job command being replayed, None if none."""
+        if self._process:
+            return None
+        return self._simulation.get_replay_command_index()
+
+    def start_recording(self, path, compression=None, chunk_size=4096):
+        """Records the telemetry to a log file read by TelemetryLog.
+
+        Written by a background thread, compressed with zlib if compression
+        is 'zlib'. The history_capacity must hold the samples of a poll
+        interval of the recorder.
+        """
+        from .recorder import TelemetryRecorder
+
+        self.stop_recording()
+        self._recorder = TelemetryRecorder(self._telemetry_sharer,
+                                           path,
+                                           chunk_size=chunk_size,
+                                           compression=compression)
+        self._recorder.start()
+        return self._recorder
+
+    def stop_recording(self):
+        """Completes the telemetry log, returns the number of lost samples."""
+        if self._recorder is None:
+            return 0
+        self._recorder.stop()
+        number_of_lost_samples = self._recorder.get_number_of_lost_samples()
+        self._recorder = None
+        return number_of_lost_samples
+
+    def start_server(self, path=None, host='127.0.0.1', port=0):
+        """Serves commands and telemetry to RobotClient connections.
+
+        Listens on a Unix domain socket at path, or on TCP at host and port,
+        from an event loop in a daemon thread. Returns the socket address.
+        """
+        from .server import RobotServer
+
+        self.stop_server()
+        self._server = RobotServer(self, path, host, port)
+        return self._server.start_thread()
+
+    def stop_server(self):
+        if self._server is None:
+            return
+        self._server.stop_thread()
+        self._server = None
 
     def get_telemetry(self):
         return self._telemetry_sharer.get_telemetry()
     
+    def get_telemetry_since(self, sequence):
+        """Returns (samples, last_sequence, overrun) after sequence."""
+        return self._telemetry_sharer.get_telemetry_since(sequence)
+
+    def get_command_sharer(self):
+        return self._command_sharer
+
+    def get_telemetry_sharer(self):
+        return self._telemetry_sharer
+
+    def is_real_time(self):
+        return self._real_time
+
+    def is_process(self):
+        return self._process
+
     def get_robot_configuration(self):
         return self._robot_configuration
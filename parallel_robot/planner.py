@@ -0,0 +1,346 @@
+import numpy as np
+from dataclasses import dataclass
+
+from .robot import inverse_kinematics
+
+
+@dataclass
+class MotionLimits:
+    """Limits of the look-ahead planner.
+
+    Speeds are along the path, so diagonal moves run at max_velocity too.
+    max_jerk and max_joint_velocity are optional. Corners between moves
+    with the same drawing flag are rounded within path_tolerance.
+    """
+    max_velocity: float = 0.2
+    max_acceleration: float = 2.0
+    max_jerk: float = None
+    path_tolerance: float = 0.0001
+    max_joint_velocity: float = None
+    look_ahead: int = 64
+
+
+def _path_points(starts, directions, curvatures, distances):
+    # Points at distances along arcs of signed curvature, or along lines
+    # for zero curvature, from their starts in their directions
+    normals = np.column_stack((-directions[:, 1], directions[:, 0]))
+    angles = curvatures * distances
+    along = distances * np.sinc(angles / np.pi)
+    across = 0.5 * angles * distances * np.sinc(angles / (2 * np.pi))**2
+    return starts + along[:, None] * directions + across[:, None] * normals
+
+
+def _rotate(directions, angles):
+    cosines, sines = np.cos(angles), np.sin(angles)
+    return np.column_stack(
+        (cosines * directions[:, 0] - sines * directions[:, 1],
+         sines * directions[:, 0] + cosines * directions[:, 1]))
+
+
+class LookAheadPlanner:
+    """Plans blended, acceleration limited trajectories over many commands.
+
+    Each plan goes from the current position and speed to rest at the last
+    of up to look_ahead commands, without stopping at the commands in
+    between. The simulation replaces the plan before reaching its end when
+    more commands are queued, so the robot only stops when the queue runs
+    out. Corners are replaced by circular arcs whose distance to the corner
+    is path_tolerance. The speed along the path is limited by max_velocity,
+    the centripetal acceleration in the arcs and the joint speeds from the
+    inverse kinematics, then by the tangential acceleration in a forward
+    and a backward pass. Together the two accelerations stay within
+    max_acceleration, and the samples lie on the exact lines and arcs, so
+    the second differences of the samples do too. With max_jerk the
+    simulation smooths the samples with a moving average of
+    max_acceleration / max_jerk seconds, which limits the jerk and rounds
+    the path by about max_acceleration * (max_acceleration / max_jerk)**2
+    / 24.
+    """
+
+    # Largest length of the path intervals, and the share of
+    # max_acceleration left to the centripetal acceleration in the arcs
+    MAX_SPACING = 0.002
+    CENTRIPETAL_SHARE = 2**-0.5
+    JOINT_CHORDS = 4
+
+    def __init__(self, robot_configuration, motion_limits, sampling_time):
+        self._robot_configuration = robot_configuration
+        self._limits = motion_limits
+        self._sampling_time = sampling_time
+
+    def get_look_ahead(self):
+        return self._limits.look_ahead
+
+    def get_filter_length(self):
+        """Returns the length of the moving average limiting the jerk."""
+        if not self._limits.max_jerk:
+            return 1
+        return max(
+            int(
+                round(self._limits.max_acceleration /
+                      (self._limits.max_jerk * self._sampling_time))), 1)
+
+    def _path(self, positions, drawing):
+        # The lines and corner arcs split into intervals, as the start,
+        # direction, signed curvature and length of every interval, the
+        # points where the robot stops and the point ending every command
+        increments = np.diff(positions, axis=0)
+        lengths = np.sqrt(np.sum(increments**2, axis=1))
+        directions = increments / np.where(lengths > 0, lengths, 1.0)[:, None]
+
+        # Turn of every corner, positive to the left
+        turns = np.arctan2(
+            directions[:-1, 0] * directions[1:, 1] -
+            directions[:-1, 1] * directions[1:, 0],
+            np.sum(directions[:-1] * directions[1:], axis=1))
+        angles = np.abs(turns)
+        # Reversals have no curvature to limit the speed, so they stop
+        blended = ((drawing[:-1] == drawing[1:]) & (lengths[:-1] > 0) &
+                   (lengths[1:] > 0) & (angles > 1e-9) &
+                   (angles < np.pi - 1e-6) &
+                   (self._limits.path_tolerance > 0))
+        collinear = (lengths[:-1] > 0) & (lengths[1:] > 0) & (angles <= 1e-9)
+
+        # Distance from every corner to the ends of its arc, which passes
+        # path_tolerance from the corner or joins the middles of the moves
+        number_of_commands = len(lengths)
+        blend_lengths = np.zeros(number_of_commands + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            blend_lengths[1:-1] = np.where(
+                blended,
+                np.minimum(self._limits.path_tolerance / np.tan(angles / 4),
+                           0.5 * np.minimum(lengths[:-1], lengths[1:])), 0.0)
+            radii = np.where(blended,
+                             blend_lengths[1:-1] / np.tan(angles / 2), 0.0)
+        curvatures = np.where(blended, np.sign(turns) / np.where(
+            blended, radii, 1.0), 0.0)
+        arc_lengths = radii * angles
+
+        # Every command is the second half of the arc before it, its line
+        # and the first half of the arc after it
+        line_starts = positions[:-1] + directions * blend_lengths[:-1, None]
+        arc_starts = positions[1:-1] - directions[:-1] * blend_lengths[1:-1,
+                                                                      None]
+        half_arc_lengths = 0.5 * arc_lengths
+        middles = _path_points(arc_starts, directions[:-1], curvatures,
+                               half_arc_lengths)
+        middle_directions = _rotate(directions[:-1], 0.5 * turns * blended)
+        zero = np.zeros((1, 2))
+        primitive_starts = np.stack(
+            (np.concatenate((zero, middles)), line_starts,
+             np.concatenate((arc_starts, zero))),
+            axis=1).reshape(-1, 2)
+        primitive_directions = np.stack(
+            (np.concatenate((directions[:1], middle_directions)), directions,
+             np.concatenate((directions[:-1], directions[-1:]))),
+            axis=1).reshape(-1, 2)
+        primitive_curvatures = np.stack(
+            (np.append(0.0, curvatures), np.zeros(number_of_commands),
+             np.append(curvatures, 0.0)),
+            axis=1).ravel()
+        primitive_lengths = np.stack(
+            (np.append(0.0, half_arc_lengths),
+             np.maximum(lengths - blend_lengths[:-1] - blend_lengths[1:],
+                        0.0), np.append(half_arc_lengths, 0.0)),
+            axis=1).ravel()
+
+        # Intervals of at most MAX_SPACING, none for empty primitives
+        pieces = np.ceil(primitive_lengths / self.MAX_SPACING).astype(
+            np.int64)
+        primitives = np.repeat(np.arange(len(pieces)), pieces)
+        interval_lengths = np.repeat(
+            primitive_lengths / np.maximum(pieces, 1), pieces)
+        offsets = (np.arange(pieces.sum()) -
+                   np.repeat(np.cumsum(pieces) - pieces, pieces)) * (
+                       interval_lengths)
+        interval_curvatures = primitive_curvatures[primitives]
+        interval_starts = _path_points(primitive_starts[primitives],
+                                       primitive_directions[primitives],
+                                       interval_curvatures, offsets)
+        interval_directions = _rotate(primitive_directions[primitives],
+                                      interval_curvatures * offsets)
+
+        # The robot stops at the corners that are not blended
+        command_ends = np.cumsum(pieces.reshape(-1, 3).sum(axis=1))
+        stops = np.zeros(len(interval_lengths) + 1, dtype=bool)
+        stops[command_ends[:-1][~blended & ~collinear]] = True
+        return (interval_starts, interval_directions, interval_curvatures,
+                interval_lengths, stops, command_ends)
+
+    def _speed_limits(self, starts, directions, curvatures, path_lengths):
+        # Limits of the points and of the intervals between them, and the
+        # tangential acceleration left in every interval
+        limits = self._limits
+        with np.errstate(divide='ignore'):
+            interval_limits = np.minimum(
+                float(limits.max_velocity),
+                np.sqrt(self.CENTRIPETAL_SHARE * limits.max_acceleration /
+                        np.abs(curvatures)))
+
+        # Largest joint speed per unit of path length, over JOINT_CHORDS
+        # chords of every interval
+        if limits.max_joint_velocity is not None:
+            configuration = self._robot_configuration
+            fractions = np.linspace(0.0, 1.0, self.JOINT_CHORDS + 1)
+            chord_points = _path_points(
+                np.tile(starts, (len(fractions), 1)),
+                np.tile(directions, (len(fractions), 1)),
+                np.tile(curvatures, len(fractions)),
+                np.outer(fractions, path_lengths).ravel())
+            joint_positions = inverse_kinematics(
+                chord_points, configuration.motor_distance,
+                configuration.base_arm_length, configuration.link_arm_length,
+                np.asarray(configuration.tcp_offset)).reshape(
+                    len(fractions), -1, 2)
+            # Angles wrap at +-pi
+            joint_increments = np.abs(
+                (np.diff(joint_positions, axis=0) + np.pi) % (2 * np.pi) -
+                np.pi).max(axis=(0, 2))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                joint_limits = (limits.max_joint_velocity * path_lengths /
+                                (self.JOINT_CHORDS * joint_increments))
+            # Unreachable points are rejected by the simulation anyway
+            joint_limits[~np.isfinite(joint_limits)] = np.inf
+            interval_limits = np.minimum(interval_limits, joint_limits)
+
+        speed_limits = np.append(interval_limits, interval_limits[-1])
+        speed_limits[1:-1] = np.minimum(speed_limits[1:-1],
+                                        interval_limits[:-1])
+        accelerations = np.sqrt(
+            np.maximum(
+                limits.max_acceleration**2 -
+                (interval_limits**2 * curvatures)**2, 0.0))
+        return speed_limits, interval_limits, accelerations
+
+    def _speeds(self, speed_limits, works, initial_speed):
+        # Forward and backward passes, from initial_speed and to rest, in
+        # closed form: v_i^2 = min over j <= i of v_limit_j^2 + 2 (w_i - w_j),
+        # where w is the integral of the acceleration along the path
+        squared_limits = speed_limits**2
+        squared_limits[0] = min(squared_limits[0], initial_speed**2)
+        squared_limits[-1] = 0.0
+        squared_speeds = 2 * works + np.minimum.accumulate(squared_limits -
+                                                           2 * works)
+        squared_speeds = np.minimum(
+            squared_speeds, -2 * works + np.minimum.accumulate(
+                (squared_limits + 2 * works)[::-1])[::-1])
+        return np.sqrt(np.maximum(squared_speeds, 0.0))
+
+    def _timing(self, speeds, interval_limits, accelerations, path_lengths):
+        # Accelerate, cruise and decelerate phases of every interval
+        initial_speeds, final_speeds = speeds[:-1], speeds[1:]
+        peak_speeds = np.sqrt(
+            (2 * accelerations * path_lengths + initial_speeds**2 +
+             final_speeds**2) / 2)
+        top_speeds = np.maximum(np.minimum(peak_speeds, interval_limits),
+                                np.maximum(initial_speeds, final_speeds))
+        accelerating = (top_speeds**2 - initial_speeds**2) / (2 *
+                                                              accelerations)
+        decelerating = (top_speeds**2 - final_speeds**2) / (2 * accelerations)
+        cruising = np.maximum(path_lengths - accelerating - decelerating, 0.0)
+        durations = np.stack(
+            ((top_speeds - initial_speeds) / accelerations,
+             np.where(top_speeds > 0,
+                      cruising / np.maximum(top_speeds, 1e-300), 0.0),
+             (top_speeds - final_speeds) / accelerations),
+            axis=1).ravel()
+        phase_speeds = np.stack((initial_speeds, top_speeds, top_speeds),
+                                axis=1).ravel()
+        phase_accelerations = np.stack(
+            (accelerations, np.zeros(len(accelerations)), -accelerations),
+            axis=1).ravel()
+        phase_lengths = np.stack((accelerating, cruising, decelerating),
+                                 axis=1).ravel()
+        phase_times = np.concatenate(([0.0], np.cumsum(durations)))
+        phase_distances = np.concatenate(([0.0], np.cumsum(phase_lengths)))
+        return (phase_times, phase_distances, phase_speeds,
+                phase_accelerations)
+
+    def plan(self,
+             initial_position,
+             points,
+             drawing,
+             initial_speed=0.0,
+             start_command=0,
+             start_offset=0.0):
+        """Plans the moves through the queued commands, ending at rest.
+
+        points and drawing are the queued commands, from initial_position.
+        The plan starts start_offset along the path of start_command, where
+        the robot moves at initial_speed. Returns the (N, 2) unfiltered
+        samples, the command of every sample, the distance of every sample
+        along the path of its command and the speed at every sample. The
+        last sample is exactly the last command point.
+
+        The path of a command only depends on the previous and the next
+        command, so a plan from the command before the current one with
+        more commands after it continues the current plan without a jump.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        drawing = np.asarray(drawing, dtype=bool)
+        positions = np.concatenate(
+            (np.asarray(initial_position, dtype=np.float64)[None], points))
+        (starts, directions, curvatures, path_lengths, stops,
+         command_ends) = self._path(positions, drawing)
+        distances = np.concatenate(([0.0], np.cumsum(path_lengths)))
+        command_starts = np.concatenate(([0.0], distances[command_ends[:-1]]))
+        start_distance = command_starts[start_command] + start_offset
+        total_distance = distances[-1]
+        if total_distance <= start_distance:
+            return (points[-1:].copy(), np.array([len(points) - 1]),
+                    np.zeros(1), np.zeros(1))
+
+        speed_limits, interval_limits, accelerations = self._speed_limits(
+            starts, directions, curvatures, path_lengths)
+        speed_limits[stops] = 0.0
+
+        # Intervals from the start, the first one shortened
+        first = np.searchsorted(distances, start_distance, side='right')
+        plan_distances = np.concatenate(([start_distance], distances[first:]))
+        speed_limits = np.concatenate(
+            ([interval_limits[first - 1]], speed_limits[first:]))
+        interval_limits = interval_limits[first - 1:]
+        accelerations = accelerations[first - 1:]
+        plan_lengths = np.diff(plan_distances)
+
+        works = np.concatenate(([0.0], np.cumsum(accelerations *
+                                                 plan_lengths)))
+        speeds = self._speeds(speed_limits, works, initial_speed)
+        (phase_times, phase_distances, phase_speeds,
+         phase_accelerations) = self._timing(speeds, interval_limits,
+                                             accelerations, plan_lengths)
+
+        # Path position at every sampling time
+        number_of_samples = max(
+            int(np.ceil(phase_times[-1] / self._sampling_time)), 1)
+        times = np.arange(1, number_of_samples + 1) * self._sampling_time
+        phases = np.clip(
+            np.searchsorted(phase_times, times, side='right') - 1, 0,
+            len(phase_speeds) - 1)
+        elapsed = np.minimum(times - phase_times[phases],
+                             np.diff(phase_times)[phases])
+        sample_distances = start_distance + (
+            phase_distances[phases] + phase_speeds[phases] * elapsed +
+            0.5 * phase_accelerations[phases] * elapsed**2)
+        sample_distances = np.minimum(sample_distances, total_distance)
+        sample_distances[-1] = total_distance
+        sample_speeds = np.maximum(
+            phase_speeds[phases] + phase_accelerations[phases] * elapsed, 0.0)
+        sample_speeds[-1] = 0.0
+
+        # Samples on the lines and arcs of their intervals
+        intervals = np.clip(
+            np.searchsorted(distances, sample_distances, side='right') - 1,
+            0,
+            len(path_lengths) - 1)
+        trajectory = _path_points(starts[intervals], directions[intervals],
+                                  curvatures[intervals],
+                                  sample_distances - distances[intervals])
+        trajectory[-1] = points[-1]
+        command_indices = np.minimum(
+            np.searchsorted(command_starts[1:], sample_distances,
+                            side='left'),
+            len(points) - 1)
+        return (trajectory, command_indices,
+                sample_distances - command_starts[command_indices],
+                sample_speeds)
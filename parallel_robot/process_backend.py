@@ -0,0 +1,217 @@
+import signal
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+from .simulation import Simulation, SAMPLING_TIME, PROFILING_STAGES
+from .tools import (TelemetrySharer, TimeManager, Command, PeriodStatistics,
+                    StageProfiler, buffer_array)
+
+
+class SharedMemoryCommandSharer:
+    """Command ring buffer with the CommandSharer interface.
+
+    Holds up to capacity commands as (x, y, drawing, validated start x,
+    validated start y) rows in a single buffer, NaN starts for commands
+    that were not validated, so commands can be added in one process and
+    taken in another. Commands must be added from a single process and
+    taken from a single thread.
+    """
+
+    def __init__(self, capacity: int, buffer=None):
+        if buffer is None:
+            buffer = bytearray(
+                SharedMemoryCommandSharer.get_buffer_size(capacity))
+        self._capacity = capacity
+        # Number of commands added, taken and finished
+        self._counters, offset = buffer_array(buffer, 0, 3, np.int64)
+        self._commands, _ = buffer_array(buffer, offset, (capacity, 5),
+                                         np.float64)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_buffer_size(capacity):
+        return (3 * np.dtype(np.int64).itemsize +
+                capacity * 5 * np.dtype(np.float64).itemsize)
+
+    def add_command(self, command, block=False, timeout=None):
+        return self.add_commands(command.cartesian_position,
+                                 command.drawing,
+                                 block=block,
+                                 timeout=timeout,
+                                 validated_start=command.validated_start) == 1
+
+    def add_commands(self,
+                     points,
+                     drawing,
+                     block=True,
+                     timeout=None,
+                     validated_start=None):
+        """Enqueues (N, 2) points with their N drawing flags.
+
+        When the ring is full, polls for space every sampling period up to
+        timeout seconds if block is set. Returns the number of commands
+        added, which is less than N only if the ring stayed full.
+        validated_start is the start of the first move for moves checked by
+        validate_commands.
+        """
+        return self.put_commands(points, drawing, block, timeout,
+                                 validated_start)[0]
+
+    def put_commands(self,
+                     points,
+                     drawing,
+                     block=True,
+                     timeout=None,
+                     validated_start=None):
+        """Like add_commands, returns (number added, end index).
+
+        The added commands are finished once the number of finished
+        commands reaches the end index.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                                  (len(points), ))
+        starts = np.full((len(points), 2), np.nan)
+        if validated_start is not None and len(points):
+            starts[0] = validated_start
+            starts[1:] = points[:-1]
+
+        number_of_points = len(points)
+        added = 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while added < number_of_points:
+                head = int(self._counters[0])
+                count = min(number_of_points - added,
+                            self._capacity - (head - int(self._counters[1])))
+                if count <= 0:
+                    if not block or (deadline is not None and
+                                     time.monotonic() >= deadline):
+                        break
+                    time.sleep(SAMPLING_TIME)
+                    continue
+                # Write up to the end of the ring, the rest on the next pass
+                index = head % self._capacity
+                count = min(count, self._capacity - index)
+                rows = self._commands[index:index + count]
+                rows[:, 0:2] = points[added:added + count]
+                rows[:, 2] = drawing[added:added + count]
+                rows[:, 3:5] = starts[added:added + count]
+                self._counters[0] = head + count
+                added += count
+            end_index = int(self._counters[0])
+        return added, end_index
+
+    def get_command(self):
+        taken = int(self._counters[1])
+        if taken == self._counters[0]:
+            return None
+        row = self._commands[taken % self._capacity]
+        command = Command(row[0:2].copy(), bool(row[2]),
+                          None if np.isnan(row[3]) else row[3:5].copy())
+        self._counters[1] = taken + 1
+        return command
+
+    def peek_commands(self, max_number):
+        """Returns the (points, drawing) of up to max_number queued commands.
+
+        The commands stay queued, so get_command returns them in order.
+        """
+        taken = int(self._counters[1])
+        count = min(max_number, int(self._counters[0]) - taken)
+        indices = np.arange(taken, taken + count) % self._capacity
+        rows = self._commands[indices]
+        return rows[:, 0:2].copy(), rows[:, 2].astype(bool)
+
+    def get_number_of_commands(self):
+        return int(self._counters[0] - self._counters[1])
+
+    def task_done(self, result=None):
+        """Marks the trajectory of the last command taken as finished.
+
+        The result is not shared with the other process.
+        """
+        self._counters[2] += 1
+
+    def get_number_of_unfinished_commands(self):
+        """Returns the number of queued or executing commands."""
+        return int(self._counters[0] - self._counters[2])
+
+    def get_executing_command_index(self):
+        """Returns the index of the command being executed, None if idle."""
+        finished = int(self._counters[2])
+        if self._counters[1] > finished:
+            return finished
+        return None
+
+    def _wait(self, predicate, timeout):
+        # Condition variables do not cross processes, so poll every period
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not predicate():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(SAMPLING_TIME)
+        return True
+
+    def wait_until_no_commands(self, timeout=None):
+        """Waits until the ring is empty, returns False on timeout."""
+        return self._wait(lambda: self.get_number_of_commands() == 0,
+                          timeout)
+
+    def wait_until_finished(self, timeout=None):
+        """Waits until every command is executed, returns False on timeout."""
+        return self._wait(
+            lambda: self.get_number_of_unfinished_commands() == 0, timeout)
+
+
+def _run_simulation(stop_event, telemetry_memory, command_memory,
+                    statistics_memory, history_capacity, command_capacity,
+                    robot_configuration, pacing, motion_limits, ready_event):
+    telemetry_sharer = TelemetrySharer(history_capacity, telemetry_memory.buf)
+    command_sharer = SharedMemoryCommandSharer(command_capacity,
+                                               command_memory.buf)
+    # The stage profiler follows the period statistics
+    profiler = StageProfiler(
+        PROFILING_STAGES,
+        statistics_memory.buf[PeriodStatistics.get_buffer_size():])
+    # Creating the simulation loads and warms up the kinematics backend, so
+    # the clock starts once the first period can run on time
+    simulation = Simulation(telemetry_sharer, command_sharer,
+                            robot_configuration, motion_limits, profiler)
+    time_manager = TimeManager(SAMPLING_TIME,
+                               pacing,
+                               statistics_buffer=statistics_memory.buf)
+    if ready_event is not None:
+        ready_event.set()
+    simulation.run(stop_event, time_manager)
+
+
+def process_simulation(stop_event, telemetry_memory_name, command_memory_name,
+                       statistics_memory_name, history_capacity,
+                       command_capacity, robot_configuration, pacing,
+                       motion_limits=None, ready_event=None):
+    """Entry point of the simulation child process.
+
+    Sets ready_event once the simulation is created, before its first
+    period.
+    """
+    # Ctrl+C goes to the whole process group: the child ignores it and the
+    # parent stops it through the stop event, e.g. with stop()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    memories = [
+        shared_memory.SharedMemory(name)
+        for name in (telemetry_memory_name, command_memory_name,
+                     statistics_memory_name)
+    ]
+    try:
+        # The sharers only live inside this call, so no array still exports
+        # the shared memory buffers when they are closed
+        _run_simulation(stop_event, *memories, history_capacity,
+                        command_capacity, robot_configuration, pacing,
+                        motion_limits, ready_event)
+    finally:
+        for memory in memories:
+            memory.close()
@@ -0,0 +1,299 @@
+import threading
+import zlib
+import numpy as np
+
+from .tools import TELEMETRY_DTYPE
+
+TELEMETRY_LOG_MAGIC = b'PRTLOG'
+TELEMETRY_LOG_VERSION = 1
+COMPRESSIONS = {None: 0, 'zlib': 1}
+
+# A log is a header, chunks of samples and, once closed, the seek table of
+# the chunks followed by a trailer. Every chunk is a CHUNK_DTYPE header
+# followed by one column per TELEMETRY_DTYPE field, each padded to 8 bytes.
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', np.uint32),
+    ('compression', np.uint32),
+    ('chunk_size', np.int64),
+])
+HEADER_SIZE = 64
+
+SEEK_DTYPE = np.dtype([
+    ('offset', np.int64),
+    ('number_of_samples', np.int64),
+    ('first_sequence', np.int64),
+    ('first_timestamp', np.float64),
+    ('last_timestamp', np.float64),
+    ('first_command_index', np.int64),
+    ('last_command_index', np.int64),
+])
+
+CHUNK_MAGIC = b'PRTCHUNK'
+CHUNK_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('entry', SEEK_DTYPE),
+    ('column_sizes', np.int64, (len(TELEMETRY_DTYPE.names), )),
+])
+
+TRAILER_MAGIC = b'PRTINDEX'
+TRAILER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('table_offset', np.int64),
+    ('number_of_chunks', np.int64),
+])
+
+
+def _padding(size):
+    return -size % 8
+
+
+class TelemetryRecorder:
+    """Records every published sample of a TelemetrySharer to a log file.
+
+    The simulation only copies its samples into the telemetry history. A
+    background thread reads the history every poll_interval seconds and
+    writes it in chunks of chunk_size samples, compressed with zlib if
+    compression is 'zlib'. The file is preallocated preallocation bytes at
+    a time. The history must hold more samples than published in a poll
+    interval, otherwise the samples overwritten meanwhile are lost and
+    counted by get_number_of_lost_samples().
+    """
+
+    def __init__(self,
+                 telemetry_sharer,
+                 path,
+                 chunk_size=4096,
+                 compression=None,
+                 poll_interval=0.05,
+                 preallocation=2**26):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, "
+                             f"expected one of {list(COMPRESSIONS)}.")
+        self._telemetry_sharer = telemetry_sharer
+        self._path = path
+        self._chunk_size = chunk_size
+        self._compression = compression
+        self._poll_interval = poll_interval
+        self._preallocation = preallocation
+
+        self._file = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._sequence = 0
+        self._pending = []
+        self._number_of_pending_samples = 0
+        self._entries = []
+        self._size = 0
+        self._allocated = 0
+        self._number_of_samples = 0
+        self._number_of_lost_samples = 0
+
+    def start(self):
+        """Records the samples published from now on."""
+        self._file = open(self._path, 'wb')
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = TELEMETRY_LOG_MAGIC
+        header['version'] = TELEMETRY_LOG_VERSION
+        header['compression'] = COMPRESSIONS[self._compression]
+        header['chunk_size'] = self._chunk_size
+        self._size = 0
+        self._allocated = 0
+        self._write(header.tobytes() + bytes(HEADER_SIZE - header.nbytes))
+
+        self._sequence = self._telemetry_sharer.get_sequence()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Writes the remaining samples and the seek table, then closes."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+        table = np.array(self._entries, dtype=SEEK_DTYPE)
+        trailer = np.zeros(1, dtype=TRAILER_DTYPE)
+        trailer['magic'] = TRAILER_MAGIC
+        trailer['table_offset'] = self._size
+        trailer['number_of_chunks'] = len(table)
+        self._write(table.tobytes() + trailer.tobytes())
+        self._file.truncate(self._size)
+        self._file.close()
+        self._file = None
+
+    def get_number_of_samples(self):
+        """Returns the number of samples written to the file."""
+        return self._number_of_samples
+
+    def get_number_of_lost_samples(self):
+        return self._number_of_lost_samples
+
+    def _run(self):
+        while not self._stop_event.wait(self._poll_interval):
+            self._poll()
+        self._poll()
+        if self._pending:
+            self._write_chunk(np.concatenate(self._pending))
+
+    def _poll(self):
+        samples, last_sequence, overrun = \
+            self._telemetry_sharer.get_telemetry_since(self._sequence)
+        if overrun:
+            first_sequence = (samples['sequence'][0]
+                              if len(samples) else last_sequence + 1)
+            self._number_of_lost_samples += int(first_sequence -
+                                                self._sequence - 1)
+        self._sequence = last_sequence
+        if len(samples) == 0:
+            return
+        self._pending.append(samples)
+        self._number_of_pending_samples += len(samples)
+        if self._number_of_pending_samples < self._chunk_size:
+            return
+
+        samples = np.concatenate(self._pending)
+        number_of_chunks = len(samples) // self._chunk_size
+        for i in range(number_of_chunks):
+            self._write_chunk(samples[i * self._chunk_size:(i + 1) *
+                                      self._chunk_size])
+        rest = samples[number_of_chunks * self._chunk_size:]
+        self._pending = [rest] if len(rest) else []
+        self._number_of_pending_samples = len(rest)
+
+    def _write_chunk(self, samples):
+        columns = []
+        for name in TELEMETRY_DTYPE.names:
+            column = np.ascontiguousarray(samples[name]).tobytes()
+            if self._compression == 'zlib':
+                column = zlib.compress(column, 1)
+            columns.append(column)
+
+        chunk = np.zeros(1, dtype=CHUNK_DTYPE)
+        chunk['magic'] = CHUNK_MAGIC
+        entry = chunk['entry']
+        entry['offset'] = self._size
+        entry['number_of_samples'] = len(samples)
+        entry['first_sequence'] = samples['sequence'][0]
+        entry['first_timestamp'] = samples['timestamp'][0]
+        entry['last_timestamp'] = samples['timestamp'][-1]
+        entry['first_command_index'] = samples['command_index'].min()
+        entry['last_command_index'] = samples['command_index'].max()
+        chunk['column_sizes'] = [len(column) for column in columns]
+        self._write(b''.join([chunk.tobytes()] + [
+            column + bytes(_padding(len(column))) for column in columns
+        ]))
+        self._entries.append(entry[0])
+        self._number_of_samples += len(samples)
+
+    def _write(self, data):
+        if self._size + len(data) > self._allocated:
+            self._allocated = self._size + len(data) + self._preallocation
+            self._file.truncate(self._allocated)
+        self._file.seek(self._size)
+        self._file.write(data)
+        self._size += len(data)
+
+
+class TelemetryLog:
+    """Reader of a telemetry log, mapped in memory.
+
+    Uses the seek table of a closed log, or scans the chunk headers of a
+    log whose recording was interrupted. Uncompressed columns are copied
+    straight from the memory map into the returned samples.
+    """
+
+    def __init__(self, path):
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        header = self._data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header['magic'] != TELEMETRY_LOG_MAGIC:
+            raise ValueError(f"{path} is not a telemetry log.")
+        if header['version'] != TELEMETRY_LOG_VERSION:
+            raise ValueError(f"{path} has telemetry log version "
+                             f"{header['version']}, expected "
+                             f"{TELEMETRY_LOG_VERSION}.")
+        self._compressed = header['compression'] == COMPRESSIONS['zlib']
+
+        self._table = None
+        if len(self._data) >= HEADER_SIZE + TRAILER_DTYPE.itemsize:
+            trailer = self._data[-TRAILER_DTYPE.itemsize:].view(
+                TRAILER_DTYPE)[0]
+            if trailer['magic'] == TRAILER_MAGIC:
+                offset = int(trailer['table_offset'])
+                self._table = self._data[offset:offset +
+                                         int(trailer['number_of_chunks']) *
+                                         SEEK_DTYPE.itemsize].view(SEEK_DTYPE)
+        if self._table is None:
+            self._table = self._scan()
+
+    def _scan(self):
+        entries = []
+        offset = HEADER_SIZE
+        while offset + CHUNK_DTYPE.itemsize <= len(self._data):
+            chunk = self._data[offset:offset +
+                               CHUNK_DTYPE.itemsize].view(CHUNK_DTYPE)[0]
+            if chunk['magic'] != CHUNK_MAGIC:
+                break
+            size = CHUNK_DTYPE.itemsize + sum(
+                int(column_size) + _padding(int(column_size))
+                for column_size in chunk['column_sizes'])
+            if offset + size > len(self._data):
+                break
+            entries.append(chunk['entry'])
+            offset += size
+        return np.array(entries, dtype=SEEK_DTYPE)
+
+    def get_seek_table(self):
+        """Returns the SEEK_DTYPE entries of the chunks."""
+        return self._table
+
+    def get_number_of_samples(self):
+        return int(self._table['number_of_samples'].sum())
+
+    def _read_chunk(self, entry):
+        offset = int(entry['offset'])
+        chunk = self._data[offset:offset +
+                           CHUNK_DTYPE.itemsize].view(CHUNK_DTYPE)[0]
+        offset += CHUNK_DTYPE.itemsize
+        number_of_samples = int(entry['number_of_samples'])
+        samples = np.empty(number_of_samples, dtype=TELEMETRY_DTYPE)
+        for name, column_size in zip(TELEMETRY_DTYPE.names,
+                                     chunk['column_sizes']):
+            column_size = int(column_size)
+            column = self._data[offset:offset + column_size]
+            if self._compressed:
+                column = np.frombuffer(zlib.decompress(column),
+                                       dtype=np.uint8)
+            field = TELEMETRY_DTYPE.fields[name][0]
+            samples[name] = column.view(field.base).reshape(
+                (number_of_samples, ) + field.shape)
+            offset += column_size + _padding(column_size)
+        return samples
+
+    def _read_chunks(self, selected):
+        samples = [self._read_chunk(entry) for entry in self._table[selected]]
+        if not samples:
+            return np.empty(0, dtype=TELEMETRY_DTYPE)
+        return np.concatenate(samples)
+
+    def get_samples(self, start_time=-np.inf, end_time=np.inf):
+        """Returns the TELEMETRY_DTYPE samples with start_time <= t < end_time.
+
+        Only the chunks overlapping the time range are read.
+        """
+        table = self._table
+        samples = self._read_chunks((table['last_timestamp'] >= start_time) &
+                                    (table['first_timestamp'] < end_time))
+        timestamps = samples['timestamp']
+        return samples[(timestamps >= start_time) & (timestamps < end_time)]
+
+    def get_command_samples(self, command_index):
+        """Returns the samples of the states reached by a command."""
+        table = self._table
+        samples = self._read_chunks(
+            (table['first_command_index'] <= command_index) &
+            (table['last_command_index'] >= command_index))
+        return samples[samples['command_index'] == command_index]
+
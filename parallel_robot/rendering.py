@@ -0,0 +1,273 @@
+import importlib.util
+import os
+import struct
+import warnings
+import zlib
+import numpy as np
+
+# Colors
+black = (0, 0, 0)
+white = (255, 255, 255)
+orange = (255, 162, 0)
+red = (255, 0, 0)
+green = (0, 255, 0)
+
+
+def pixel_per_metre(robot_configuration, width, height):
+    """Returns the scale that fits the robot workspace in the image."""
+    robot_width = 2 * np.abs(robot_configuration.motor_distance -
+                             robot_configuration.base_arm_length -
+                             robot_configuration.link_arm_length
+                             ) + robot_configuration.motor_distance
+    robot_height = 2 * ((robot_configuration.base_arm_length +
+                         robot_configuration.link_arm_length)**2 -
+                        (robot_configuration.motor_distance / 2.0)**2)**0.5
+    if robot_width / robot_height >= width / height:
+        return width / robot_width
+    return height / robot_height
+
+
+def _sample_lines(starts, ends):
+    # Points at least once per pixel along every segment, with the index of
+    # their segment
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    deltas = np.asarray(ends, dtype=np.float64).reshape(-1, 2) - starts
+    lengths = np.ceil(np.abs(deltas).max(axis=1)).astype(np.int64) + 1
+    segments = np.repeat(np.arange(len(starts)), lengths)
+    steps = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths)
+    t = steps / np.maximum(lengths - 1, 1)[segments]
+    points = np.rint(starts[segments] +
+                     deltas[segments] * t[:, None]).astype(np.int64)
+    return points, segments
+
+
+def line_pixels(starts, ends, width=1):
+    """Returns the x and y pixel indices of (M, 2) line segments.
+
+    Lines are widened with a disk of diameter width.
+    """
+    points, _ = _sample_lines(starts, ends)
+    if width > 1:
+        radius = (width - 1) // 2
+        dx, dy = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        disk = (dx**2 + dy**2) <= radius**2 + radius
+        kernel = np.column_stack((dx[disk], dy[disk]))
+        points = (points[:, None, :] + kernel[None]).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def circle_pixels(center, radius):
+    """Returns the x and y pixel indices of a circle outline."""
+    number_of_points = int(np.ceil(2 * np.pi * radius)) + 1
+    angles = np.linspace(0, 2 * np.pi, number_of_points)
+    x = np.rint(center[0] + radius * np.cos(angles)).astype(np.int64)
+    y = np.rint(center[1] + radius * np.sin(angles)).astype(np.int64)
+    return x, y
+
+
+class OfflineRenderer:
+    """Rasterizes recorded telemetry into images without a display.
+
+    Draws the same scene as Visualization: the workspace circles, the axes,
+    the pen path and the arms. Telemetry is a TELEMETRY_DTYPE array, e.g.
+    from get_telemetry_since(). The pen path of all the samples is
+    rasterized at once into an image holding, for every pixel, the first
+    sample that draws it, so every frame is a single comparison.
+    """
+
+    def __init__(self, robot_configuration, width=800, height=600):
+        self._robot_configuration = robot_configuration
+        self._width = width
+        self._height = height
+        self._pixel_per_metre = pixel_per_metre(robot_configuration, width,
+                                                height)
+
+        self._background = np.zeros((height, width, 3), dtype=np.uint8)
+        self._background[:] = black
+        self._draw_workspace(self._background)
+        self._draw_axes(self._background)
+
+    def robot_to_image_coordinates(self, points):
+        """Converts (..., 2) robot coordinates to image coordinates."""
+        points = np.asarray(points, dtype=np.float64)
+        center_offset = (self._width / 2.0) - (
+            self._robot_configuration.motor_distance *
+            self._pixel_per_metre / 2.0)
+        x = center_offset + points[..., 0] * self._pixel_per_metre
+        y = (self._height / 2.0) - points[..., 1] * self._pixel_per_metre
+        return np.stack((x, y), axis=-1)
+
+    def _plot(self, image, x, y, color):
+        inside = ((x >= 0) & (x < self._width) & (y >= 0) &
+                  (y < self._height))
+        image[y[inside], x[inside]] = color
+
+    def _draw_workspace(self, image):
+        configuration = self._robot_configuration
+        radii = [
+            np.abs(configuration.base_arm_length -
+                   configuration.link_arm_length),
+            configuration.base_arm_length + configuration.link_arm_length
+        ]
+        for motor in [(0, 0), (configuration.motor_distance, 0)]:
+            center = self.robot_to_image_coordinates(motor)
+            for radius in radii:
+                self._plot(image,
+                           *circle_pixels(center,
+                                          radius * self._pixel_per_metre),
+                           white)
+
+    def _draw_axes(self, image):
+        center = self.robot_to_image_coordinates((0, 0))
+        arrow_length = 20
+        self._plot(image, *line_pixels(center, center + (arrow_length, 0), 2),
+                   red)
+        self._plot(image, *line_pixels(center, center - (0, arrow_length), 2),
+                   green)
+
+    def arm_points(self, telemetry):
+        """Returns the (N, 6, 2) image coordinates of the arm poses.
+
+        The points are the first motor, the first elbow, the end of the
+        link arms, the second elbow, the second motor and the TCP.
+        """
+        configuration = self._robot_configuration
+        joint_positions = telemetry['joint_position']
+        cartesian_positions = telemetry['cartesian_position']
+        points = np.zeros((len(telemetry), 6, 2))
+        points[:, 1, 0] = configuration.base_arm_length * np.cos(
+            joint_positions[:, 0])
+        points[:, 1, 1] = configuration.base_arm_length * np.sin(
+            joint_positions[:, 0])
+        points[:, 2] = cartesian_positions - np.asarray(
+            configuration.tcp_offset)
+        points[:, 3, 0] = configuration.base_arm_length * np.cos(
+            joint_positions[:, 1]) + configuration.motor_distance
+        points[:, 3, 1] = configuration.base_arm_length * np.sin(
+            joint_positions[:, 1])
+        points[:, 4, 0] = configuration.motor_distance
+        points[:, 5] = cartesian_positions
+        return self.robot_to_image_coordinates(points)
+
+    def pen_path(self, telemetry):
+        """Returns the first sample index that draws every pixel.
+
+        As in Visualization, the segment ending at a sample is drawn if that
+        sample is drawing. Pixels never drawn hold len(telemetry).
+        """
+        first_sample = np.full((self._height, self._width),
+                               len(telemetry),
+                               dtype=np.int64)
+        samples = np.flatnonzero(telemetry['drawing'][1:]) + 1
+        if len(samples) == 0:
+            return first_sample
+        points = self.robot_to_image_coordinates(
+            telemetry['cartesian_position'])
+        pixels, segments = _sample_lines(points[samples - 1],
+                                         points[samples])
+        x, y = pixels[:, 0], pixels[:, 1]
+        pixel_samples = samples[segments]
+        inside = ((x >= 0) & (x < self._width) & (y >= 0) &
+                  (y < self._height))
+        # Pixels are generated in sample order, so the first occurrence of
+        # every pixel belongs to the first sample drawing it
+        pixels, first = np.unique(y[inside] * self._width + x[inside],
+                                  return_index=True)
+        first_sample.flat[pixels] = pixel_samples[inside][first]
+        return first_sample
+
+    def render_frame(self, first_sample, index, pose):
+        """Returns the (height, width, 3) image of the scene at a sample.
+
+        first_sample is the pen_path() image and pose the (6, 2) arm_points()
+        of the sample.
+        """
+        image = self._background.copy()
+        image[first_sample <= index] = orange
+        self._plot(image,
+                   *line_pixels(pose[[0, 1, 2, 3, 2]], pose[[1, 2, 3, 4, 5]],
+                                5), white)
+        return image
+
+    def render_image(self, telemetry):
+        """Returns the image of the whole job in the last pose."""
+        if len(telemetry) == 0:
+            return self._background.copy()
+        return self.render_frame(self.pen_path(telemetry),
+                                 len(telemetry) - 1,
+                                 self.arm_points(telemetry[-1:])[0])
+
+    def get_frame_indices(self, telemetry, frame_rate):
+        """Returns the sample shown in every frame at frame_rate."""
+        timestamps = telemetry['timestamp']
+        frame_times = np.arange(timestamps[0], timestamps[-1],
+                                1.0 / frame_rate)
+        indices = np.searchsorted(timestamps, frame_times, side='right') - 1
+        # The last frame always shows the end of the job
+        return np.append(indices, len(telemetry) - 1)
+
+    def render_frames(self, telemetry, frame_rate=25.0):
+        """Yields the (height, width, 3) images of the job at frame_rate."""
+        if len(telemetry) == 0:
+            return
+        indices = self.get_frame_indices(telemetry, frame_rate)
+        first_sample = self.pen_path(telemetry)
+        arm_points = self.arm_points(telemetry[indices])
+        for index, pose in zip(indices, arm_points):
+            yield self.render_frame(first_sample, index, pose)
+
+
+def write_png(path, image):
+    """Writes a (height, width, 3) uint8 image as an RGB PNG file."""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, _ = image.shape
+    # Filter type 0 (none) in front of every row
+    rows = np.zeros((height, 1 + 3 * width), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, -1)
+
+    def chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data +
+                struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+    with open(path, 'wb') as png_file:
+        png_file.write(b'\x89PNG\r\n\x1a\n')
+        png_file.write(
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0,
+                                       0)))
+        png_file.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        png_file.write(chunk(b'IEND', b''))
+
+
+def write_png_frames(directory, frames):
+    """Writes the frames as numbered PNG files, e.g. to encode a video."""
+    os.makedirs(directory, exist_ok=True)
+    number_of_frames = 0
+    for number_of_frames, image in enumerate(frames, 1):
+        write_png(
+            os.path.join(directory, f"frame_{number_of_frames - 1:06d}.png"),
+            image)
+    return number_of_frames
+
+
+def write_gif(path, frames, frame_rate=25.0):
+    """Writes the frames as an animated GIF and returns the path written.
+
+    Pillow is optional. Without it, warns and writes the frames as numbered
+    PNG files into the directory named like path without its extension.
+    """
+    if importlib.util.find_spec('PIL') is None:
+        directory = os.path.splitext(path)[0]
+        warnings.warn(f"Writing GIF files needs Pillow, writing PNG frames "
+                      f"to {directory} instead.")
+        write_png_frames(directory, frames)
+        return directory
+    from PIL import Image
+    images = [Image.fromarray(image) for image in frames]
+    images[0].save(path,
+                   save_all=True,
+                   append_images=images[1:],
+                   duration=1000.0 / frame_rate,
+                   loop=0)
+    return path
+
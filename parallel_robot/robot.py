@@ -1,7 +1,15 @@
 import numpy as np
 
+from .kernels import get_backend
+
 
 class ParallelRobot:
+    """Kinematic state of the robot.
+
+    The single point methods run on plain floats and the batch methods on
+    (N, 2) arrays, both with the kernels of a KinematicsBackend: backend
+    is its name, by default python (see get_backend).
+    """
 
     def __init__(self,
                  motor_distance: float,
@@ -9,23 +17,39 @@ class ParallelRobot:
                  link_arm_length: float,
                  tcp_offset: np.ndarray = np.array([0.0, 0.0]),
                  initial_joint_position: np.ndarray = np.array(
-                     [np.pi / 2, np.pi / 2])):
+                     [np.pi / 2, np.pi / 2]),
+                 backend=None):
         self._MOTOR_DISTANCE = motor_distance
         self._BASE_ARM_LENGTH = base_arm_length
         self._LINK_ARM_LENGTH = link_arm_length
         self._TCP_OFFSET = tcp_offset
 
+        self._backend = get_backend(backend)
+        # Parameters of the kernels
+        self._parameters = (float(motor_distance), float(base_arm_length),
+                            float(link_arm_length), float(tcp_offset[0]),
+                            float(tcp_offset[1]))
+
         self._joint_position = initial_joint_position
         self._cartesian_position = self.forward_kinematics(
             self._joint_position)
         self._drawing = False
 
+    def get_backend(self):
+        return self._backend
+
     def get_state(self):
         return (self._joint_position, self._cartesian_position, self._drawing)
 
     def set_drawing(self, drawing):
         self._drawing = drawing
 
+    def set_state(self, joint_position, cartesian_position, drawing):
+        """Sets precomputed positions, without any kinematics."""
+        self._joint_position = joint_position
+        self._cartesian_position = cartesian_position
+        self._drawing = drawing
+
     def set_joint_position(self, joint_position):
         self._joint_position = joint_position
         self._cartesian_position = self.forward_kinematics(
@@ -37,91 +61,164 @@ class ParallelRobot:
             self._cartesian_position)
 
     def in_workspace(self, cartesian_position):
-        x = cartesian_position[0]
-        y = cartesian_position[1]
-        x -= self._TCP_OFFSET[0]
-        y -= self._TCP_OFFSET[1]
-        in_area_1 = x**2 + y**2 >= (self._BASE_ARM_LENGTH -
-                                    self._LINK_ARM_LENGTH)**2
-        in_area_2 = (x - self._MOTOR_DISTANCE)**2 + y**2 >= (
-            self._BASE_ARM_LENGTH - self._LINK_ARM_LENGTH)**2
-        in_area_3 = x**2 + y**2 <= (self._BASE_ARM_LENGTH +
-                                    self._LINK_ARM_LENGTH)**2
-        in_area_4 = (x - self._MOTOR_DISTANCE)**2 + y**2 <= (
-            self._BASE_ARM_LENGTH + self._LINK_ARM_LENGTH)**2
-
-        return in_area_1 and in_area_2 and in_area_3 and in_area_4
+        x, y = cartesian_position
+        return bool(
+            self._backend.in_workspace_point(float(x), float(y),
+                                             *self._parameters))
 
     def forward_kinematics(self, joint_position: np.ndarray):
-
-        theta1 = joint_position[0]
-        theta4 = joint_position[1]
-
-        la = self._BASE_ARM_LENGTH
-        lb = self._LINK_ARM_LENGTH
-        lc = self._MOTOR_DISTANCE
-
-        # Constants based on the equations given
-        E = 2 * lb * (lc + la * (np.cos(theta4) - np.cos(theta1)))
-        F = 2 * la * lb * (np.sin(theta4) - np.sin(theta1))
-        G = lc**2 + 2 * la**2 + 2 * lc * la * np.cos(
-            theta4) - 2 * lc * la * np.cos(theta1) - 2 * la**2 * np.cos(
-                theta4 - theta1)
-
-        # Calculate x_p and y_p for both solutions
-        # positive_arctan = 2 * np.arctan(
-        #     (-F + np.sqrt(E**2 + F**2 - G**2)) / (G - E))
-        negative_arctan = 2 * np.arctan(
-            (-F - np.sqrt(E**2 + F**2 - G**2)) / (G - E))
-        # x_p1 = lc + la * np.cos(theta4) + lb * np.cos(positive_arctan)
-        x_p2 = lc + la * np.cos(theta4) + lb * np.cos(negative_arctan)
-        # y_p1 = la * np.sin(theta4) + lb * np.sin(positive_arctan)
-        y_p2 = la * np.sin(theta4) + lb * np.sin(negative_arctan)
-
-        # Apply offset
-        # x_p1 += self._TCP_OFFSET[0]
-        x_p2 += self._TCP_OFFSET[0]
-        # y_p1 += self._TCP_OFFSET[1]
-        y_p2 += self._TCP_OFFSET[1]
-        return np.array([x_p2, y_p2])
-        # return np.array([[x_p1, y_p1], [x_p2, y_p2]])
+        theta1, theta4 = joint_position
+        return np.array(
+            self._backend.forward_kinematics_point(float(theta1),
+                                                   float(theta4),
+                                                   *self._parameters))
 
     def inverse_kinematics(self, cartesian_position: np.ndarray):
-
-        x = cartesian_position[0]
-        y = cartesian_position[1]
-
-        la = self._BASE_ARM_LENGTH
-        lb = self._LINK_ARM_LENGTH
-        lc = self._MOTOR_DISTANCE
-
-        # Apply offset
-        x -= self._TCP_OFFSET[0]
-        y -= self._TCP_OFFSET[1]
-
-        # Constants based on the equations given for θ1
-        E1 = -2 * la * x
-        F1 = -2 * la * y
-        G1 = la**2 - lb**2 + x**2 + y**2
-
-        # Constants based on the equations given for θ4
-        E4 = 2 * la * (-x + lc)
-        F4 = -2 * la * y
-        G4 = lc**2 + la**2 - lb**2 + x**2 + y**2 - 2 * lc * x
-
-        # Calculate theta1 for both solutions
-        theta1_pos = 2 * np.arctan(
-            (-F1 + np.sqrt(E1**2 + F1**2 - G1**2)) / (G1 - E1))
-        # theta1_neg = 2 * np.arctan(
-        #     (-F1 - np.sqrt(E1**2 + F1**2 - G1**2)) / (G1 - E1))
-
-        # Calculate theta4 for both solutions
-        # theta4_pos = 2 * np.arctan(
-        #     (-F4 + np.sqrt(E4**2 + F4**2 - G4**2)) / (G4 - E4))
-        theta4_neg = 2 * np.arctan(
-            (-F4 - np.sqrt(E4**2 + F4**2 - G4**2)) / (G4 - E4))
-
-        # Return the four possible combinations of solutions
-        return np.array([theta1_pos, theta4_neg])
-        # return np.array([[theta1_pos, theta4_pos], [theta1_pos, theta4_neg],
-        #                  [theta1_neg, theta4_pos], [theta1_neg, theta4_neg]])
+        x, y = cartesian_position
+        return np.array(
+            self._backend.inverse_kinematics_point(float(x), float(y),
+                                                   *self._parameters))
+
+    def in_workspace_batch(self, cartesian_positions: np.ndarray):
+        """Returns a boolean mask of the (N, 2) positions in the workspace."""
+        return self._backend.in_workspace_batch(cartesian_positions,
+                                                *self._parameters)
+
+    def forward_kinematics_batch(self, joint_positions: np.ndarray):
+        """Returns the (N, 2) cartesian positions of (N, 2) joint positions."""
+        return self._backend.forward_kinematics_batch(joint_positions,
+                                                      *self._parameters)
+
+    def inverse_kinematics_batch(self, cartesian_positions: np.ndarray):
+        """Returns the (N, 2) joint positions of (N, 2) cartesian positions."""
+        return self._backend.inverse_kinematics_batch(cartesian_positions,
+                                                      *self._parameters)
+
+
+def in_workspace(cartesian_positions, motor_distance, base_arm_length,
+                 link_arm_length, tcp_offset):
+    """Returns a boolean mask of the (N, 2) positions inside the workspace.
+
+    The robot parameters are scalars, or arrays with one value per position
+    ((N, 2) for tcp_offset) to evaluate a different robot per row.
+    """
+    cartesian_positions = np.asarray(cartesian_positions, dtype=np.float64)
+    tcp_offset = np.asarray(tcp_offset)
+    x = cartesian_positions[:, 0] - tcp_offset[..., 0]
+    y = cartesian_positions[:, 1] - tcp_offset[..., 1]
+
+    # Squares as products, which NumPy and Python round the same way
+    arm_difference = base_arm_length - link_arm_length
+    arm_sum = base_arm_length + link_arm_length
+    inner_radius = arm_difference * arm_difference
+    outer_radius = arm_sum * arm_sum
+    x_2 = x - motor_distance
+    distance_1 = x * x + y * y
+    distance_2 = x_2 * x_2 + y * y
+
+    return ((distance_1 >= inner_radius) & (distance_2 >= inner_radius) &
+            (distance_1 <= outer_radius) & (distance_2 <= outer_radius))
+
+
+def forward_kinematics(joint_positions, motor_distance, base_arm_length,
+                       link_arm_length, tcp_offset):
+    """Returns the (N, 2) cartesian positions of (N, 2) joint positions."""
+    joint_positions = np.asarray(joint_positions, dtype=np.float64)
+    tcp_offset = np.asarray(tcp_offset)
+    theta1 = joint_positions[:, 0]
+    theta4 = joint_positions[:, 1]
+
+    la = base_arm_length
+    lb = link_arm_length
+    lc = motor_distance
+
+    cos_theta1 = np.cos(theta1)
+    cos_theta4 = np.cos(theta4)
+    sin_theta4 = np.sin(theta4)
+
+    # Constants based on the equations given
+    E = 2 * lb * (lc + la * (cos_theta4 - cos_theta1))
+    F = 2 * la * lb * (sin_theta4 - np.sin(theta1))
+    G = lc * lc + 2 * la * la + 2 * lc * la * cos_theta4 - \
+        2 * lc * la * cos_theta1 - 2 * la * la * np.cos(theta4 - theta1)
+
+    # Only the negative solution of the arctan is used (elbows out)
+    negative_arctan = 2 * np.arctan(
+        (-F - np.sqrt(E * E + F * F - G * G)) / (G - E))
+
+    # Apply offset
+    cartesian_positions = np.empty_like(joint_positions)
+    cartesian_positions[:, 0] = lc + la * cos_theta4 + lb * np.cos(
+        negative_arctan) + tcp_offset[..., 0]
+    cartesian_positions[:, 1] = la * sin_theta4 + lb * np.sin(
+        negative_arctan) + tcp_offset[..., 1]
+    return cartesian_positions
+
+
+def inverse_kinematics(cartesian_positions, motor_distance, base_arm_length,
+                       link_arm_length, tcp_offset):
+    """Returns the (N, 2) joint positions of (N, 2) cartesian positions."""
+    cartesian_positions = np.asarray(cartesian_positions, dtype=np.float64)
+    tcp_offset = np.asarray(tcp_offset)
+
+    la = base_arm_length
+    lb = link_arm_length
+    lc = motor_distance
+
+    # Apply offset
+    x = cartesian_positions[:, 0] - tcp_offset[..., 0]
+    y = cartesian_positions[:, 1] - tcp_offset[..., 1]
+
+    # Constants based on the equations given for θ1
+    E1 = -2 * la * x
+    F1 = -2 * la * y
+    G1 = la * la - lb * lb + x * x + y * y
+
+    # Constants based on the equations given for θ4
+    E4 = 2 * la * (-x + lc)
+    F4 = -2 * la * y
+    G4 = lc * lc + la * la - lb * lb + x * x + y * y - 2 * lc * x
+
+    # Positive solution for θ1 and negative solution for θ4
+    joint_positions = np.empty_like(cartesian_positions)
+    joint_positions[:, 0] = 2 * np.arctan(
+        (-F1 + np.sqrt(E1 * E1 + F1 * F1 - G1 * G1)) / (G1 - E1))
+    joint_positions[:, 1] = 2 * np.arctan(
+        (-F4 - np.sqrt(E4 * E4 + F4 * F4 - G4 * G4)) / (G4 - E4))
+    return joint_positions
+
+
+def condition_numbers(cartesian_positions,
+                      motor_distance,
+                      base_arm_length,
+                      link_arm_length,
+                      tcp_offset,
+                      step=1e-6):
+    """Returns the condition number of the Jacobian at (N, 2) positions.
+
+    The inverse Jacobian is estimated by central differences of the inverse
+    kinematics. Positions within step of the workspace boundary or of a
+    singularity give inf.
+    """
+    cartesian_positions = np.asarray(cartesian_positions, dtype=np.float64)
+    offsets = np.array([[step, 0.0], [-step, 0.0], [0.0, step],
+                        [0.0, -step]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        joint_positions = inverse_kinematics(
+            (cartesian_positions[:, None] + offsets).reshape(-1, 2),
+            motor_distance, base_arm_length, link_arm_length,
+            tcp_offset).reshape(-1, 4, 2)
+        # Columns d(joints)/dx and d(joints)/dy, with the angles unwrapped
+        columns = np.angle(
+            np.exp(1j * (joint_positions[:, 0::2] -
+                         joint_positions[:, 1::2]))) / (2 * step)
+        a, c = columns[:, 0, 0], columns[:, 0, 1]
+        b, d = columns[:, 1, 0], columns[:, 1, 1]
+        squared_norm = a**2 + b**2 + c**2 + d**2
+        determinant = np.abs(a * d - b * c)
+        # Ratio of the singular values of a 2x2 matrix
+        condition = (squared_norm + np.sqrt(
+            np.maximum(squared_norm**2 - 4 * determinant**2, 0.0))) / (
+                2 * determinant)
+    condition[~np.isfinite(condition)] = np.inf
+    return condition
@@ -0,0 +1,332 @@
+import asyncio
+import os
+import struct
+import threading
+import numpy as np
+
+from .tools import TELEMETRY_DTYPE
+
+# Every frame is a FRAME_HEADER (message type, reserved, payload size)
+# followed by its payload, little-endian:
+#   ADD_COMMANDS   client, N COMMAND_DTYPE rows
+#   COMMANDS_ADDED server, one COMMANDS_ADDED_DTYPE row
+#   SUBSCRIBE      client, uint32 decimation, 0 unsubscribes
+#   TELEMETRY      server, N TELEMETRY_WIRE_DTYPE rows
+#   PING, PONG     the payload is echoed back
+#   STATUS         client, empty, server, one STATUS_DTYPE row
+#   ERROR          server, UTF-8 message
+# The server answers the requests of a client in order. TELEMETRY frames are
+# pushed in between.
+FRAME_HEADER = struct.Struct('<HHI')
+ADD_COMMANDS = 1
+COMMANDS_ADDED = 2
+SUBSCRIBE = 3
+TELEMETRY = 4
+PING = 5
+PONG = 6
+STATUS = 7
+ERROR = 8
+
+MAX_PAYLOAD_SIZE = 2**26
+
+COMMAND_DTYPE = np.dtype({
+    'names': ['cartesian_position', 'drawing'],
+    'formats': [('<f8', (2, )), 'u1'],
+    'itemsize': 24,
+})
+COMMANDS_ADDED_DTYPE = np.dtype([('number_of_added_commands', '<i8')])
+STATUS_DTYPE = np.dtype([
+    ('sequence', '<i8'),
+    ('executing_command_index', '<i8'),
+    ('number_of_unfinished_commands', '<i8'),
+])
+TELEMETRY_WIRE_DTYPE = TELEMETRY_DTYPE.newbyteorder('<')
+SUBSCRIBE_PAYLOAD = struct.Struct('<I')
+
+
+def encode_frame(message_type, payload=b''):
+    return FRAME_HEADER.pack(message_type, 0, len(payload)) + payload
+
+
+async def read_frame(reader):
+    """Returns the (message type, payload) of the next frame."""
+    message_type, _, size = FRAME_HEADER.unpack(
+        await reader.readexactly(FRAME_HEADER.size))
+    if size > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Frame of {size} bytes, more than "
+                         f"{MAX_PAYLOAD_SIZE}.")
+    return message_type, await reader.readexactly(size)
+
+
+class _Client:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.task = asyncio.current_task()
+        self.decimation = 0
+        self.number_of_dropped_samples = 0
+
+
+class RobotServer:
+    """Command and telemetry server of a ParallelRobotSimulation.
+
+    Listens on a Unix domain socket at path, or on TCP at host and port,
+    and serves all clients from one event loop. Telemetry is read from the
+    history every poll_interval seconds and pushed to the subscribers with
+    their decimation. Samples are dropped for a subscriber whose socket
+    buffer exceeds max_buffer_size bytes instead of queueing them.
+    """
+
+    def __init__(self,
+                 robot_simulation,
+                 path=None,
+                 host='127.0.0.1',
+                 port=0,
+                 poll_interval=0.01,
+                 max_buffer_size=2**20):
+        self._robot_simulation = robot_simulation
+        self._telemetry_sharer = robot_simulation.get_telemetry_sharer()
+        self._command_sharer = robot_simulation.get_command_sharer()
+        self._path = path
+        self._host = host
+        self._port = port
+        self._poll_interval = poll_interval
+        self._max_buffer_size = max_buffer_size
+
+        self._server = None
+        self._clients = set()
+        self._telemetry_task = None
+        self._thread = None
+        self._loop = None
+        self._stopped = None
+
+    async def start(self):
+        """Starts listening, returns the socket address."""
+        if self._path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._serve_client, self._path)
+        else:
+            self._server = await asyncio.start_server(self._serve_client,
+                                                      self._host, self._port)
+        self._telemetry_task = asyncio.create_task(self._push_telemetry())
+        return self.get_address()
+
+    async def close(self):
+        self._telemetry_task.cancel()
+        self._server.close()
+        clients = list(self._clients)
+        for client in clients:
+            client.task.cancel()
+        await asyncio.gather(*[client.task for client in clients])
+        await self._server.wait_closed()
+        if self._path is not None and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def get_address(self):
+        """Returns the socket path, or the (host, port) listened on."""
+        return self._server.sockets[0].getsockname()
+
+    def start_thread(self):
+        """Runs the server on its own event loop in a daemon thread."""
+        started = threading.Event()
+        address = []
+
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._stopped = asyncio.Event()
+            address.append(await self.start())
+            started.set()
+            await self._stopped.wait()
+            await self.close()
+
+        self._thread = threading.Thread(target=asyncio.run,
+                                        args=(main(), ),
+                                        daemon=True)
+        self._thread.start()
+        started.wait()
+        return address[0]
+
+    def stop_thread(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join()
+        self._thread = None
+
+    async def _serve_client(self, reader, writer):
+        client = _Client(writer)
+        self._clients.add(client)
+        try:
+            while True:
+                message_type, payload = await read_frame(reader)
+                writer.write(await self._handle(client, message_type,
+                                                payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError,
+                asyncio.CancelledError):
+            # Cancelled by close()
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    async def _handle(self, client, message_type, payload):
+        if message_type == ADD_COMMANDS:
+            if len(payload) % COMMAND_DTYPE.itemsize:
+                return encode_frame(ERROR, b"Truncated commands.")
+            commands = np.frombuffer(payload, dtype=COMMAND_DTYPE)
+            points = commands['cartesian_position']
+            drawing = commands['drawing'].astype(bool)
+            added = self._robot_simulation.add_commands(points,
+                                                        drawing,
+                                                        block=False)
+            if added < len(commands):
+                # A full bounded queue, wait for space off the event loop
+                added += await asyncio.get_running_loop().run_in_executor(
+                    None, self._robot_simulation.add_commands,
+                    points[added:], drawing[added:])
+            return encode_frame(
+                COMMANDS_ADDED,
+                np.array([added], dtype=COMMANDS_ADDED_DTYPE).tobytes())
+        if message_type == SUBSCRIBE:
+            if len(payload) != SUBSCRIBE_PAYLOAD.size:
+                return encode_frame(ERROR, b"Invalid decimation.")
+            client.decimation, = SUBSCRIBE_PAYLOAD.unpack(payload)
+            return b''
+        if message_type == PING:
+            return encode_frame(PONG, payload)
+        if message_type == STATUS:
+            executing_command_index = \
+                self._command_sharer.get_executing_command_index()
+            status = np.array(
+                [(self._telemetry_sharer.get_sequence(),
+                  -1 if executing_command_index is None else
+                  executing_command_index,
+                  self._command_sharer.get_number_of_unfinished_commands())],
+                dtype=STATUS_DTYPE)
+            return encode_frame(STATUS, status.tobytes())
+        return encode_frame(ERROR,
+                            f"Unknown message {message_type}.".encode())
+
+    async def _push_telemetry(self):
+        sequence = self._telemetry_sharer.get_sequence()
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            samples, sequence, _ = \
+                self._telemetry_sharer.get_telemetry_since(sequence)
+            if len(samples) == 0:
+                continue
+            # One frame per decimation, shared by its subscribers
+            frames = {}
+            for client in list(self._clients):
+                transport = client.writer.transport
+                if client.decimation == 0 or transport.is_closing():
+                    continue
+                if client.decimation not in frames:
+                    decimated = samples[samples['sequence'] %
+                                        client.decimation == 0].astype(
+                                            TELEMETRY_WIRE_DTYPE, copy=False)
+                    frames[client.decimation] = (len(decimated),
+                                                 encode_frame(
+                                                     TELEMETRY,
+                                                     decimated.tobytes()))
+                number_of_samples, frame = frames[client.decimation]
+                if number_of_samples == 0:
+                    continue
+                if transport.get_write_buffer_size() > self._max_buffer_size:
+                    client.number_of_dropped_samples += number_of_samples
+                    continue
+                client.writer.write(frame)
+
+
+class RobotClient:
+    """asyncio client of a RobotServer.
+
+    Create it with connect(). Requests are answered in order, the pushed
+    telemetry is queued until read by telemetry().
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._responses = asyncio.Queue()
+        self._telemetry = asyncio.Queue()
+        self._receive_task = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, path=None, host='127.0.0.1', port=None):
+        """Connects to the Unix domain socket at path or to host and port."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self):
+        self._receive_task.cancel()
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def _receive(self):
+        try:
+            while True:
+                message_type, payload = await read_frame(self._reader)
+                if message_type == TELEMETRY:
+                    self._telemetry.put_nowait(
+                        np.frombuffer(payload, dtype=TELEMETRY_WIRE_DTYPE))
+                else:
+                    self._responses.put_nowait((message_type, payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            self._responses.put_nowait((ERROR, str(error).encode()))
+            self._telemetry.put_nowait(None)
+
+    async def _request(self, message_type, payload, response_type):
+        self._writer.write(encode_frame(message_type, payload))
+        await self._writer.drain()
+        received_type, payload = await self._responses.get()
+        if received_type == ERROR:
+            raise RuntimeError(payload.decode())
+        if received_type != response_type:
+            raise RuntimeError(f"Unexpected message {received_type}.")
+        return payload
+
+    async def add_commands(self, points, drawing):
+        """Enqueues (N, 2) points and drawing flags, returns the number added.
+
+        Returns once the server queued all of them.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        commands = np.zeros(len(points), dtype=COMMAND_DTYPE)
+        commands['cartesian_position'] = points
+        commands['drawing'] = np.broadcast_to(drawing, (len(points), ))
+        payload = await self._request(ADD_COMMANDS, commands.tobytes(),
+                                      COMMANDS_ADDED)
+        return int(np.frombuffer(payload, dtype=COMMANDS_ADDED_DTYPE)[0][0])
+
+    async def subscribe(self, decimation=1):
+        """Receives every decimation-th sample from now on, 0 to stop."""
+        self._writer.write(
+            encode_frame(SUBSCRIBE, SUBSCRIBE_PAYLOAD.pack(decimation)))
+        await self._writer.drain()
+
+    async def telemetry(self):
+        """Yields the TELEMETRY_DTYPE arrays pushed by the server."""
+        while True:
+            samples = await self._telemetry.get()
+            if samples is None:
+                return
+            yield samples
+
+    async def ping(self, payload=b''):
+        return await self._request(PING, payload, PONG)
+
+    async def get_status(self):
+        """Returns a STATUS_DTYPE record of the server robot."""
+        payload = await self._request(STATUS, b'', STATUS)
+        return np.frombuffer(payload, dtype=STATUS_DTYPE)[0]
+
+    async def wait_idle(self, poll_interval=0.01):
+        """Returns once the server has no unfinished command."""
+        while (await self.get_status())['number_of_unfinished_commands']:
+            await asyncio.sleep(poll_interval)
+
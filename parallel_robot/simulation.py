@@ -1,51 +1,430 @@
-from .tools import TimeManager, Telemetry
+import numpy as np
+from collections import deque
+from time import perf_counter_ns
+
+from .tools import (TimeManager, VirtualTimeManager, CommandResult,
+                    StageProfiler)
 from .robot import ParallelRobot
+from .planner import LookAheadPlanner
 from .trajectories import constant_velocity
 
 SAMPLING_TIME = 0.001
 
+# Stages timed by the profiler of a Simulation. Time between two stages is
+# counted in the second one, and tick is the whole step
+PROFILING_STAGES = ('tick', 'publish', 'get_command', 'trajectory',
+                    'kinematics', 'task_done', 'planning', 'replay')
+(_TICK, _PUBLISH, _GET_COMMAND, _TRAJECTORY, _KINEMATICS, _TASK_DONE,
+ _PLANNING, _REPLAY) = range(len(PROFILING_STAGES))
+
+
+class Simulation:
+    """Executes the queued commands, one sampling period per step.
+
+    By default every command is a constant velocity move that stops at its
+    point. With motion_limits (a MotionLimits) the queued commands are
+    planned together by a LookAheadPlanner. The stages of every step are
+    timed while the StageProfiler of PROFILING_STAGES is enabled.
+
+    Samples outside the workspace are skipped, which holds the robot, but
+    constant velocity moves of validated commands are not checked when they
+    start at the position validate_commands checked them from.
+    """
+
+    def __init__(self,
+                 telemetry_sharer,
+                 command_sharer,
+                 robot_configuration,
+                 motion_limits=None,
+                 profiler=None):
+        self._telemetry_sharer = telemetry_sharer
+        self._command_sharer = command_sharer
+
+        if profiler is None:
+            profiler = StageProfiler(PROFILING_STAGES)
+        self._profiler = profiler
+        self._profiling_flag = profiler.get_flag()
+        self._profiling = False
+        self._lap_start = 0
 
-def simulation(stop_event, telemetry_sharer, command_sharer,
-               robot_configuration):
-    try:
         # Robot
-        parallel_robot = ParallelRobot(*robot_configuration)
+        self._parallel_robot = ParallelRobot(*robot_configuration)
+
+        self._planner = None
+        if motion_limits is not None:
+            self._planner = LookAheadPlanner(robot_configuration,
+                                             motion_limits, SAMPLING_TIME)
+            # Plan, unfiltered samples of the moving average and statistics
+            # of the taken commands by command number
+            self._plan_positions = np.empty((0, 2))
+            self._plan_drawing = np.empty(0, dtype=bool)
+            self._plan_base = 0
+            self._command_indices = np.empty(0, dtype=np.int64)
+            self._command_offsets = np.empty(0)
+            self._sample_speeds = np.empty(0)
+            self._filter = deque(
+                [(self._parallel_robot.get_state()[1], -1)],
+                maxlen=self._planner.get_filter_length())
+            self._number_of_flush_samples = 0
+            self._number_of_planned_commands = 0
+            self._number_of_finished_commands = 0
+            self._command_statistics = {}
+
+        # Job being replayed, after the move to its first setpoint
+        self._replay_job = None
+        self._replay_start = 0
+        self._replay_approach = np.empty(0)
+        self._replay_setpoints = np.empty(0)
+        self._replay_counter = 0
+        self._replay_length = 0
+        self._replay_command_index = 0
+        self._replay_next_command = 0
+
+        # Commands are numbered from 0 in the order they are taken. The
+        # telemetry of every state holds the command that reached it, or the
+        # compiled job command while replaying
+        self._number_of_taken_commands = 0
+        self._command_index = -1
 
-        # Clock to control the frame rate
-        time_manager = TimeManager(SAMPLING_TIME)
+        self._counter = 0
+        self._trajectory = np.empty((0, 2))
+        self._trajectory_length = 0
+        self._number_of_samples = 0
+        # Whether the samples of the trajectory are checked
+        self._check_workspace = True
 
-        counter = 0
-        trajectory = []
-        # Main game loop
-        while not stop_event.is_set():
+        # Statistics of the command being executed
+        self._start_time = 0.0
+        self._finish_time = 0.0
+        self._number_of_rejected_samples = 0
 
+    def is_idle(self):
+        """True when no trajectory is running and no command is queued."""
+        return (self._replay_counter == self._replay_length and
+                self._command_sharer.get_number_of_unfinished_commands() == 0)
+
+    def replay(self, compiled_job, start_command=0):
+        """Replays a CompiledJob from start_command, while idle.
+
+        Every period copies the next setpoint from the memory map, without
+        any kinematics. When the robot is not where start_command starts,
+        it first moves there at constant velocity with the pen up. Queued
+        commands run after the job.
+        """
+        if not self.is_idle():
+            raise ValueError("Jobs can only be replayed while idle.")
+        if compiled_job.get_sampling_time() != SAMPLING_TIME:
+            raise ValueError(
+                f"The job was compiled for a sampling time of "
+                f"{compiled_job.get_sampling_time()} s, not {SAMPLING_TIME}.")
+        setpoints = compiled_job.get_setpoints(start_command)
+        approach = np.empty(0, dtype=setpoints.dtype)
+        _, start_position = compiled_job.get_start_position(start_command)
+        position = self._parallel_robot.get_state()[1]
+        if not np.array_equal(position, start_position):
+            trajectory = constant_velocity(position, start_position,
+                                           compiled_job.get_max_velocity(),
+                                           SAMPLING_TIME)
+            approach = np.zeros(len(trajectory), dtype=setpoints.dtype)
+            approach['cartesian_position'] = trajectory
+            approach['joint_position'] = \
+                self._parallel_robot.inverse_kinematics_batch(trajectory)
+        self._replay_job = compiled_job
+        self._replay_start = compiled_job.get_first_setpoint(start_command)
+        self._replay_approach = approach
+        self._replay_setpoints = setpoints
+        self._replay_counter = 0
+        self._replay_length = len(approach) + len(setpoints)
+        self._replay_command_index = start_command
+        # Replay counter of the first setpoint of the next command
+        self._replay_next_command = len(approach) + (
+            compiled_job.get_first_setpoint(start_command + 1) -
+            self._replay_start if start_command <
+            compiled_job.get_number_of_commands() else 0)
+
+    def get_profiler(self):
+        return self._profiler
+
+    def _lap(self, stage):
+        # Records the time since the previous lap into stage
+        now = perf_counter_ns()
+        self._profiler.record(stage, now - self._lap_start)
+        self._lap_start = now
+
+    def get_replay_command_index(self):
+        """Returns the job command being replayed, None when not replaying.
+
+        A job interrupted there can be replayed again from this command.
+        """
+        if self._replay_counter == self._replay_length:
+            return None
+        # Moving to the start of the first command counts as that command
+        return self._replay_command_index
+
+    def step(self):
+        """Runs a single sampling period of the simulation."""
+        parallel_robot = self._parallel_robot
+        profiling = self._profiling = self._profiling_flag[0]
+        if profiling:
+            tick_start = self._lap_start = perf_counter_ns()
+
+        try:
             state = parallel_robot.get_state()
-            telemetry = Telemetry(*state)
-            telemetry_sharer.update_telemetry(telemetry)
+            timestamp = self._number_of_samples * SAMPLING_TIME
+            self._telemetry_sharer.publish(*state, timestamp,
+                                           self._command_index)
+            self._number_of_samples += 1
+            if profiling:
+                self._lap(_PUBLISH)
+
+            if self._replay_counter < self._replay_length:
+                self._replay_step()
+                if profiling:
+                    self._lap(_REPLAY)
+                return
 
-            if counter == 0:
-                command = command_sharer.get_command()
+            if self._planner is not None:
+                self._planned_step(state, timestamp)
+                return
+
+            if self._counter == 0:
+                command = self._command_sharer.get_command()
+                if profiling:
+                    self._lap(_GET_COMMAND)
                 if command is not None:
-                    trajectory = constant_velocity(state[1],
-                                                   command.cartesian_position,
-                                                   0.2, SAMPLING_TIME)
+                    self._trajectory = constant_velocity(
+                        state[1], command.cartesian_position, 0.2,
+                        SAMPLING_TIME)
+                    self._trajectory_length = len(self._trajectory)
+                    self._check_workspace = not (
+                        command.validated_start is not None and
+                        np.array_equal(state[1], command.validated_start))
                     parallel_robot.set_drawing(command.drawing)
+                    self._command_index = self._number_of_taken_commands
+                    self._number_of_taken_commands += 1
+                    self._start_time = timestamp
+                    self._number_of_rejected_samples = 0
+                    if profiling:
+                        self._lap(_TRAJECTORY)
 
-            if counter < len(trajectory):
-                if parallel_robot.in_workspace(trajectory[counter]):
-                    parallel_robot.set_cartesian_position(trajectory[counter])
-                counter += 1
+            if self._counter < self._trajectory_length:
+                position = self._trajectory[self._counter]
+                if (not self._check_workspace or
+                        parallel_robot.in_workspace(position)):
+                    parallel_robot.set_cartesian_position(position)
+                else:
+                    self._number_of_rejected_samples += 1
+                self._finish_time = timestamp
+                self._counter += 1
+                if profiling:
+                    self._lap(_KINEMATICS)
             else:
-                counter = 0
-                trajectory = []
+                if self._trajectory_length > 0:
+                    self._command_sharer.task_done(
+                        CommandResult(self._start_time, self._finish_time,
+                                      self._trajectory_length,
+                                      self._number_of_rejected_samples))
+                self._counter = 0
+                self._trajectory_length = 0
                 # parallel_robot.set_drawing(False)
+                if profiling:
+                    self._lap(_TASK_DONE)
+        finally:
+            if profiling:
+                self._profiler.record(_TICK, perf_counter_ns() - tick_start)
+
+    def _replay_step(self):
+        if self._replay_counter == self._replay_next_command:
+            self._replay_command_index += 1
+            self._replay_next_command += self._replay_job.get_commands()[
+                self._replay_command_index]['number_of_setpoints']
+        self._command_index = self._replay_command_index
+        counter = self._replay_counter - len(self._replay_approach)
+        if counter < 0:
+            setpoint = self._replay_approach[counter]
+        else:
+            setpoint = self._replay_setpoints[counter]
+        self._parallel_robot.set_state(setpoint['joint_position'],
+                                       setpoint['cartesian_position'],
+                                       bool(setpoint['drawing']))
+        self._replay_counter += 1
+
+    def _planned_step(self, state, timestamp):
+        # Commands are numbered from 0 in the order they are taken. The plan
+        # produces unfiltered samples, and the robot executes their moving
+        # average, labelled with the command of the middle sample
+        command_sharer = self._command_sharer
+        look_ahead = self._planner.get_look_ahead()
+
+        if self._counter == self._trajectory_length:
+            if self._number_of_flush_samples < len(self._filter) - 1:
+                # Let the filter reach the last point
+                self._filter.append(self._filter[-1])
+                self._number_of_flush_samples += 1
+            else:
+                self._finish_commands(self._number_of_planned_commands,
+                                      timestamp)
+                if self._profiling:
+                    self._lap(_TASK_DONE)
+                self._counter = self._trajectory_length = 0
+                skip = (self._number_of_planned_commands -
+                        self._number_of_taken_commands)
+                points, drawing = command_sharer.peek_commands(skip +
+                                                               look_ahead)
+                if len(points) <= skip:
+                    return
+                self._start_plan(
+                    np.concatenate((state[1][None], points[skip:])),
+                    drawing[skip:], self._number_of_planned_commands)
+                self._filter.extend([(state[1], self._plan_base)] *
+                                    (self._filter.maxlen - 1))
+                if self._profiling:
+                    self._lap(_PLANNING)
+
+        if self._counter < self._trajectory_length:
+            counter = self._counter
+            position = self._trajectory[counter]
+            command_index = self._plan_base + self._command_indices[counter]
+            self._filter.append((position, command_index))
+            self._number_of_flush_samples = 0
+            self._counter += 1
+
+            # Replace the plan before it slows down if more commands came.
+            # The new plan starts from the previous command, so the path of
+            # the current command keeps its blends
+            plan_end = self._plan_base + len(self._plan_drawing)
+            if (command_index < plan_end - 1 and
+                    plan_end - command_index < look_ahead // 2 and
+                    self._number_of_taken_commands +
+                    command_sharer.get_number_of_commands() > plan_end):
+                skip = plan_end - self._number_of_taken_commands
+                points, drawing = command_sharer.peek_commands(
+                    skip + look_ahead - (plan_end - command_index))
+                local_index = command_index - self._plan_base
+                first = max(local_index - 1, 0)
+                self._start_plan(
+                    np.concatenate((self._plan_positions[first:],
+                                    points[skip:])),
+                    np.concatenate((self._plan_drawing[first:],
+                                    drawing[skip:])),
+                    self._plan_base + first,
+                    self._sample_speeds[counter], local_index - first,
+                    self._command_offsets[counter])
+
+        # Moving average of the unfiltered samples
+        positions = [position for position, _ in self._filter]
+        if self._number_of_flush_samples == len(positions) - 1:
+            # Only the last point is left, which the mean may round
+            target = positions[-1]
+        else:
+            target = np.mean(positions, axis=0)
+        command_index = self._filter[len(self._filter) // 2][1]
+        if self._profiling:
+            self._lap(_PLANNING)
+        self._finish_commands(command_index, timestamp)
+        if self._profiling:
+            self._lap(_TASK_DONE)
+        while self._number_of_taken_commands <= command_index:
+            self._take_command(timestamp)
+        self._command_index = command_index
+        if self._profiling:
+            self._lap(_GET_COMMAND)
+
+        statistics = self._command_statistics[command_index]
+        if self._parallel_robot.in_workspace(target):
+            self._parallel_robot.set_cartesian_position(target)
+        else:
+            statistics[3] += 1
+        statistics[1] = timestamp
+        statistics[2] += 1
+        if self._profiling:
+            self._lap(_KINEMATICS)
+
+    def _start_plan(self,
+                    positions,
+                    drawing,
+                    base,
+                    speed=0.0,
+                    start_command=0,
+                    start_offset=0.0):
+        # positions starts with the initial position, followed by the
+        # points of the commands numbered from base
+        (self._trajectory, self._command_indices, self._command_offsets,
+         self._sample_speeds) = self._planner.plan(positions[0],
+                                                   positions[1:], drawing,
+                                                   speed, start_command,
+                                                   start_offset)
+        self._trajectory_length = len(self._trajectory)
+        self._counter = 0
+        self._plan_positions = positions
+        self._plan_drawing = drawing
+        self._plan_base = base
+        self._number_of_planned_commands = base + len(drawing)
+
+    def _take_command(self, timestamp):
+        command = self._command_sharer.get_command()
+        self._parallel_robot.set_drawing(command.drawing)
+        self._command_statistics[self._number_of_taken_commands] = [
+            timestamp, timestamp, 0, 0
+        ]
+        self._number_of_taken_commands += 1
+
+    def _finish_commands(self, end_index, timestamp):
+        # Marks the commands before end_index as finished
+        while self._number_of_finished_commands < end_index:
+            index = self._number_of_finished_commands
+            if index == self._number_of_taken_commands:
+                # A command without samples of its own
+                self._take_command(timestamp)
+            start_time, finish_time, number_of_samples, \
+                number_of_rejected_samples = self._command_statistics.pop(
+                    index)
+            self._command_sharer.task_done(
+                CommandResult(start_time, finish_time, number_of_samples,
+                              number_of_rejected_samples))
+            self._number_of_finished_commands += 1
+
+    def run(self, stop_event, time_manager):
+        try:
+            # Main game loop
+            while not stop_event.is_set():
+                self.step()
+
+                # Control frequency
+                time_manager.adaptive_sleep()
+
+        except Exception as e:
+            print(f"Exception {e}. Stopping simulation.")
+            stop_event.set()
+
+    def run_until_idle(self, stop_event, time_manager):
+        """Runs sampling periods until the simulation becomes idle."""
+        try:
+            while not stop_event.is_set() and not self.is_idle():
+                self.step()
+                time_manager.adaptive_sleep()
+
+        except Exception as e:
+            print(f"Exception {e}. Stopping simulation.")
+            stop_event.set()
+
 
-            # Control frequency
-            time_manager.adaptive_sleep()
+def simulation(stop_event,
+               telemetry_sharer,
+               command_sharer,
+               robot_configuration,
+               real_time=True,
+               pacing='sleep',
+               motion_limits=None,
+               profiler=None):
+    # Clock to control the frame rate
+    if real_time:
+        time_manager = TimeManager(SAMPLING_TIME, pacing)
+    else:
+        time_manager = VirtualTimeManager(SAMPLING_TIME)
 
-    except Exception as e:
-        print(f"Exception {e}. Stopping simulation.")
-        stop_event.set()
+    Simulation(telemetry_sharer, command_sharer, robot_configuration,
+               motion_limits, profiler).run(stop_event, time_manager)
 
 
 if __name__ == "__main__":
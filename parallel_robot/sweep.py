@@ -0,0 +1,232 @@
+import itertools
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from .jobs import estimate_execution_time
+from .planner import LookAheadPlanner
+from .robot import condition_numbers, forward_kinematics, in_workspace
+from .simulation import SAMPLING_TIME
+from .tools import RobotConfiguration
+from .workspace_grid import sample_segments
+
+
+@dataclass
+class SweepResult:
+    """Evaluation of a candidate robot configuration on a job.
+
+    reachable_fraction is the fraction of the job commands whose target and
+    move are inside the workspace. drawing_area is the area in square metres
+    of the workspace where the condition number of the Jacobian is at most
+    the max_condition_number of the sweep. max_condition_number is the
+    largest condition number along the reachable moves of the job, inf if
+    they cross a singularity or none is reachable.
+    """
+    index: int
+    robot_configuration: RobotConfiguration
+    reachable_fraction: float
+    execution_time: float
+    drawing_area: float
+    max_condition_number: float
+
+
+def configuration_grid(motor_distances,
+                       base_arm_lengths,
+                       link_arm_lengths,
+                       tcp_offsets=(np.array([0.0, 0.0]), ),
+                       initial_joint_position=np.array([np.pi / 2,
+                                                        np.pi / 2])):
+    """Returns the RobotConfiguration of every combination of the values."""
+    return [
+        RobotConfiguration(float(motor_distance), float(base_arm_length),
+                           float(link_arm_length),
+                           np.asarray(tcp_offset, dtype=np.float64),
+                           initial_joint_position)
+        for motor_distance, base_arm_length, link_arm_length, tcp_offset in
+        itertools.product(motor_distances, base_arm_lengths,
+                          link_arm_lengths, tcp_offsets)
+    ]
+
+
+def configuration_samples(number_of_samples,
+                          motor_distance_range,
+                          base_arm_length_range,
+                          link_arm_length_range,
+                          tcp_offset_range=((0.0, 0.0), (0.0, 0.0)),
+                          initial_joint_position=np.array(
+                              [np.pi / 2, np.pi / 2]),
+                          seed=None):
+    """Returns configurations drawn uniformly from (low, high) ranges.
+
+    tcp_offset_range is the (low, high) pair of (x, y) offsets.
+    """
+    rng = np.random.default_rng(seed)
+    lows, highs = np.array([
+        motor_distance_range, base_arm_length_range, link_arm_length_range,
+        *np.transpose(tcp_offset_range)
+    ],
+                           dtype=np.float64).T
+    values = rng.uniform(lows, highs, (number_of_samples, 5))
+    return [
+        RobotConfiguration(float(row[0]), float(row[1]), float(row[2]),
+                           row[3:5].copy(), initial_joint_position)
+        for row in values
+    ]
+
+
+def _parameters(robot_configuration):
+    return (robot_configuration.motor_distance,
+            robot_configuration.base_arm_length,
+            robot_configuration.link_arm_length,
+            np.asarray(robot_configuration.tcp_offset, dtype=np.float64))
+
+
+def drawing_area(robot_configuration, max_condition_number, resolution):
+    """Returns the well conditioned area of the workspace in square metres.
+
+    Counts the cells of a resolution grid whose centre is in the workspace
+    with a condition number at most max_condition_number.
+    """
+    motor_distance, base_arm_length, link_arm_length, tcp_offset = \
+        _parameters(robot_configuration)
+    reach = base_arm_length + link_arm_length
+    x = np.arange(-reach, reach + motor_distance, resolution) + \
+        resolution / 2 + tcp_offset[0]
+    y = np.arange(-reach, reach, resolution) + resolution / 2 + tcp_offset[1]
+    points = np.stack(np.meshgrid(x, y), axis=-1).reshape(-1, 2)
+    points = points[in_workspace(points, motor_distance, base_arm_length,
+                                 link_arm_length, tcp_offset)]
+    well_conditioned = condition_numbers(
+        points, motor_distance, base_arm_length, link_arm_length,
+        tcp_offset) <= max_condition_number
+    return float(np.count_nonzero(well_conditioned) * resolution**2)
+
+
+def evaluate_configuration(robot_configuration,
+                           points,
+                           drawing,
+                           max_velocity=0.2,
+                           motion_limits=None,
+                           max_condition_number=10.0,
+                           resolution=0.002,
+                           index=0):
+    """Returns the SweepResult of a configuration on a job.
+
+    The execution time is estimated for the constant velocity moves at
+    max_velocity, or for the trajectory of the look-ahead planner with
+    motion_limits, from the initial joint position of the configuration.
+    The job is sampled every resolution metres along its moves and for the
+    drawing area.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    parameters = _parameters(robot_configuration)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        initial_position = forward_kinematics(
+            np.asarray(robot_configuration.initial_joint_position,
+                       dtype=np.float64)[None], *parameters)[0]
+
+    # A robot that cannot be assembled at its initial joint position misses
+    # the first move and is assumed to start at the first point
+    assembled = bool(np.all(np.isfinite(initial_position)))
+    if not assembled and len(points):
+        initial_position = points[0]
+
+    samples, segments = sample_segments(
+        np.concatenate((initial_position[None], points)), resolution)
+    reachable = in_workspace(samples, *parameters)
+    reachable_moves = np.ones(len(points), dtype=bool)
+    reachable_moves[segments[~reachable]] = False
+    reachable_moves[:1] &= assembled
+    conditions = condition_numbers(samples[reachable], *parameters)
+
+    if motion_limits is None:
+        execution_time = estimate_execution_time(points, initial_position,
+                                                 max_velocity)
+    else:
+        planner = LookAheadPlanner(robot_configuration, motion_limits,
+                                   SAMPLING_TIME)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trajectory, _, _, _ = planner.plan(initial_position, points,
+                                               drawing)
+        execution_time = len(trajectory) * SAMPLING_TIME
+
+    return SweepResult(
+        index, robot_configuration,
+        float(np.mean(reachable_moves)) if len(points) else 1.0,
+        execution_time,
+        drawing_area(robot_configuration, max_condition_number, resolution),
+        float(conditions.max()) if len(conditions) else np.inf)
+
+
+# Job and options of the worker processes, set once by _initialize_worker
+_worker_job = None
+
+
+def _initialize_worker(points, drawing, options):
+    global _worker_job
+    _worker_job = (points, drawing, options)
+
+
+def _evaluate_chunk(first_index, robot_configurations):
+    points, drawing, options = _worker_job
+    return [
+        evaluate_configuration(robot_configuration,
+                               points,
+                               drawing,
+                               index=first_index + i,
+                               **options)
+        for i, robot_configuration in enumerate(robot_configurations)
+    ]
+
+
+def sweep_configurations(robot_configurations,
+                         points,
+                         drawing,
+                         max_velocity=0.2,
+                         motion_limits=None,
+                         max_condition_number=10.0,
+                         resolution=0.002,
+                         max_workers=None,
+                         chunk_size=16):
+    """Evaluates the configurations on a job in a process pool.
+
+    Yields a SweepResult per configuration as the chunks of chunk_size
+    configurations complete, so not in order: the index of a result is the
+    position of its configuration. The job is sent once to every worker.
+    With max_workers=1 the configurations are evaluated in this process.
+    """
+    robot_configurations = list(robot_configurations)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                              (len(points), )).copy()
+    options = {
+        'max_velocity': max_velocity,
+        'motion_limits': motion_limits,
+        'max_condition_number': max_condition_number,
+        'resolution': resolution,
+    }
+    chunks = [(i, robot_configurations[i:i + chunk_size])
+              for i in range(0, len(robot_configurations), chunk_size)]
+
+    if max_workers == 1:
+        _initialize_worker(points, drawing, options)
+        for chunk in chunks:
+            yield from _evaluate_chunk(*chunk)
+        return
+
+    max_workers = min(max_workers or os.cpu_count(), max(len(chunks), 1))
+    with ProcessPoolExecutor(max_workers,
+                             initializer=_initialize_worker,
+                             initargs=(points, drawing, options)) as executor:
+        futures = [
+            executor.submit(_evaluate_chunk, *chunk) for chunk in chunks
+        ]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            # Stops early when the caller stops iterating
+            for future in futures:
+                future.cancel()
+
@@ -1,9 +1,10 @@
 import time
 import threading
 import queue
+from collections import deque
+from concurrent.futures import Future
 from dataclasses import dataclass, astuple
 import numpy as np
-from copy import deepcopy
 
 
 @dataclass(frozen=True)
@@ -29,70 +30,687 @@ class Telemetry:
 class Command:
     cartesian_position: np.ndarray
     drawing: bool
+    # Start position from which validate_commands checked the move, None
+    # if it was not validated
+    validated_start: np.ndarray = None
+
+
+@dataclass
+class CommandResult:
+    start_time: float
+    finish_time: float
+    number_of_samples: int
+    number_of_rejected_samples: int
+
+
+TELEMETRY_DTYPE = np.dtype([
+    ('sequence', np.int64),
+    ('timestamp', np.float64),
+    ('joint_position', np.float64, (2, )),
+    ('cartesian_position', np.float64, (2, )),
+    ('drawing', np.bool_),
+    ('command_index', np.int64),
+])
+
+
+def buffer_array(buffer, offset, shape, dtype):
+    """Returns an array placed at offset in buffer and the offset after it."""
+    array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+    return array, offset + array.nbytes
+
+
+class TelemetryHistory:
+    """Fixed capacity ring buffer of the last published telemetry samples.
+
+    Samples are stored as rows of TELEMETRY_DTYPE. As with the
+    TelemetrySharer buffers, a single writer appends and readers validate
+    their copy against the sequence being written. The ring is placed in
+    the given buffer, e.g. shared memory, or in a new one.
+    """
+
+    def __init__(self, capacity: int, buffer=None):
+        if buffer is None:
+            buffer = bytearray(TelemetryHistory.get_buffer_size(capacity))
+        self._capacity = capacity
+        # Sequence of the last sample and of the sample being written
+        self._counters, offset = buffer_array(buffer, 0, 2, np.int64)
+        self._samples, _ = buffer_array(buffer, offset, capacity,
+                                        TELEMETRY_DTYPE)
+        self._sequences = self._samples['sequence']
+        self._timestamps = self._samples['timestamp']
+        self._joint_positions = self._samples['joint_position']
+        self._cartesian_positions = self._samples['cartesian_position']
+        self._drawings = self._samples['drawing']
+        self._command_indices = self._samples['command_index']
+
+    @staticmethod
+    def get_buffer_size(capacity):
+        return (2 * np.dtype(np.int64).itemsize +
+                capacity * TELEMETRY_DTYPE.itemsize)
+
+    def get_capacity(self):
+        return self._capacity
+
+    def append(self,
+               sequence,
+               timestamp,
+               joint_position,
+               cartesian_position,
+               drawing,
+               command_index=-1):
+        index = sequence % self._capacity
+        self._counters[1] = sequence
+        self._sequences[index] = sequence
+        self._timestamps[index] = timestamp
+        self._joint_positions[index] = joint_position
+        self._cartesian_positions[index] = cartesian_position
+        self._drawings[index] = drawing
+        self._command_indices[index] = command_index
+        self._counters[0] = sequence
+
+    def get_since(self, sequence):
+        """Returns the samples published after the given sequence number.
+
+        Returns a tuple with a TELEMETRY_DTYPE array, the sequence number of
+        the last sample and an overrun flag, set when samples after the given
+        sequence were already overwritten and are missing from the array.
+        """
+        last_sequence = int(self._counters[0])
+        first_sequence = max(sequence + 1, last_sequence - self._capacity + 1,
+                             1)
+        overrun = first_sequence > sequence + 1
+        if first_sequence > last_sequence:
+            return (np.empty(0, dtype=TELEMETRY_DTYPE), last_sequence,
+                    overrun)
+
+        first_index = first_sequence % self._capacity
+        last_index = last_sequence % self._capacity
+        if first_index <= last_index:
+            samples = self._samples[first_index:last_index + 1].copy()
+        else:
+            samples = np.concatenate((self._samples[first_index:],
+                                      self._samples[:last_index + 1]))
+
+        # Drop the samples the writer overwrote while they were being copied
+        oldest_valid_sequence = int(self._counters[1]) - self._capacity + 1
+        if oldest_valid_sequence > first_sequence:
+            samples = samples[oldest_valid_sequence - first_sequence:]
+            overrun = True
+
+        return samples, last_sequence, overrun
 
 
 class TelemetrySharer:
+    """Single writer, many readers telemetry publisher.
 
-    def __init__(self):
-        self._telemetry = None
-        self._lock = threading.Lock()
+    The writer alternates between two preallocated buffers and publishes a
+    sequence number once a buffer is complete. Readers copy the buffer of the
+    latest sequence and retry if the writer started overwriting it meanwhile,
+    so neither side allocates or takes a lock. All the state lives in one
+    buffer, so the sharer can be placed in shared memory.
+    """
+
+    def __init__(self, history_capacity: int = 10000, buffer=None):
+        if buffer is None:
+            buffer = bytearray(
+                TelemetrySharer.get_buffer_size(history_capacity))
+        buffer = memoryview(buffer)
+        # Sequence of the last sample and of the sample being written
+        self._counters, offset = buffer_array(buffer, 0, 2, np.int64)
+        # Row layout: joint position (2), cartesian position (2), drawing
+        self._buffers, offset = buffer_array(buffer, offset, (2, 5),
+                                             np.float64)
+        self._joint_positions = [row[0:2] for row in self._buffers]
+        self._cartesian_positions = [row[2:4] for row in self._buffers]
+
+        self._history = TelemetryHistory(history_capacity, buffer[offset:])
+
+    @staticmethod
+    def get_buffer_size(history_capacity):
+        return (2 * np.dtype(np.int64).itemsize +
+                10 * np.dtype(np.float64).itemsize +
+                TelemetryHistory.get_buffer_size(history_capacity))
+
+    def publish(self,
+                joint_position,
+                cartesian_position,
+                drawing,
+                timestamp=0.0,
+                command_index=-1):
+        """Publishes a sample, with the command that reached it if any."""
+        sequence = int(self._counters[0]) + 1
+        index = sequence & 1
+        self._counters[1] = sequence
+        self._joint_positions[index][:] = joint_position
+        self._cartesian_positions[index][:] = cartesian_position
+        self._buffers[index, 4] = drawing
+        self._history.append(sequence, timestamp, joint_position,
+                             cartesian_position, drawing, command_index)
+        self._counters[0] = sequence
 
     def update_telemetry(self, new_telemetry):
-        with self._lock:
-            self._telemetry = deepcopy(new_telemetry)
+        self.publish(new_telemetry.joint_position,
+                     new_telemetry.cartesian_position, new_telemetry.drawing)
+
+    def get_sequence(self):
+        return int(self._counters[0])
+
+    def read_telemetry(self, telemetry):
+        """Copies the latest telemetry into the given Telemetry in place.
+
+        Returns the sequence number of the copied sample, 0 if nothing has
+        been published yet.
+        """
+        while True:
+            sequence = int(self._counters[0])
+            if sequence == 0:
+                return 0
+            index = sequence & 1
+            telemetry.joint_position[:] = self._joint_positions[index]
+            telemetry.cartesian_position[:] = self._cartesian_positions[index]
+            drawing = self._buffers[index, 4]
+            # The buffer is only rewritten by the sequence after the next one
+            if self._counters[1] <= sequence + 1:
+                telemetry.drawing = bool(drawing)
+                return sequence
+
+    def get_telemetry_since(self, sequence):
+        return self._history.get_since(sequence)
 
     def get_telemetry(self):
-        telemetry = None
-        with self._lock:
-            telemetry = self._telemetry
-        return deepcopy(telemetry)
+        telemetry = Telemetry(np.zeros(2), np.zeros(2), False)
+        if self.read_telemetry(telemetry) == 0:
+            return None
+        return telemetry
 
 
 class CommandSharer:
+    """Command queue between the user threads and the simulation.
+
+    Commands are stored as chunks of points and drawing flags, so a whole
+    job is enqueued with a single copy. With a capacity, adding commands
+    waits (or gives up) while the queue is full.
+    """
 
-    def __init__(self):
-        self._commands_queue = queue.Queue()
+    def __init__(self, capacity=None):
+        self._capacity = capacity
+        # (points, drawing, validated start) chunks and index of the next
+        # command in the first
+        self._chunks = deque()
+        self._chunk_index = 0
         self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        # Notified when the queue empties and when every command finished
+        self._changed = threading.Condition(self._lock)
         self._number_of_commands = 0
+        self._number_of_unfinished_commands = 0
+        self._number_of_added_commands = 0
+        self._number_of_finished_commands = 0
+        self._finished_callbacks = []
+        # Futures of the submitted commands by command index
+        self._futures = {}
+
+    def add_command(self, command, block=False, timeout=None):
+        return self.add_commands(command.cartesian_position,
+                                 command.drawing,
+                                 block=block,
+                                 timeout=timeout,
+                                 validated_start=command.validated_start) == 1
+
+    def add_commands(self,
+                     points,
+                     drawing,
+                     block=True,
+                     timeout=None,
+                     validated_start=None):
+        """Enqueues (N, 2) points with their N drawing flags.
+
+        When the queue is full, waits for space up to timeout seconds if
+        block is set. Returns the number of commands added, which is less
+        than N only if the queue stayed full. validated_start is the start
+        of the first move for moves checked by validate_commands, which the
+        simulation does not check again when it starts them there.
+        """
+        return self.put_commands(points, drawing, block, timeout,
+                                 validated_start)[0]
 
-    def add_command(self, command):
-        try:
-            self._commands_queue.put(deepcopy(command), block=False)
-            with self._lock:
-                self._number_of_commands += 1
-        except queue.Full:
-            return False
-        return True
+    def put_commands(self,
+                     points,
+                     drawing,
+                     block=True,
+                     timeout=None,
+                     validated_start=None):
+        """Like add_commands, returns (number added, end index).
+
+        Commands are indexed from 0 in the order they are added and finish
+        in the same order, so the added commands are finished once the
+        number of finished commands reaches the end index.
+        """
+        return self._put_commands(points, drawing, block, timeout,
+                                  validated_start)
+
+    def submit_command(self, command, block=True, timeout=None):
+        """Enqueues a command and returns a concurrent.futures.Future.
+
+        The future resolves with the CommandResult of the command once its
+        trajectory is executed. Raises queue.Full if the command could not
+        be added.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        added, _ = self._put_commands(command.cartesian_position,
+                                      command.drawing, block, timeout,
+                                      command.validated_start, future)
+        if not added:
+            raise queue.Full
+        return future
+
+    def _put_commands(self,
+                      points,
+                      drawing,
+                      block,
+                      timeout,
+                      validated_start,
+                      future=None):
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                                  (len(points), )).copy()
+
+        number_of_points = len(points)
+        added = 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_full:
+            while added < number_of_points:
+                count = number_of_points - added
+                if self._capacity is not None:
+                    count = min(count,
+                                self._capacity - self._number_of_commands)
+                if count <= 0:
+                    if not block:
+                        break
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                    self._not_full.wait(remaining)
+                    continue
+                # Start of the first move of the chunk, if validated
+                start = None
+                if validated_start is not None:
+                    start = (np.array(validated_start, dtype=np.float64)
+                             if added == 0 else points[added - 1])
+                self._chunks.append((points[added:added + count],
+                                     drawing[added:added + count], start))
+                self._number_of_commands += count
+                self._number_of_unfinished_commands += count
+                self._number_of_added_commands += count
+                added += count
+            end_index = self._number_of_added_commands
+            if future is not None and added:
+                self._futures[end_index - 1] = future
+        return added, end_index
 
     def get_command(self):
-        try:
-            command = self._commands_queue.get(block=False)
-            with self._lock:
-                self._number_of_commands -= 1
-        except queue.Empty:
-            return None
-        return deepcopy(command)
-    
+        with self._lock:
+            if not self._chunks:
+                return None
+            points, drawing, start = self._chunks[0]
+            index = self._chunk_index
+            if start is not None and index:
+                start = points[index - 1]
+            command = Command(points[index].copy(), bool(drawing[index]),
+                              None if start is None else start.copy())
+            index += 1
+            if index == len(points):
+                self._chunks.popleft()
+                index = 0
+            self._chunk_index = index
+            self._number_of_commands -= 1
+            if self._capacity is not None:
+                self._not_full.notify()
+            if self._number_of_commands == 0:
+                self._changed.notify_all()
+        return command
+
+    def peek_commands(self, max_number):
+        """Returns the (points, drawing) of up to max_number queued commands.
+
+        The commands stay queued, so get_command returns them in order.
+        """
+        points, drawing = [], []
+        with self._lock:
+            index = self._chunk_index
+            remaining = max_number
+            for chunk_points, chunk_drawing, _ in self._chunks:
+                if remaining <= 0:
+                    break
+                points.append(chunk_points[index:index + remaining])
+                drawing.append(chunk_drawing[index:index + remaining])
+                remaining -= len(points[-1])
+                index = 0
+        if not points:
+            return np.empty((0, 2)), np.empty(0, dtype=bool)
+        return np.concatenate(points), np.concatenate(drawing)
+
     def get_number_of_commands(self):
         number_of_commands = 0
         with self._lock:
             number_of_commands = self._number_of_commands
         return number_of_commands
 
+    def task_done(self, result=None):
+        """Marks the trajectory of the last command taken as finished.
+
+        result, a CommandResult, resolves the future of a submitted command.
+        """
+        future = None
+        with self._lock:
+            if self._futures:
+                future = self._futures.pop(self._number_of_finished_commands,
+                                           None)
+            self._number_of_unfinished_commands -= 1
+            self._number_of_finished_commands += 1
+            number_of_finished_commands = self._number_of_finished_commands
+            callbacks = self._finished_callbacks
+            if self._number_of_unfinished_commands == 0:
+                self._changed.notify_all()
+        if future is not None:
+            future.set_result(result)
+        for callback in callbacks:
+            callback(number_of_finished_commands)
+
+    def get_executing_command_index(self):
+        """Returns the index of the command being executed, None if idle."""
+        with self._lock:
+            if (self._number_of_unfinished_commands >
+                    self._number_of_commands):
+                return self._number_of_finished_commands
+            return None
+
+    def wait_until_no_commands(self, timeout=None):
+        """Waits until the queue is empty, returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self._number_of_commands == 0, timeout)
+
+    def wait_until_finished(self, timeout=None):
+        """Waits until every command is executed, returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: self._number_of_unfinished_commands == 0, timeout)
+
+    def get_number_of_unfinished_commands(self):
+        """Returns the number of queued or executing commands."""
+        with self._lock:
+            return self._number_of_unfinished_commands
+
+    def get_number_of_finished_commands(self):
+        with self._lock:
+            return self._number_of_finished_commands
+
+    def add_finished_callback(self, callback):
+        """Calls callback(number_of_finished_commands) as commands finish.
+
+        The callback runs in the simulation thread and must be short.
+        """
+        with self._lock:
+            self._finished_callbacks = self._finished_callbacks + [callback]
+
+    def remove_finished_callback(self, callback):
+        with self._lock:
+            self._finished_callbacks = [
+                c for c in self._finished_callbacks if c is not callback
+            ]
+
+
+@dataclass
+class LoopStatistics:
+    number_of_periods: int
+    number_of_overruns: int
+    mean_period: float
+    worst_period: float
+    percentiles: dict
+    histogram: np.ndarray
+    bin_edges: np.ndarray
+
+
+class PeriodStatistics:
+    """Histogram of the periods of a loop, with overrun count and worst case.
+
+    The histogram has number_of_bins bins up to maximum_period and a last
+    bin for longer periods. All the state lives in one buffer, so the
+    statistics of a loop in another process can be read from shared memory.
+    """
+
+    PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+    def __init__(self,
+                 maximum_period: float,
+                 number_of_bins: int = 200,
+                 buffer=None):
+        if buffer is None:
+            buffer = bytearray(
+                PeriodStatistics.get_buffer_size(number_of_bins))
+        self._bin_width = maximum_period / number_of_bins
+        self._number_of_bins = number_of_bins
+        # Number of periods and of overruns
+        self._counters, offset = buffer_array(buffer, 0, 2, np.int64)
+        # Sum of the periods and worst period
+        self._times, offset = buffer_array(buffer, offset, 2, np.float64)
+        self._histogram, _ = buffer_array(buffer, offset, number_of_bins + 1,
+                                          np.int64)
+
+    @staticmethod
+    def get_buffer_size(number_of_bins=200):
+        return (2 * np.dtype(np.int64).itemsize +
+                2 * np.dtype(np.float64).itemsize +
+                (number_of_bins + 1) * np.dtype(np.int64).itemsize)
+
+    def record(self, period, overrun):
+        self._counters[0] += 1
+        if overrun:
+            self._counters[1] += 1
+        self._times[0] += period
+        if period > self._times[1]:
+            self._times[1] = period
+        self._histogram[min(int(period / self._bin_width),
+                            self._number_of_bins)] += 1
+
+    def reset(self):
+        self._counters[:] = 0
+        self._times[:] = 0.0
+        self._histogram[:] = 0
+
+    def get_statistics(self):
+        histogram = self._histogram.copy()
+        number_of_periods = int(histogram.sum())
+        worst_period = float(self._times[1])
+        bin_edges = np.arange(self._number_of_bins + 1) * self._bin_width
+
+        # Upper edge of the bin holding each percentile
+        percentiles = {}
+        cumulative = np.cumsum(histogram)
+        for percentile in PeriodStatistics.PERCENTILES:
+            if number_of_periods == 0:
+                percentiles[percentile] = 0.0
+                continue
+            index = int(
+                np.searchsorted(cumulative,
+                                percentile / 100.0 * number_of_periods))
+            if index >= self._number_of_bins:
+                percentiles[percentile] = worst_period
+            else:
+                percentiles[percentile] = min((index + 1) * self._bin_width,
+                                              worst_period)
+
+        mean_period = 0.0
+        if number_of_periods > 0:
+            mean_period = float(self._times[0]) / number_of_periods
+        return LoopStatistics(number_of_periods, int(self._counters[1]),
+                              mean_period, worst_period, percentiles,
+                              histogram, bin_edges)
+
+
+@dataclass
+class StageStatistics:
+    number_of_calls: int
+    total_time: float
+    mean_time: float
+    max_time: float
+
+
+class StageProfiler:
+    """Time spent in the stages of a loop, switched on and off at runtime.
+
+    The number of calls and the total and longest durations in nanoseconds
+    of every stage are accumulated in preallocated int64 counters. All the
+    state lives in one buffer, so a loop in another process can be profiled
+    through shared memory. The loop reads the enabled flag once per
+    iteration and only times its stages while it is set.
+    """
+
+    def __init__(self, stages, buffer=None):
+        self._stages = tuple(stages)
+        if buffer is None:
+            buffer = bytearray(
+                StageProfiler.get_buffer_size(len(self._stages)))
+        # Enabled flag, then the calls, totals and maxima of every stage
+        self._counters, _ = buffer_array(buffer, 0, 1 + 3 * len(stages),
+                                         np.int64)
+        # Same memory as Python integers, faster to update one at a time
+        self._words = memoryview(self._counters)
+
+    @staticmethod
+    def get_buffer_size(number_of_stages):
+        return (1 + 3 * number_of_stages) * np.dtype(np.int64).itemsize
+
+    def get_stages(self):
+        return self._stages
+
+    def get_flag(self):
+        """Returns the memoryview whose first item is the enabled flag."""
+        return self._words[:1]
+
+    def enable(self):
+        self._words[0] = 1
+
+    def disable(self):
+        self._words[0] = 0
+
+    def is_enabled(self):
+        return self._words[0] != 0
+
+    def record(self, stage, duration):
+        """Adds a duration in nanoseconds to the stage of that index."""
+        words = self._words
+        number_of_stages = len(self._stages)
+        words[1 + stage] += 1
+        words[1 + number_of_stages + stage] += duration
+        if duration > words[1 + 2 * number_of_stages + stage]:
+            words[1 + 2 * number_of_stages + stage] = duration
+
+    def reset(self):
+        self._counters[1:] = 0
+
+    def get_statistics(self):
+        """Returns the StageStatistics of every stage by name, in seconds."""
+        calls, totals, maxima = self._counters[1:].reshape(3, -1).copy()
+        return {
+            stage: StageStatistics(
+                int(calls[i]),
+                float(totals[i]) * 1e-9,
+                float(totals[i]) * 1e-9 / calls[i] if calls[i] else 0.0,
+                float(maxima[i]) * 1e-9)
+            for i, stage in enumerate(self._stages)
+        }
+
+
+def format_stage_statistics(statistics):
+    """Returns a table of the StageStatistics of every stage."""
+    lines = [
+        f"{'stage':12} {'calls':>10} {'total':>10} {'mean':>10} {'max':>10}"
+    ]
+    for stage, stage_statistics in statistics.items():
+        lines.append(f"{stage:12} {stage_statistics.number_of_calls:10d} "
+                     f"{stage_statistics.total_time:9.3f}s "
+                     f"{stage_statistics.mean_time * 1e6:8.2f}us "
+                     f"{stage_statistics.max_time * 1e6:8.2f}us")
+    return '\n'.join(lines)
+
 
 class TimeManager:
+    """Paces a loop to a fixed sampling time on the monotonic clock.
 
-    def __init__(self, sampling_time: float) -> None:
+    With pacing='sleep' the remaining time is slept. With pacing='hybrid'
+    only the time up to spin_time before the deadline is slept, and the
+    rest is spent yielding in a loop, which avoids the sleep granularity
+    of the operating system at the cost of CPU time.
+    """
+
+    def __init__(self,
+                 sampling_time: float,
+                 pacing: str = 'sleep',
+                 spin_time: float = 0.0005,
+                 statistics_buffer=None) -> None:
+        if pacing not in ('sleep', 'hybrid'):
+            raise ValueError(f"Unknown pacing {pacing}.")
         self._sampling_time = sampling_time
-        self._initial_time = time.time()
+        self._hybrid = pacing == 'hybrid'
+        self._spin_time = spin_time
+        self._initial_time = time.perf_counter()
         self._previous_time = self._initial_time
+        self._wake_time = self._initial_time
+        self._statistics = PeriodStatistics(4 * sampling_time,
+                                            buffer=statistics_buffer)
 
     def adaptive_sleep(self):
-        current_time = time.time()
+        current_time = time.perf_counter()
         time_increment = current_time - self._previous_time
         sleep_time = max(0, self._sampling_time - time_increment)
-        time.sleep(sleep_time)
-        self._previous_time = current_time + sleep_time
+        deadline = current_time + sleep_time
+        if self._hybrid:
+            if sleep_time > self._spin_time:
+                time.sleep(sleep_time - self._spin_time)
+            while time.perf_counter() < deadline:
+                time.sleep(0)
+        else:
+            time.sleep(sleep_time)
+        self._previous_time = deadline
+
+        wake_time = time.perf_counter()
+        self._statistics.record(wake_time - self._wake_time,
+                                time_increment > self._sampling_time)
+        self._wake_time = wake_time
 
     def get_time(self):
-        return time.time() - self._initial_time
+        return time.perf_counter() - self._initial_time
+
+    def get_statistics(self):
+        return self._statistics.get_statistics()
+
+    def reset_statistics(self):
+        self._statistics.reset()
+
+
+class VirtualTimeManager:
+
+    def __init__(self, sampling_time: float) -> None:
+        self._sampling_time = sampling_time
+        self._number_of_samples = 0
+        self._statistics = PeriodStatistics(4 * sampling_time)
+
+    def adaptive_sleep(self):
+        self._number_of_samples += 1
+        # Every virtual period lasts exactly the sampling time
+        self._statistics.record(self._sampling_time, False)
+
+    def get_time(self):
+        return self._number_of_samples * self._sampling_time
+
+    def get_statistics(self):
+        return self._statistics.get_statistics()
+
+    def reset_statistics(self):
+        self._statistics.reset()
+
@@ -1,29 +1,56 @@
 import numpy as np
 
 
-def constant_velocity(initial_position, final_position, max_velocity,
-                      sampling_time):
+def constant_velocity_parameters(initial_position, final_position,
+                                 max_velocity, sampling_time):
+    """Returns the velocity and number of samples of a constant velocity move.
+
+    Sample k of the move is initial_position + velocity * (k + 1) *
+    sampling_time, except for the last one which is exactly final_position.
+    Moves shorter than a sampling period are a single jump (zero velocity).
+    """
     position_increment = np.abs(final_position - initial_position)
     max_position_increment = np.max(position_increment)
     time_to_destination = max_position_increment / max_velocity
 
     # Directly return the final position if time to destination is less than a single sampling period
     if time_to_destination <= sampling_time:
-        return [final_position]
+        return np.zeros(2), 1
 
     # Calculate component velocities
-    vx = (final_position[0] - initial_position[0]) / time_to_destination
-    vy = (final_position[1] - initial_position[1]) / time_to_destination
+    velocity = (final_position - initial_position) / time_to_destination
+    num_samples = int(time_to_destination / sampling_time)
+    return velocity, num_samples
+
+
+def constant_velocity_number_of_samples(initial_positions, final_positions,
+                                        max_velocity, sampling_time):
+    """Returns the number of samples of (N, 2) constant velocity moves.
+
+    Vectorized version of the count of constant_velocity_parameters.
+    """
+    position_increments = np.abs(
+        np.asarray(final_positions, dtype=np.float64) -
+        np.asarray(initial_positions, dtype=np.float64))
+    times_to_destination = position_increments.max(axis=-1) / max_velocity
+    return np.where(times_to_destination <= sampling_time, 1,
+                    (times_to_destination / sampling_time).astype(np.int64))
+
+
+def constant_velocity(initial_position, final_position, max_velocity,
+                      sampling_time):
+    """Returns the trajectory as a contiguous (N, 2) float64 array."""
+    initial_position = np.asarray(initial_position, dtype=np.float64)
+    final_position = np.asarray(final_position, dtype=np.float64)
+
+    velocity, num_samples = constant_velocity_parameters(
+        initial_position, final_position, max_velocity, sampling_time)
 
     # Generate the trajectory
-    num_samples = int(time_to_destination / sampling_time)
-    trajectory = []
-    # trajectory = [initial_position]  # Start with the initial position
-    for i in range(num_samples):
-        t = (i + 1) * sampling_time
-        x = initial_position[0] + vx * t
-        y = initial_position[1] + vy * t
-        trajectory.append(np.array([x, y]))
+    t = np.arange(1, num_samples + 1) * sampling_time
+    trajectory = np.empty((num_samples, 2), dtype=np.float64)
+    trajectory[:, 0] = initial_position[0] + velocity[0] * t
+    trajectory[:, 1] = initial_position[1] + velocity[1] * t
 
     # Ensure the final position is exactly as specified, avoiding slight numerical inaccuracies
     trajectory[-1] = final_position
@@ -31,5 +58,38 @@ def constant_velocity(initial_position, final_position, max_velocity,
     return trajectory
 
 
+def constant_velocity_moves(initial_position, final_positions, max_velocity,
+                            sampling_time):
+    """Returns the samples of consecutive constant velocity moves.
+
+    The moves go from initial_position through the (N, 2) final positions,
+    with the same samples as constant_velocity. Returns the (M, 2) samples
+    and the move of every sample.
+    """
+    final_positions = np.asarray(final_positions,
+                                 dtype=np.float64).reshape(-1, 2)
+    initial_positions = np.concatenate(
+        (np.asarray(initial_position, dtype=np.float64)[None],
+         final_positions[:-1]))
+    number_of_samples = constant_velocity_number_of_samples(
+        initial_positions, final_positions, max_velocity, sampling_time)
+    times_to_destination = np.abs(final_positions - initial_positions).max(
+        axis=-1) / max_velocity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocities = (final_positions -
+                      initial_positions) / times_to_destination[:, None]
+
+    moves = np.repeat(np.arange(len(final_positions)), number_of_samples)
+    last_samples = np.cumsum(number_of_samples) - 1
+    steps = np.arange(1, len(moves) + 1) - np.repeat(
+        last_samples + 1 - number_of_samples, number_of_samples)
+    t = steps * sampling_time
+    samples = np.empty((len(moves), 2), dtype=np.float64)
+    samples[:, 0] = initial_positions[moves, 0] + velocities[moves, 0] * t
+    samples[:, 1] = initial_positions[moves, 1] + velocities[moves, 1] * t
+    samples[last_samples] = final_positions
+    return samples, moves
+
+
 if __name__ == "__main__":
     print(constant_velocity(np.array([0, 0]), np.array([10, 5]), 5, 1))
@@ -0,0 +1,145 @@
+import numpy as np
+from dataclasses import dataclass
+
+from .robot import ParallelRobot, condition_numbers
+from .simulation import SAMPLING_TIME
+from .trajectories import constant_velocity_moves
+
+VALIDATION_POLICIES = ('reject', 'clip')
+
+
+@dataclass
+class InvalidCommand:
+    """A command whose move leaves the workspace or the singularity margin.
+
+    command_index is the position of the command in the validated points,
+    sample_index the first bad sample of its constant velocity move and
+    position that sample. reason is 'workspace' for a sample outside the
+    workspace and 'singularity' for a condition number of the Jacobian above
+    the margin. clipped_position is the target the command was clipped to,
+    None if it was rejected.
+    """
+    command_index: int
+    sample_index: int
+    position: np.ndarray
+    reason: str
+    clipped_position: np.ndarray = None
+
+
+@dataclass
+class ValidationResult:
+    """Commands kept by validate_commands and the invalid ones.
+
+    points and drawing are the commands to enqueue, clipped ones included,
+    and command_indices the position of each in the validated points.
+    """
+    points: np.ndarray
+    drawing: np.ndarray
+    command_indices: np.ndarray
+    invalid_commands: list
+
+    def is_valid(self):
+        """Returns True if every command was kept unchanged."""
+        return not self.invalid_commands
+
+
+def _first_invalid_sample(robot, parameters, initial_position, points,
+                          max_condition_number, max_velocity, sampling_time):
+    # Returns (move, samples of the move, index of the bad sample in them,
+    # reason) of the first bad sample of the moves, None if all are valid
+    samples, moves = constant_velocity_moves(initial_position, points,
+                                             max_velocity, sampling_time)
+    outside = ~robot.in_workspace_batch(samples)
+    bad = outside.copy()
+    if max_condition_number is not None:
+        inside = np.flatnonzero(~outside)
+        bad[inside[condition_numbers(samples[inside], *parameters) >
+                   max_condition_number]] = True
+    if not bad.any():
+        return None
+    first = int(np.argmax(bad))
+    move = int(moves[first])
+    move_start = int(np.searchsorted(moves, move))
+    move_end = int(np.searchsorted(moves, move, side='right'))
+    return (move, samples[move_start:move_end], first - move_start,
+            'workspace' if outside[first] else 'singularity')
+
+
+def validate_commands(initial_position,
+                      points,
+                      drawing,
+                      robot_configuration,
+                      policy='reject',
+                      max_condition_number=20.0,
+                      max_velocity=0.2,
+                      sampling_time=SAMPLING_TIME,
+                      chunk_size=4096):
+    """Checks the constant velocity moves of commands before they run.
+
+    The moves start at initial_position, the target of the previous
+    command, and every sample the simulation would execute must be inside
+    the workspace with a condition number of the Jacobian at most
+    max_condition_number (None to only check the workspace). With the
+    'reject' policy an invalid command is dropped, with 'clip' its target is
+    moved back to its last valid sample, or it is dropped if it has none.
+    The following moves start from the last kept target. Returns a
+    ValidationResult. The moves are sampled up to chunk_size commands at a
+    time.
+    """
+    if policy not in VALIDATION_POLICIES:
+        raise ValueError(f"Unknown validation policy {policy!r}, expected "
+                         f"one of {', '.join(VALIDATION_POLICIES)}.")
+    robot = ParallelRobot(*robot_configuration)
+    # Robot parameters of the condition numbers
+    parameters = (robot_configuration.motor_distance,
+                  robot_configuration.base_arm_length,
+                  robot_configuration.link_arm_length,
+                  robot_configuration.tcp_offset)
+    points = np.array(points, dtype=np.float64).reshape(-1, 2)
+    drawing = np.broadcast_to(np.asarray(drawing, dtype=bool),
+                              (len(points), )).copy()
+    position = np.asarray(initial_position, dtype=np.float64)
+
+    kept = np.ones(len(points), dtype=bool)
+    invalid_commands = []
+    start = 0
+    # Number of commands checked at once, small after an invalid command
+    # as they often come in runs
+    size = chunk_size
+    while start < len(points):
+        end = min(start + size, len(points))
+        invalid = _first_invalid_sample(robot, parameters, position,
+                                        points[start:end],
+                                        max_condition_number, max_velocity,
+                                        sampling_time)
+        if invalid is None:
+            position = points[end - 1]
+            start = end
+            size = min(2 * size, chunk_size)
+            continue
+
+        move, samples, sample_index, reason = invalid
+        index = start + move
+        if move:
+            position = points[index - 1]
+        if invalid_commands and invalid_commands[-1].command_index == index:
+            # A clipped command is checked again, its move changed
+            invalid_command = invalid_commands[-1]
+        else:
+            invalid_command = InvalidCommand(index, sample_index,
+                                             samples[sample_index].copy(),
+                                             reason)
+            invalid_commands.append(invalid_command)
+        if policy == 'clip' and sample_index > 0:
+            points[index] = samples[sample_index - 1]
+            invalid_command.clipped_position = points[index].copy()
+            start = index
+        else:
+            kept[index] = False
+            invalid_command.clipped_position = None
+            start = index + 1
+        size = 1
+
+    return ValidationResult(points[kept], drawing[kept], np.flatnonzero(kept),
+                            invalid_commands)
+
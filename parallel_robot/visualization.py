@@ -2,43 +2,35 @@ import sys
 import pygame
 import numpy as np
 
-from .tools import TimeManager
-
-# Colors
-black = (0, 0, 0)
-white = (255, 255, 255)
-orange = (255, 162, 0)
-red = (255, 0, 0)
-green = (0, 255, 0)
-
-
-class Visualization:
-
-    def __init__(self, stop_event, telemetry_sharer, robot_configuration):
+from .rendering import black, green, orange, pixel_per_metre, red, white
+from .tools import TimeManager, Telemetry
+from .visualization_backends import VisualizationBackend
+
+
+class Visualization(VisualizationBackend):
+    """pygame window showing the robot and its drawing."""
+
+    def __init__(self,
+                 stop_event,
+                 telemetry_sharer,
+                 robot_configuration,
+                 pacing='sleep',
+                 frame_rate=60.0):
+        super().__init__(stop_event, telemetry_sharer, robot_configuration,
+                         pacing, frame_rate)
         self._screen_width = 800
         self._screen_height = 600
         self._pixel_per_metre = None
         self._font = None
 
-        self._stop_event = stop_event
-        self._telemetry_sharer = telemetry_sharer
-        self._robot_configuration = robot_configuration
+        self._time_manager = None
+        self._mouse_position = None
+        self._mouse_text = None
 
         # Calculate scale based on screen size and robot size
-        robot_width = 2 * np.abs(self._robot_configuration.motor_distance -
-                                 self._robot_configuration.base_arm_length -
-                                 self._robot_configuration.link_arm_length
-                                 ) + self._robot_configuration.motor_distance
-        robot_height = 2 * (
-            (self._robot_configuration.base_arm_length +
-             self._robot_configuration.link_arm_length)**2 -
-            (self._robot_configuration.motor_distance / 2.0)**2)**0.5
-        screen_ratio = self._screen_width / self._screen_height
-        robot_ratio = robot_width / robot_height
-        if robot_ratio >= screen_ratio:
-            self._pixel_per_metre = self._screen_width / robot_width
-        else:
-            self._pixel_per_metre = self._screen_height / robot_height
+        self._pixel_per_metre = pixel_per_metre(self._robot_configuration,
+                                                self._screen_width,
+                                                self._screen_height)
 
     def scale(self, value):
         """Scales a value based on pixels per metre."""
@@ -90,13 +82,20 @@ class Visualization:
 
         # Draw lines
         white = (255, 255, 255)
-        for i in range(len(screen_points) - 1):
+        rects = [
             pygame.draw.line(screen, white, screen_points[i],
                              screen_points[i + 1], 5)
-        pygame.draw.line(screen, white, screen_points[2], (x_tcp, y_tcp), 5)
-
-        # Draw circles for arm lengths
-        for x4, y4 in [screen_points[0], screen_points[-1]]:
+            for i in range(len(screen_points) - 1)
+        ]
+        rects.append(
+            pygame.draw.line(screen, white, screen_points[2], (x_tcp, y_tcp),
+                             5))
+        return rects[0].unionall(rects[1:])
+
+    def draw_workspace(self, screen):
+        """Draws the circles of the arm lengths around both motors."""
+        for x, y in [(0, 0), (self._robot_configuration.motor_distance, 0)]:
+            x4, y4 = self.robot_to_screen_coordinates(x, y)
             pygame.draw.circle(
                 screen, white, (x4, y4),
                 self.scale(
@@ -107,6 +106,33 @@ class Visualization:
                 self.scale(self._robot_configuration.base_arm_length +
                            self._robot_configuration.link_arm_length), 1)
 
+    def draw_strokes(self, canvas, samples, last_sample):
+        """Draws the drawing segments between consecutive telemetry samples.
+
+        As before, the segment ending at a sample is drawn if that sample is
+        drawing. Every run of drawing samples is drawn with one
+        pygame.draw.lines call, starting from the sample before the run,
+        which is last_sample for the first one. Returns the dirty rects.
+        """
+        if last_sample is not None:
+            samples = np.concatenate((last_sample[None], samples))
+        drawing = samples['drawing'].copy()
+        drawing[0] = False
+        x, y = self.robot_to_screen_coordinates(
+            samples['cartesian_position'][:, 0],
+            samples['cartesian_position'][:, 1])
+        points = np.column_stack((x, y))
+
+        # First and after last sample of every run of drawing samples
+        edges = np.diff(drawing.astype(np.int8), append=0)
+        starts = np.flatnonzero(edges == 1) + 1
+        ends = np.flatnonzero(edges == -1) + 1
+        return [
+            pygame.draw.lines(canvas, orange, False,
+                              points[start - 1:end].tolist(), 1)
+            for start, end in zip(starts, ends)
+        ]
+
     def draw_axes(self, screen):
         """Draws coordinate axes on the screen."""
         center_x, center_y = self.robot_to_screen_coordinates(0, 0)
@@ -124,15 +150,31 @@ class Visualization:
         screen.blit(y_label, (center_x, center_y - arrow_length - 20))
 
     def print_mouse_position(self, screen):
-        mouse_x, mouse_y = pygame.mouse.get_pos()
-        mouse_x, mouse_y = self.screen_to_robot_coordinates(mouse_x, mouse_y)
-        text = f"({mouse_x:.4f},{mouse_y:.4f})"
-        text_surface = self._font.render(text, True, white)
-        screen.blit(text_surface,
-                    (0, self._screen_height - self._font.size(text)[1]))
+        """Prints the mouse position, rendering it only when it changes."""
+        mouse_position = pygame.mouse.get_pos()
+        if mouse_position != self._mouse_position:
+            self._mouse_position = mouse_position
+            mouse_x, mouse_y = self.screen_to_robot_coordinates(
+                *mouse_position)
+            text = f"({mouse_x:.4f},{mouse_y:.4f})"
+            self._mouse_text = self._font.render(text, True, white)
+        return screen.blit(
+            self._mouse_text,
+            (0, self._screen_height - self._mouse_text.get_height()))
+
+    def get_loop_statistics(self):
+        """Returns the LoopStatistics of the main loop, None before it runs."""
+        if self._time_manager is None:
+            return None
+        return self._time_manager.get_statistics()
 
     def main_loop(self):
-        """Main loop for running the visualization."""
+        """Main loop for running the visualization.
+
+        Only the regions that changed since the previous frame are redrawn:
+        the new strokes, the robot in its previous and current pose and the
+        mouse position.
+        """
         try:
             pygame.init()
 
@@ -143,33 +185,46 @@ class Visualization:
 
             pygame.display.set_caption('Parallel Robot Simulator')
 
+            # Background with the static elements and the drawn strokes
             canvas = pygame.Surface(screen.get_size())
             canvas.fill(black)  # Black color for canvas background
+            self.draw_workspace(canvas)
+            self.draw_axes(canvas)
+            screen.blit(canvas, (0, 0))
+            pygame.display.flip()
 
-            time_manager = TimeManager(0.001)
+            time_manager = TimeManager(1.0 / self._frame_rate, self._pacing)
+            self._time_manager = time_manager
 
-            previous_telemetry = None  # Initialize previous_telemetry
+            telemetry = Telemetry(np.zeros(2), np.zeros(2), False)
+            last_sample = None
+            sequence = 0
+            dirty_rects = []
 
             while not self._stop_event.is_set():
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
                         self._stop_event.set()
 
-                telemetry = self._telemetry_sharer.get_telemetry()
-                if telemetry and previous_telemetry and telemetry.drawing:
-                    last_pos = self.robot_to_screen_coordinates(
-                        *previous_telemetry.cartesian_position)
-                    current_pos = self.robot_to_screen_coordinates(
-                        *telemetry.cartesian_position)
-                    pygame.draw.line(canvas, orange, last_pos, current_pos, 1)
-
-                previous_telemetry = telemetry  # Update previous_telemetry for the next iteration
-
-                screen.blit(canvas, (0, 0))
-                self.print_mouse_position(screen)
-                self.draw_axes(screen)
-                self.draw_robot(screen, telemetry)
-                pygame.display.flip()
+                # Every sample since the previous frame
+                samples, sequence, _ = \
+                    self._telemetry_sharer.get_telemetry_since(sequence)
+                if len(samples) > 0:
+                    dirty_rects += self.draw_strokes(canvas, samples,
+                                                     last_sample)
+                    last_sample = samples[-1]
+
+                if self._telemetry_sharer.read_telemetry(telemetry) == 0:
+                    time_manager.adaptive_sleep()
+                    continue
+
+                # Restore the background of the previous overlays
+                for rect in dirty_rects:
+                    screen.blit(canvas, rect, rect)
+                robot_rect = self.draw_robot(screen, telemetry)
+                text_rect = self.print_mouse_position(screen)
+                pygame.display.update(dirty_rects + [robot_rect, text_rect])
+                dirty_rects = [robot_rect, text_rect]
 
                 time_manager.adaptive_sleep()
 
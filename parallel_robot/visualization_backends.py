@@ -0,0 +1,97 @@
+import importlib
+import importlib.util
+
+
+class VisualizationBackend:
+    """Interface of the visualizations of ParallelRobotSimulation.
+
+    A backend is created with the stop event, the telemetry sharer, the
+    robot configuration, the pacing and frame rate of its loop and its own
+    keyword options. main_loop() runs in a daemon thread until the stop
+    event is set, and may set it to stop the simulation, e.g. when its
+    window is closed.
+    """
+
+    def __init__(self,
+                 stop_event,
+                 telemetry_sharer,
+                 robot_configuration,
+                 pacing='sleep',
+                 frame_rate=60.0):
+        self._stop_event = stop_event
+        self._telemetry_sharer = telemetry_sharer
+        self._robot_configuration = robot_configuration
+        self._pacing = pacing
+        self._frame_rate = frame_rate
+
+    def main_loop(self):
+        raise NotImplementedError
+
+    def get_loop_statistics(self):
+        """Returns the LoopStatistics of the main loop, None if it has none."""
+        return None
+
+
+class NullVisualization(VisualizationBackend):
+    """Shows nothing, waits for the stop event."""
+
+    def main_loop(self):
+        self._stop_event.wait()
+
+
+class RecorderVisualization(VisualizationBackend):
+    """Records the telemetry to a log file instead of showing it.
+
+    The log is read with TelemetryLog, e.g. to render it with
+    OfflineRenderer. The history_capacity of the simulation must hold the
+    samples of a poll interval of the recorder.
+    """
+
+    def __init__(self,
+                 stop_event,
+                 telemetry_sharer,
+                 robot_configuration,
+                 pacing='sleep',
+                 frame_rate=60.0,
+                 path='telemetry.log',
+                 compression=None):
+        super().__init__(stop_event, telemetry_sharer, robot_configuration,
+                         pacing, frame_rate)
+        self._path = path
+        self._compression = compression
+
+    def main_loop(self):
+        from .recorder import TelemetryRecorder
+
+        recorder = TelemetryRecorder(self._telemetry_sharer,
+                                     self._path,
+                                     compression=self._compression)
+        recorder.start()
+        self._stop_event.wait()
+        recorder.stop()
+
+
+# Module and class of every backend, imported on first use
+_VISUALIZATION_BACKENDS = {
+    'pygame': ('.visualization', 'Visualization'),
+    'null': ('.visualization_backends', 'NullVisualization'),
+    'recorder': ('.visualization_backends', 'RecorderVisualization'),
+}
+
+
+def get_available_visualization_backends():
+    """Returns the names of the backends that can be used."""
+    return [
+        name for name in _VISUALIZATION_BACKENDS
+        if name != 'pygame' or importlib.util.find_spec('pygame') is not None
+    ]
+
+
+def get_visualization_backend(name):
+    """Returns the VisualizationBackend class of that name."""
+    if name not in _VISUALIZATION_BACKENDS:
+        raise ValueError(f"Unknown visualization backend {name!r}, expected "
+                         f"one of {', '.join(_VISUALIZATION_BACKENDS)}.")
+    module_name, class_name = _VISUALIZATION_BACKENDS[name]
+    module = importlib.import_module(module_name, __package__)
+    return getattr(module, class_name)
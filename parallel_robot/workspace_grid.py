@@ -0,0 +1,227 @@
+import os
+import hashlib
+import numpy as np
+
+from .robot import inverse_kinematics, in_workspace
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache",
+                                       "parallel_robot")
+
+_grids = {}
+
+
+class WorkspaceGrid:
+    """Precomputed joint angle table of a robot.
+
+    The table stores the exact inverse kinematics on a regular grid of
+    resolution metres. inverse_kinematics() interpolates it bilinearly in
+    the cells whose estimated interpolation error is below tolerance
+    radians. The estimate is exact for the quadratic part of the inverse
+    kinematics, so the bound holds up to third order terms of the cell
+    size. Points in other cells, i.e. near the workspace boundary or an
+    angle wrap, fall back to the exact inverse kinematics. The table is NaN
+    outside the workspace. Reachability is always checked exactly: the
+    check is a few array operations, cheaper than a table lookup.
+    """
+
+    def __init__(self,
+                 robot_configuration,
+                 resolution=0.001,
+                 tolerance=1e-4,
+                 arrays=None):
+        self._robot_configuration = robot_configuration
+        self._parameters = (robot_configuration.motor_distance,
+                            robot_configuration.base_arm_length,
+                            robot_configuration.link_arm_length,
+                            np.asarray(robot_configuration.tcp_offset,
+                                       dtype=np.float64))
+        self._resolution = resolution
+        self._tolerance = tolerance
+
+        tcp_offset = self._parameters[3]
+        reach = (robot_configuration.base_arm_length +
+                 robot_configuration.link_arm_length)
+        self._origin = np.array([-reach, -reach]) + tcp_offset
+        size = np.array(
+            [2 * reach + robot_configuration.motor_distance, 2 * reach])
+        self._shape = tuple(
+            int(n) for n in np.ceil(size / resolution)[::-1] + 1)
+
+        if arrays is None:
+            arrays = self._build()
+        self._joint_positions, self._interpolable = arrays
+
+    def _build(self):
+        ny, nx = self._shape
+        x = self._origin[0] + np.arange(nx) * self._resolution
+        y = self._origin[1] + np.arange(ny) * self._resolution
+        points = np.stack(np.meshgrid(x, y), axis=-1).reshape(-1, 2)
+
+        mask = in_workspace(points, *self._parameters).reshape(ny, nx)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            joint_positions = inverse_kinematics(points, *self._parameters)
+        joint_positions = joint_positions.reshape(ny, nx, 2)
+        joint_positions[~mask] = np.nan
+
+        # For a quadratic function the bilinear interpolation error in a cell
+        # is bounded by the sum of the errors at the midpoints of an edge
+        # along x and of an edge along y, where it is the mean of two corners
+        grid_points = points.reshape(ny, nx, 2)
+        x_midpoints = grid_points[:, :-1] + [self._resolution / 2, 0.0]
+        y_midpoints = grid_points[:-1, :] + [0.0, self._resolution / 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_exact = inverse_kinematics(x_midpoints.reshape(-1, 2),
+                                         *self._parameters)
+            y_exact = inverse_kinematics(y_midpoints.reshape(-1, 2),
+                                         *self._parameters)
+        x_error = np.max(np.abs(
+            (joint_positions[:, :-1] + joint_positions[:, 1:]) / 2 -
+            x_exact.reshape(ny, nx - 1, 2)),
+                         axis=-1)
+        y_error = np.max(np.abs(
+            (joint_positions[:-1, :] + joint_positions[1:, :]) / 2 -
+            y_exact.reshape(ny - 1, nx, 2)),
+                         axis=-1)
+        error = (np.maximum(x_error[:-1], x_error[1:]) +
+                 np.maximum(y_error[:, :-1], y_error[:, 1:]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            interpolable = error <= self._tolerance
+
+        return joint_positions, interpolable
+
+    def get_resolution(self):
+        return self._resolution
+
+    def get_tolerance(self):
+        return self._tolerance
+
+    def get_joint_positions(self):
+        return self._joint_positions
+
+    def get_key(self):
+        return grid_key(self._robot_configuration, self._resolution,
+                        self._tolerance)
+
+    def in_workspace(self, cartesian_positions):
+        """Returns a boolean mask of the (N, 2) positions in the workspace."""
+        return in_workspace(cartesian_positions, *self._parameters)
+
+    def inverse_kinematics(self, cartesian_positions):
+        """Returns the (N, 2) joint positions within tolerance of the exact."""
+        cartesian_positions = np.asarray(cartesian_positions, dtype=np.float64)
+        ny, nx = self._shape
+
+        cells = (cartesian_positions - self._origin) / self._resolution
+        indices = np.floor(cells).astype(np.int64)
+        inside = ((indices[:, 0] >= 0) & (indices[:, 0] < nx - 1) &
+                  (indices[:, 1] >= 0) & (indices[:, 1] < ny - 1))
+        interpolate = np.zeros(len(cartesian_positions), dtype=bool)
+        interpolate[inside] = self._interpolable[indices[inside, 1],
+                                                 indices[inside, 0]]
+
+        joint_positions = np.empty_like(cartesian_positions)
+        i = indices[interpolate, 0]
+        j = indices[interpolate, 1]
+        t = (cells[interpolate] - indices[interpolate])[:, :, None]
+        table = self._joint_positions
+        joint_positions[interpolate] = (
+            (1 - t[:, 1]) * ((1 - t[:, 0]) * table[j, i] +
+                             t[:, 0] * table[j, i + 1]) +
+            t[:, 1] * ((1 - t[:, 0]) * table[j + 1, i] +
+                       t[:, 0] * table[j + 1, i + 1]))
+
+        exact = ~interpolate
+        if np.any(exact):
+            joint_positions[exact] = inverse_kinematics(
+                cartesian_positions[exact], *self._parameters)
+        return joint_positions
+
+    def segments_reachable(self, points):
+        """Returns, for every segment of an (N, 2) path, if it is reachable.
+
+        Each segment is sampled at the grid resolution, including both ends.
+        """
+        samples, segments = sample_segments(points, self._resolution)
+        reachable = self.in_workspace(samples)
+        unreachable_segments = np.unique(segments[~reachable])
+        result = np.ones(max(len(points) - 1, 0), dtype=bool)
+        result[unreachable_segments] = False
+        return result
+
+    def is_path_reachable(self, points):
+        """True if every point and segment of an (N, 2) path is reachable."""
+        points = np.asarray(points, dtype=np.float64)
+        return bool(np.all(self.in_workspace(points)) and
+                    np.all(self.segments_reachable(points)))
+
+
+def sample_segments(points, resolution):
+    """Samples the segments of an (N, 2) path every resolution metres.
+
+    Returns the (M, 2) samples, including both ends of every segment, and
+    the segment of every sample.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 2:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+    starts = points[:-1]
+    increments = points[1:] - starts
+    lengths = np.hypot(increments[:, 0], increments[:, 1])
+    samples_per_segment = np.ceil(lengths / resolution).astype(np.int64) + 1
+
+    segments = np.repeat(np.arange(len(starts)), samples_per_segment)
+    first_samples = np.cumsum(samples_per_segment) - samples_per_segment
+    steps = np.arange(len(segments)) - np.repeat(first_samples,
+                                                 samples_per_segment)
+    fractions = steps / np.maximum(samples_per_segment[segments] - 1, 1)
+    samples = starts[segments] + increments[segments] * fractions[:, None]
+    return samples, segments
+
+
+def grid_key(robot_configuration, resolution, tolerance):
+    """Returns the cache key of a grid, a hash of the fields it depends on."""
+    fields = (float(robot_configuration.motor_distance),
+              float(robot_configuration.base_arm_length),
+              float(robot_configuration.link_arm_length),
+              tuple(
+                  float(v) for v in np.ravel(robot_configuration.tcp_offset)),
+              float(resolution), float(tolerance))
+    return hashlib.sha256(repr(fields).encode()).hexdigest()[:16]
+
+
+def get_workspace_grid(robot_configuration,
+                       resolution=0.001,
+                       tolerance=1e-4,
+                       cache_directory=DEFAULT_CACHE_DIRECTORY):
+    """Returns the grid of a configuration from the memory or disk cache.
+
+    The grid is built and stored in both caches when missing. Pass
+    cache_directory=None to only use the memory cache.
+    """
+    key = grid_key(robot_configuration, resolution, tolerance)
+    if key in _grids:
+        return _grids[key]
+
+    path = None
+    if cache_directory is not None:
+        path = os.path.join(cache_directory, f"workspace_grid_{key}.npz")
+
+    if path is not None and os.path.exists(path):
+        with np.load(path) as data:
+            arrays = (data['joint_positions'], data['interpolable'])
+        grid = WorkspaceGrid(robot_configuration, resolution, tolerance,
+                             arrays)
+    else:
+        grid = WorkspaceGrid(robot_configuration, resolution, tolerance)
+        if path is not None:
+            os.makedirs(cache_directory, exist_ok=True)
+            # Write to a temporary file first so readers never see a partial
+            # cache file
+            temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(temporary_path,
+                     joint_positions=grid.get_joint_positions(),
+                     interpolable=grid._interpolable)
+            os.replace(temporary_path, path)
+
+    _grids[key] = grid
+    return grid
@@ -0,0 +1,68 @@
+import asyncio
+import numpy as np
+import pytest
+
+from parallel_robot.async_api import AsyncParallelRobotSimulation
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.tools import Command
+
+POINTS = np.array([[0.04, 0.12], [0.06, 0.12], [0.06, 0.14], [0.04, 0.14]])
+
+
+def make_simulation(**kwargs):
+    return ParallelRobotSimulation(0.08,
+                                   0.08,
+                                   0.12,
+                                   visualization=False,
+                                   history_capacity=2**16,
+                                   **kwargs)
+
+
+def test_add_commands_and_telemetry():
+    robot_simulation = make_simulation(command_capacity=2)
+
+    async def main():
+        async_simulation = AsyncParallelRobotSimulation(robot_simulation)
+        samples = []
+
+        async def collect():
+            async for sample in async_simulation.telemetry(decimation=4):
+                samples.append(sample)
+
+        collector = asyncio.create_task(collect())
+        try:
+            # More commands than the queue holds
+            await async_simulation.add_commands(POINTS, True)
+            finished = robot_simulation.get_command_sharer() \
+                .get_number_of_finished_commands()
+            assert finished == len(POINTS)
+            await async_simulation.add_command(Command(POINTS[0], False))
+            await async_simulation.wait_idle()
+            await asyncio.sleep(0.05)
+        finally:
+            collector.cancel()
+            async_simulation.close()
+        return samples
+
+    robot_simulation.start()
+    try:
+        samples = asyncio.run(main())
+        telemetry = robot_simulation.get_telemetry()
+    finally:
+        robot_simulation.stop()
+    assert np.array_equal(telemetry.cartesian_position, POINTS[0])
+    assert not telemetry.drawing
+    sequences = np.array([sample['sequence'] for sample in samples])
+    assert len(sequences) > 0 and np.all(sequences % 4 == 0)
+    assert np.all(np.diff(sequences) > 0)
+
+
+def test_needs_the_real_time_thread_backend():
+    robot_simulation = make_simulation(real_time=False)
+
+    async def main():
+        AsyncParallelRobotSimulation(robot_simulation)
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    robot_simulation.stop()
@@ -0,0 +1,132 @@
+import queue
+import threading
+import numpy as np
+import pytest
+
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.tools import Command, CommandResult, CommandSharer
+
+
+def result(index):
+    return CommandResult(index, index + 1.0, 10, 0)
+
+
+def test_commands_are_taken_in_order():
+    command_sharer = CommandSharer()
+    command_sharer.add_command(Command(np.array([0.0, 1.0]), True))
+    assert command_sharer.add_commands([[2.0, 3.0], [4.0, 5.0]],
+                                       [False, True]) == 2
+    commands = [command_sharer.get_command() for _ in range(3)]
+    assert command_sharer.get_command() is None
+    assert np.array_equal([command.cartesian_position for command in commands],
+                          [[0.0, 1.0], [2.0, 3.0], [4.0, 5.0]])
+    assert [command.drawing for command in commands] == [True, False, True]
+
+
+def test_futures_resolve_in_order():
+    command_sharer = CommandSharer()
+    futures = [
+        command_sharer.submit_command(Command(np.array([i, 0.0]), True))
+        for i in range(3)
+    ]
+    # Commands added in bulk between submitted ones have no future
+    command_sharer.add_commands(np.zeros((2, 2)), False)
+    futures.append(
+        command_sharer.submit_command(Command(np.array([5.0, 0.0]), True)))
+    assert not any(future.done() for future in futures)
+
+    for index in range(6):
+        command_sharer.get_command()
+        assert command_sharer.get_executing_command_index() == index
+        command_sharer.task_done(result(index))
+    assert [future.result(0).start_time
+            for future in futures] == [0, 1, 2, 5]
+    assert command_sharer.get_executing_command_index() is None
+
+
+def test_submit_command_to_a_full_queue():
+    command_sharer = CommandSharer(capacity=1)
+    command_sharer.add_commands([[0.0, 0.0]], True)
+    with pytest.raises(queue.Full):
+        command_sharer.submit_command(Command(np.zeros(2), True),
+                                      block=False)
+    with pytest.raises(queue.Full):
+        command_sharer.submit_command(Command(np.zeros(2), True),
+                                      timeout=0.01)
+
+
+def test_capacity_limits_added_commands():
+    command_sharer = CommandSharer(capacity=3)
+    assert command_sharer.add_commands(np.zeros((5, 2)), True,
+                                       block=False) == 3
+    assert command_sharer.put_commands(np.zeros((1, 2)), True,
+                                       block=False) == (0, 3)
+
+    # A blocked producer resumes as commands are taken
+    added = []
+    producer = threading.Thread(target=lambda: added.append(
+        command_sharer.add_commands(np.zeros((4, 2)), True)))
+    producer.start()
+    for _ in range(7):
+        while command_sharer.get_command() is None:
+            pass
+    producer.join()
+    assert added == [4]
+
+
+def test_finished_callbacks():
+    command_sharer = CommandSharer()
+    calls = []
+    callback = calls.append
+    command_sharer.add_finished_callback(callback)
+    added, end_index = command_sharer.put_commands(np.zeros((3, 2)), True)
+    assert (added, end_index) == (3, 3)
+    for index in range(2):
+        command_sharer.get_command()
+        command_sharer.task_done(result(index))
+    command_sharer.remove_finished_callback(callback)
+    command_sharer.get_command()
+    command_sharer.task_done(result(2))
+    assert calls == [1, 2]
+    assert command_sharer.get_number_of_finished_commands() == 3
+
+
+def test_wait_until_finished():
+    command_sharer = CommandSharer()
+    assert command_sharer.wait_until_finished(0)
+    command_sharer.add_commands(np.zeros((2, 2)), True)
+    assert not command_sharer.wait_until_finished(0.01)
+    command_sharer.get_command()
+    command_sharer.get_command()
+    assert command_sharer.wait_until_no_commands(0)
+    assert command_sharer.get_number_of_unfinished_commands() == 2
+
+    def finish():
+        command_sharer.task_done(result(0))
+        command_sharer.task_done(result(1))
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    assert command_sharer.wait_until_finished(5.0)
+    thread.join()
+
+
+def test_simulation_resolves_futures():
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               real_time=False)
+    targets = [np.array([0.04, 0.12]), np.array([0.06, 0.12])]
+    futures = [
+        robot_simulation.submit_command(Command(target, True))
+        for target in targets
+    ]
+    robot_simulation.run_until_idle()
+    results = [future.result(0) for future in futures]
+    assert results[0].finish_time < results[1].start_time
+    assert all(result.number_of_samples > 0 and
+               result.number_of_rejected_samples == 0 for result in results)
+    telemetry = robot_simulation.get_telemetry()
+    assert np.array_equal(telemetry.cartesian_position, targets[-1])
+    robot_simulation.stop()
@@ -0,0 +1,98 @@
+import threading
+import numpy as np
+import pytest
+
+from parallel_robot.compiled_job import CompiledJob, compile_job
+from parallel_robot.simulation import SAMPLING_TIME, Simulation
+from parallel_robot.tools import (CommandSharer, RobotConfiguration,
+                                  TelemetrySharer, VirtualTimeManager)
+
+ROBOT_CONFIGURATION = RobotConfiguration(0.08, 0.08, 0.12,
+                                         np.array([0.0, 0.0]),
+                                         np.array([np.pi / 2, np.pi / 2]))
+
+
+def random_job(number_of_points=100):
+    rng = np.random.default_rng(1)
+    points = np.column_stack((rng.uniform(0.0, 0.08, number_of_points),
+                              rng.uniform(0.08, 0.16, number_of_points)))
+    # Some moves leave the workspace
+    points[10] = (0.3, 0.3)
+    return points, rng.random(number_of_points) < 0.5
+
+
+def run(simulation, telemetry_sharer):
+    simulation.run_until_idle(threading.Event(),
+                              VirtualTimeManager(SAMPLING_TIME))
+    telemetry, _, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert not overrun
+    return telemetry
+
+
+@pytest.fixture(scope='module')
+def live():
+    points, drawing = random_job()
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer(2**16)
+    command_sharer.add_commands(points, drawing)
+    return run(
+        Simulation(telemetry_sharer, command_sharer, ROBOT_CONFIGURATION),
+        telemetry_sharer)
+
+
+@pytest.fixture
+def job(tmp_path):
+    path = tmp_path / 'job.bin'
+    points, drawing = random_job()
+    number_of_setpoints = compile_job(path, points, drawing,
+                                      ROBOT_CONFIGURATION)
+    job = CompiledJob(path, ROBOT_CONFIGURATION)
+    assert job.get_number_of_commands() == len(points)
+    assert job.get_number_of_setpoints() == number_of_setpoints
+    return job
+
+
+def replay(job, start_command=0):
+    telemetry_sharer = TelemetrySharer(2**16)
+    simulation = Simulation(telemetry_sharer, CommandSharer(),
+                            ROBOT_CONFIGURATION)
+    simulation.replay(job, start_command)
+    return run(simulation, telemetry_sharer)
+
+
+def test_replay_matches_live(live, job):
+    replayed = replay(job)
+    assert len(replayed) == len(live)
+    assert np.array_equal(replayed['drawing'], live['drawing'])
+    assert np.array_equal(replayed['command_index'], live['command_index'])
+    assert np.allclose(replayed['cartesian_position'],
+                       live['cartesian_position'],
+                       rtol=0.0,
+                       atol=1e-12)
+    assert np.allclose(replayed['joint_position'],
+                       live['joint_position'],
+                       rtol=0.0,
+                       atol=1e-9)
+
+
+def test_resume(live, job):
+    # After moving to the start of the command
+    command_index = job.get_number_of_commands() // 2
+    resumed = replay(job, command_index)
+    tail = job.get_number_of_setpoints() - job.get_first_setpoint(
+        command_index)
+    assert np.array_equal(resumed['cartesian_position'][-tail:],
+                          live['cartesian_position'][-tail:])
+    assert job.get_command_index(job.get_first_setpoint(command_index)) == (
+        command_index)
+
+
+def test_configuration_mismatch(job, tmp_path):
+    with pytest.raises(ValueError):
+        CompiledJob(
+            tmp_path / 'job.bin',
+            RobotConfiguration(0.08, 0.08, 0.13, np.array([0.0, 0.0]),
+                               np.array([np.pi / 2, np.pi / 2])))
+    (tmp_path / 'other.bin').write_bytes(b'\0' * 512)
+    with pytest.raises(ValueError):
+        CompiledJob(tmp_path / 'other.bin')
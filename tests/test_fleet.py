@@ -0,0 +1,90 @@
+import numpy as np
+
+from parallel_robot.fleet import FleetSimulation
+from parallel_robot.kernels import BACKEND_VARIABLE
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.tools import Command, RobotConfiguration
+
+ROBOT_CONFIGURATIONS = [
+    RobotConfiguration(0.08, 0.08, 0.12, np.array([0.0, 0.0]),
+                       np.array([np.pi / 2, np.pi / 2])),
+    RobotConfiguration(0.06, 0.09, 0.13, np.array([0.001, -0.002]),
+                       np.array([np.pi / 2, np.pi / 2])),
+    RobotConfiguration(0.1, 0.08, 0.12, np.array([0.0, 0.0]),
+                       np.array([np.pi / 3, 2 * np.pi / 3])),
+]
+
+
+def jobs():
+    # A job of different length per robot, some samples outside the
+    # workspace
+    rng = np.random.default_rng(2)
+    result = []
+    for number_of_points in (20, 35, 10):
+        points = np.column_stack((rng.uniform(0.0, 0.08, number_of_points),
+                                  rng.uniform(0.08, 0.16, number_of_points)))
+        points[number_of_points // 2] = (0.04, 0.3)
+        result.append((points, rng.random(number_of_points) < 0.5))
+    return result
+
+
+def test_robots_match_single_simulations(monkeypatch):
+    # The fleet runs the NumPy batch functions, a single robot the point
+    # kernels of the python backend
+    monkeypatch.setenv(BACKEND_VARIABLE, 'python')
+    fleet = FleetSimulation(ROBOT_CONFIGURATIONS,
+                            real_time=False,
+                            history_capacity=2**16)
+    futures = []
+    for robot_index, (points, drawing) in enumerate(jobs()):
+        futures.append([
+            fleet.submit_command(robot_index, Command(point, flag))
+            for point, flag in zip(points, drawing)
+        ])
+    fleet.run_until_idle()
+
+    for robot_index, (points, drawing) in enumerate(jobs()):
+        robot_simulation = ParallelRobotSimulation(
+            *ROBOT_CONFIGURATIONS[robot_index],
+            visualization=False,
+            real_time=False,
+            history_capacity=2**16)
+        expected_futures = [
+            robot_simulation.submit_command(Command(point, flag))
+            for point, flag in zip(points, drawing)
+        ]
+        robot_simulation.run_until_idle()
+        expected, _, _ = robot_simulation.get_telemetry_since(0)
+        robot_simulation.stop()
+
+        # The robots with shorter jobs idle until the fleet is done
+        samples, _, overrun = fleet.get_telemetry_since(robot_index, 0)
+        assert not overrun and len(samples) >= len(expected)
+        assert samples[:len(expected)].tobytes() == expected.tobytes()
+        for field in ('joint_position', 'cartesian_position', 'drawing',
+                      'command_index'):
+            assert np.all(
+                samples[len(expected):][field] == expected[-1][field])
+        assert [future.result(0) for future in futures[robot_index]] == [
+            future.result(0) for future in expected_futures
+        ]
+
+
+def test_real_time_fleet():
+    fleet = FleetSimulation(ROBOT_CONFIGURATIONS[:2])
+    fleet.start()
+    try:
+        futures = [
+            fleet.submit_command(robot_index, Command(target, True))
+            for robot_index, target in ((0, np.array([0.04, 0.12])),
+                                        (1, np.array([0.05, 0.13])))
+        ]
+        fleet.run_until_idle()
+        for robot_index, future in enumerate(futures):
+            result = future.result(0)
+            assert result.number_of_samples > 0
+            assert np.array_equal(
+                fleet.get_telemetry(robot_index).cartesian_position,
+                [0.04, 0.12] if robot_index == 0 else [0.05, 0.13])
+    finally:
+        fleet.stop()
@@ -0,0 +1,102 @@
+import numpy as np
+
+from parallel_robot.jobs import (feed_job, load_csv_job, optimize_job,
+                                 read_csv_chunks)
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+
+
+def write_csv_job(path, points, drawing):
+    with open(path, 'w') as csv_file:
+        for (x, y), flag in zip(points, drawing):
+            flag = 'true' if flag else 'false'
+            csv_file.write(f"{float(x)!r},{float(y)!r},{flag}\n")
+
+
+def test_csv_chunks(tmp_path):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-400.0, 400.0, (100, 2))
+    drawing = rng.random(100) < 0.5
+    path = tmp_path / 'job.csv'
+    write_csv_job(path, points, drawing)
+
+    for chunk_size in (1, 7, 100, 65536):
+        chunks = list(read_csv_chunks(path, chunk_size))
+        assert all(len(chunk_points) <= chunk_size
+                   for chunk_points, _ in chunks)
+        assert np.array_equal(np.concatenate([p for p, _ in chunks]), points)
+        assert np.array_equal(np.concatenate([d for _, d in chunks]),
+                              drawing)
+    loaded_points, loaded_drawing = load_csv_job(path, 7)
+    assert np.array_equal(loaded_points, points)
+    assert np.array_equal(loaded_drawing, drawing)
+
+    empty_path = tmp_path / 'empty.csv'
+    empty_path.touch()
+    loaded_points, loaded_drawing = load_csv_job(empty_path)
+    assert loaded_points.shape == (0, 2) and loaded_drawing.shape == (0,)
+
+
+def test_feed_job_with_backpressure(tmp_path):
+    # Short moves in millimetres, more than the queue holds
+    angles = np.linspace(0, 2 * np.pi, 60)
+    points = np.column_stack((40 + 10 * np.cos(angles),
+                              120 + 10 * np.sin(angles)))
+    path = tmp_path / 'job.csv'
+    write_csv_job(path, points, np.ones(len(points), dtype=bool))
+
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               history_capacity=2**16,
+                                               command_capacity=8)
+    robot_simulation.start()
+    try:
+        assert feed_job(read_csv_chunks(path, 16),
+                        robot_simulation,
+                        transform=lambda points: points / 1000) == len(points)
+        robot_simulation.run_until_idle()
+        samples, _, overrun = robot_simulation.get_telemetry_since(0)
+    finally:
+        robot_simulation.stop()
+    assert not overrun
+    assert samples['command_index'][-1] == len(points) - 1
+    assert np.array_equal(samples['cartesian_position'][-1],
+                          points[-1] / 1000)
+
+
+def random_strokes(number_of_strokes):
+    rng = np.random.default_rng(0)
+    points, drawing = [], []
+    for _ in range(number_of_strokes):
+        position = rng.uniform(0.0, 0.08, 2)
+        points.append(position)
+        drawing.append(False)
+        for _ in range(rng.integers(1, 6)):
+            position = position + rng.uniform(-0.002, 0.002, 2)
+            points += [position] * rng.integers(1, 3)
+            drawing += [True] * (len(points) - len(drawing))
+    return np.array(points), np.array(drawing)
+
+
+def drawn_segments(points, drawing):
+    segments = np.concatenate((points[:-1], points[1:]), axis=1)[drawing[1:]]
+    # Segments drawn in either direction
+    flip = (segments[:, 0] > segments[:, 2]) | (
+        (segments[:, 0] == segments[:, 2]) &
+        (segments[:, 1] > segments[:, 3]))
+    segments = np.where(flip[:, None], segments[:, [2, 3, 0, 1]], segments)
+    segments = segments[np.any(segments[:, :2] != segments[:, 2:], axis=1)]
+    return segments[np.lexsort(segments.T)]
+
+
+def test_optimize_job_draws_the_same_segments():
+    points, drawing = random_strokes(2000)
+    optimized_points, optimized_drawing, optimization = optimize_job(
+        points, drawing, tolerance=0.0)
+    assert np.array_equal(drawn_segments(points, drawing),
+                          drawn_segments(optimized_points, optimized_drawing))
+    assert optimization.number_of_commands_before == len(points)
+    assert optimization.number_of_commands_after == len(optimized_points)
+    assert optimization.execution_time_after < (
+        optimization.execution_time_before)
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+
+from parallel_robot.fleet import FleetSimulation
+from parallel_robot.kernels import (BACKEND_VARIABLE, get_available_backends,
+                                    get_backend)
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.robot import (forward_kinematics, in_workspace,
+                                  inverse_kinematics)
+from parallel_robot.tools import RobotConfiguration
+
+PARAMETERS = (0.08, 0.08, 0.12, 0.001, -0.002)
+ROBOT_PARAMETERS = (0.08, 0.08, 0.12, np.array([0.001, -0.002]))
+
+
+def positions():
+    # Random positions, including points outside the workspace and singular
+    # joint positions
+    rng = np.random.default_rng(0)
+    cartesian_positions = np.concatenate(
+        (np.column_stack((rng.uniform(-0.25, 0.33, 10**4),
+                          rng.uniform(-0.25, 0.25, 10**4))),
+         [[0.04, 0.0], [0.0, 0.0], [0.081, -0.002], [np.nan, 0.1]]))
+    joint_positions = np.concatenate(
+        (rng.uniform(-np.pi, np.pi, (10**4, 2)),
+         [[0.0, 0.0], [np.pi / 2, np.pi / 2], [0.0, np.pi], [np.nan, 0.0]]))
+    return cartesian_positions, joint_positions
+
+
+def kernel_results(backend, cartesian_positions, joint_positions):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'in_workspace_point': np.array([
+                backend.in_workspace_point(*point, *PARAMETERS)
+                for point in cartesian_positions.tolist()
+            ]),
+            'in_workspace_batch':
+            backend.in_workspace_batch(cartesian_positions, *PARAMETERS),
+            'inverse_kinematics_point': np.array([
+                backend.inverse_kinematics_point(*point, *PARAMETERS)
+                for point in cartesian_positions.tolist()
+            ]),
+            'inverse_kinematics_batch':
+            backend.inverse_kinematics_batch(cartesian_positions,
+                                             *PARAMETERS),
+            'forward_kinematics_point': np.array([
+                backend.forward_kinematics_point(*point, *PARAMETERS)
+                for point in joint_positions.tolist()
+            ]),
+            'forward_kinematics_batch':
+            backend.forward_kinematics_batch(joint_positions, *PARAMETERS),
+        }
+
+
+def expected_results(cartesian_positions, joint_positions):
+    # The NumPy functions of robot.py
+    inside = in_workspace(cartesian_positions, *ROBOT_PARAMETERS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        joints = inverse_kinematics(cartesian_positions, *ROBOT_PARAMETERS)
+        cartesian = forward_kinematics(joint_positions, *ROBOT_PARAMETERS)
+    return {
+        'in_workspace_point': inside,
+        'in_workspace_batch': inside,
+        'inverse_kinematics_point': joints,
+        'inverse_kinematics_batch': joints,
+        'forward_kinematics_point': cartesian,
+        'forward_kinematics_batch': cartesian,
+    }
+
+
+def test_default_backend(monkeypatch):
+    monkeypatch.delenv(BACKEND_VARIABLE, raising=False)
+    assert get_backend() is get_backend('python')
+    monkeypatch.setenv(BACKEND_VARIABLE, 'python')
+    assert get_backend().name == 'python'
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend('fortran')
+
+
+def test_python_backend_is_bit_identical():
+    cartesian_positions, joint_positions = positions()
+    results = kernel_results(get_backend('python'), cartesian_positions,
+                             joint_positions)
+    expected = expected_results(cartesian_positions, joint_positions)
+    for kernel, result in results.items():
+        assert np.array_equal(result, expected[kernel],
+                              equal_nan=True), kernel
+
+
+def test_numba_backend_parity():
+    pytest.importorskip('numba')
+    assert 'numba' in get_available_backends()
+    cartesian_positions, joint_positions = positions()
+    results = kernel_results(get_backend('numba'), cartesian_positions,
+                             joint_positions)
+    expected = expected_results(cartesian_positions, joint_positions)
+    for kernel, result in results.items():
+        if result.dtype == bool:
+            assert np.array_equal(result, expected[kernel]), kernel
+            continue
+        # The same operations, up to the last bits of the libm functions
+        assert np.array_equal(np.isnan(result),
+                              np.isnan(expected[kernel])), kernel
+        assert np.nanmax(np.abs(result - expected[kernel])) < 1e-12, kernel
+
+
+def test_fleet_matches_simulation(monkeypatch):
+    # The fleet runs the NumPy batch functions, a single robot the point
+    # kernels of the default python backend
+    monkeypatch.setenv(BACKEND_VARIABLE, 'python')
+    robot_configuration = RobotConfiguration(0.08, 0.08, 0.12,
+                                             np.array([0.0, 0.0]),
+                                             np.array([np.pi / 2, np.pi / 2]))
+    rng = np.random.default_rng(1)
+    points = np.column_stack((rng.uniform(0.0, 0.08, 50),
+                              rng.uniform(0.08, 0.16, 50)))
+    drawing = rng.random(50) < 0.5
+
+    fleet = FleetSimulation([robot_configuration] * 2,
+                            real_time=False,
+                            history_capacity=2**16)
+    for robot_index in range(2):
+        fleet.add_commands(robot_index, points, drawing)
+    fleet.run_until_idle()
+    robot_simulation = ParallelRobotSimulation(*robot_configuration,
+                                               visualization=False,
+                                               real_time=False,
+                                               history_capacity=2**16)
+    robot_simulation.add_commands(points, drawing)
+    robot_simulation.run_until_idle()
+    expected, _, _ = robot_simulation.get_telemetry_since(0)
+    robot_simulation.stop()
+
+    for robot_index in range(2):
+        samples, _, overrun = fleet.get_telemetry_since(robot_index, 0)
+        assert not overrun and len(samples) == len(expected)
+        for field in ('joint_position', 'cartesian_position', 'drawing',
+                      'command_index'):
+            assert np.array_equal(samples[field], expected[field]), field
@@ -0,0 +1,132 @@
+import threading
+import numpy as np
+
+from parallel_robot.planner import LookAheadPlanner, MotionLimits
+from parallel_robot.simulation import SAMPLING_TIME, Simulation
+from parallel_robot.tools import (Command, CommandSharer, RobotConfiguration,
+                                  TelemetrySharer, VirtualTimeManager)
+
+ROBOT_CONFIGURATION = RobotConfiguration(0.08, 0.08, 0.12,
+                                         np.array([0.0, 0.0]),
+                                         np.array([np.pi / 2, np.pi / 2]))
+CORNER = np.array([[0.06, 0.1], [0.06, 0.14]])
+
+
+def random_job(number_of_points=100):
+    rng = np.random.default_rng(0)
+    points = np.column_stack((rng.uniform(0.0, 0.08, number_of_points),
+                              rng.uniform(0.08, 0.16, number_of_points)))
+    # Runs of drawn moves, with stops where the flag changes
+    drawing = np.repeat(rng.random(number_of_points // 10) < 0.7, 10)
+    return points, drawing
+
+
+def run_job(motion_limits, points, drawing):
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer(2**16)
+    simulation = Simulation(telemetry_sharer,
+                            command_sharer,
+                            ROBOT_CONFIGURATION,
+                            motion_limits=motion_limits)
+    futures = [
+        command_sharer.submit_command(Command(point, flag))
+        for point, flag in zip(points, drawing)
+    ]
+    simulation.run_until_idle(threading.Event(),
+                              VirtualTimeManager(SAMPLING_TIME))
+    samples, _, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert not overrun
+    return samples, futures
+
+
+def check_limits(positions, motion_limits, joint_positions=None):
+    velocities = np.diff(positions, axis=0) / SAMPLING_TIME
+    accelerations = np.diff(positions, 2, axis=0) / SAMPLING_TIME**2
+    assert (np.sqrt(np.sum(velocities**2, axis=1)).max() <=
+            motion_limits.max_velocity * (1 + 1e-9))
+    assert (np.sqrt(np.sum(accelerations**2, axis=1)).max() <=
+            motion_limits.max_acceleration * (1 + 1e-6))
+    if motion_limits.max_joint_velocity is not None:
+        joint_increments = (np.diff(joint_positions, axis=0) +
+                            np.pi) % (2 * np.pi) - np.pi
+        # The joint limit is estimated on chords of the path
+        assert (np.abs(joint_increments).max() / SAMPLING_TIME <=
+                motion_limits.max_joint_velocity * (1 + 1e-3))
+
+
+def test_corner_within_limits():
+    motion_limits = MotionLimits(0.2, 2.0, path_tolerance=0.001)
+    planner = LookAheadPlanner(ROBOT_CONFIGURATION, motion_limits,
+                               SAMPLING_TIME)
+    trajectory, _, _, speeds = planner.plan([0.02, 0.1], CORNER,
+                                            [True, True])
+    check_limits(np.concatenate(([[0.02, 0.1]], trajectory)), motion_limits)
+    assert speeds.max() <= motion_limits.max_velocity
+
+
+def test_job_within_limits():
+    points, drawing = random_job()
+    for motion_limits in (MotionLimits(),
+                          MotionLimits(0.2, 5.0, 200.0, 0.0005, 2.0,
+                                       look_ahead=8)):
+        samples, _ = run_job(motion_limits, points, drawing)
+        check_limits(samples['cartesian_position'], motion_limits,
+                     samples['joint_position'])
+
+
+def test_path_tolerance_at_corners():
+    path_tolerance = 0.001
+    motion_limits = MotionLimits(path_tolerance=path_tolerance)
+    planner = LookAheadPlanner(ROBOT_CONFIGURATION, motion_limits,
+                               SAMPLING_TIME)
+    initial_position = np.array([0.0, 0.1])
+    points = np.array([[0.02, 0.12], [0.04, 0.1], [0.06, 0.12],
+                       [0.06, 0.14], [0.02, 0.14]])
+    trajectory, _, _, _ = planner.plan(initial_position, points,
+                                       np.ones(len(points), dtype=bool))
+
+    # Distance of every sample to every move
+    starts = np.concatenate(([initial_position], points[:-1]))
+    increments = points - starts
+    fractions = np.clip(
+        np.sum((trajectory[:, None] - starts) * increments, axis=2) /
+        np.sum(increments**2, axis=1), 0.0, 1.0)
+    distances = np.sqrt(
+        np.sum((trajectory[:, None] - starts - fractions[..., None] *
+                increments)**2,
+               axis=2))
+    assert distances.min(axis=1).max() <= path_tolerance * (1 + 1e-9)
+    # The samples pass every corner within path_tolerance
+    corner_distances = np.sqrt(
+        np.sum((trajectory[:, None] - points[:-1])**2, axis=2))
+    assert np.all(corner_distances.min(axis=0) <= path_tolerance +
+                  motion_limits.max_velocity * SAMPLING_TIME)
+    assert np.all(corner_distances.min(axis=0) > 0.5 * path_tolerance)
+
+
+def test_final_positions_are_exact():
+    points, drawing = random_job()
+    planner = LookAheadPlanner(ROBOT_CONFIGURATION, MotionLimits(),
+                               SAMPLING_TIME)
+    trajectory, command_indices, _, speeds = planner.plan(
+        [0.04, 0.12], points, drawing)
+    assert np.array_equal(trajectory[-1], points[-1])
+    assert command_indices[-1] == len(points) - 1 and speeds[-1] == 0.0
+
+    motion_limits = MotionLimits(max_jerk=200.0, look_ahead=8)
+    samples, _ = run_job(motion_limits, points, drawing)
+    assert np.array_equal(samples['cartesian_position'][-1], points[-1])
+
+
+def test_futures_and_command_indices_in_order():
+    points, drawing = random_job()
+    samples, futures = run_job(MotionLimits(max_jerk=200.0, look_ahead=8),
+                               points, drawing)
+    command_indices = samples['command_index']
+    assert np.all(np.diff(command_indices) >= 0)
+    assert command_indices[-1] == len(points) - 1
+    results = [future.result(0) for future in futures]
+    assert all(result.number_of_rejected_samples == 0 for result in results)
+    finish_times = [result.finish_time for result in results]
+    assert finish_times == sorted(finish_times)
+    assert all(result.start_time <= result.finish_time for result in results)
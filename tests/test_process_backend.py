@@ -0,0 +1,36 @@
+import numpy as np
+
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+
+POINTS = np.array([[0.04, 0.12], [0.06, 0.12], [0.06, 0.14]])
+
+
+def run_job(process):
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               process=process,
+                                               history_capacity=2**16)
+    robot_simulation.add_commands(POINTS, True)
+    robot_simulation.start()
+    try:
+        robot_simulation.run_until_idle()
+        samples, _, overrun = robot_simulation.get_telemetry_since(0)
+    finally:
+        robot_simulation.stop()
+    assert not overrun
+    return samples
+
+
+def test_process_telemetry_matches_threads():
+    expected = run_job(False)
+    samples = run_job(True)
+    # Both idle at the last point for a few samples after the job
+    number_of_samples = min(len(expected), len(samples))
+    assert samples[:number_of_samples].tobytes() == (
+        expected[:number_of_samples].tobytes())
+    for telemetry in (expected, samples):
+        assert np.array_equal(telemetry['cartesian_position'][-1],
+                              POINTS[-1])
+        assert telemetry['command_index'][-1] == len(POINTS) - 1
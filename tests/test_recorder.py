@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from parallel_robot.recorder import (COMPRESSIONS, TelemetryLog,
+                                     TelemetryRecorder)
+from parallel_robot.simulation import SAMPLING_TIME, Simulation
+from parallel_robot.tools import (CommandSharer, RobotConfiguration,
+                                  TelemetrySharer, VirtualTimeManager)
+
+ROBOT_CONFIGURATION = RobotConfiguration(0.08, 0.08, 0.12,
+                                         np.array([0.0, 0.0]),
+                                         np.array([np.pi / 2, np.pi / 2]))
+CHUNK_SIZE = 100
+
+
+def record(path, compression):
+    rng = np.random.default_rng(0)
+    command_sharer = CommandSharer()
+    # Big enough to compare the whole run with the log
+    telemetry_sharer = TelemetrySharer(2**16)
+    command_sharer.add_commands(
+        np.column_stack((rng.uniform(0.0, 0.08, 50),
+                         rng.uniform(0.08, 0.16, 50))),
+        rng.random(50) < 0.5)
+    simulation = Simulation(telemetry_sharer, command_sharer,
+                            ROBOT_CONFIGURATION)
+    time_manager = VirtualTimeManager(SAMPLING_TIME)
+
+    recorder = TelemetryRecorder(telemetry_sharer,
+                                 path,
+                                 chunk_size=CHUNK_SIZE,
+                                 compression=compression,
+                                 poll_interval=0.001)
+    recorder.start()
+    while not simulation.is_idle():
+        simulation.step()
+        time_manager.adaptive_sleep()
+    recorder.stop()
+    telemetry, _, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert not overrun
+    assert recorder.get_number_of_lost_samples() == 0
+    assert recorder.get_number_of_samples() == len(telemetry)
+    return telemetry
+
+
+@pytest.mark.parametrize('compression', list(COMPRESSIONS))
+def test_round_trip(tmp_path, compression):
+    path = tmp_path / 'telemetry.log'
+    telemetry = record(path, compression)
+    log = TelemetryLog(path)
+    assert log.get_number_of_samples() == len(telemetry)
+    assert len(log.get_seek_table()) == -(-len(telemetry) // CHUNK_SIZE)
+    assert np.array_equal(log.get_samples(), telemetry)
+
+    timestamps = telemetry['timestamp']
+    start_time, end_time = timestamps[len(telemetry) // 3], timestamps[-50]
+    assert np.array_equal(
+        log.get_samples(start_time, end_time),
+        telemetry[(timestamps >= start_time) & (timestamps < end_time)])
+    for command_index in (0, 20, 49):
+        assert np.array_equal(
+            log.get_command_samples(command_index),
+            telemetry[telemetry['command_index'] == command_index])
+
+
+def test_interrupted_recording(tmp_path):
+    # A log whose recording stopped before the seek table and a partial
+    # last chunk
+    path = tmp_path / 'telemetry.log'
+    telemetry = record(path, 'zlib')
+    offset = int(TelemetryLog(path).get_seek_table()['offset'][-1])
+    with open(path, 'r+b') as log_file:
+        log_file.truncate(offset + 100)
+    log = TelemetryLog(path)
+    last_chunk = len(telemetry) % CHUNK_SIZE or CHUNK_SIZE
+    assert np.array_equal(log.get_samples(), telemetry[:-last_chunk])
+
+
+def test_not_a_log(tmp_path):
+    path = tmp_path / 'telemetry.log'
+    path.write_bytes(bytes(256))
+    with pytest.raises(ValueError):
+        TelemetryLog(path)
+    with pytest.raises(ValueError):
+        TelemetryRecorder(TelemetrySharer(16), path, compression='lzma')
@@ -0,0 +1,96 @@
+import struct
+import zlib
+import numpy as np
+import pytest
+
+from parallel_robot import rendering
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.rendering import (OfflineRenderer, orange, write_gif,
+                                      write_png, write_png_frames)
+
+
+@pytest.fixture(scope='module')
+def job():
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               real_time=False,
+                                               history_capacity=2**16)
+    robot_simulation.add_commands(
+        [[0.02, 0.1], [0.06, 0.1], [0.06, 0.14], [0.02, 0.14]],
+        [False, True, True, False])
+    robot_simulation.run_until_idle()
+    telemetry, _, overrun = robot_simulation.get_telemetry_since(0)
+    robot_simulation.stop()
+    assert not overrun
+    return robot_simulation.get_robot_configuration(), telemetry
+
+
+def read_png(path):
+    with open(path, 'rb') as png_file:
+        data = png_file.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    width, height = struct.unpack('>II', data[16:24])
+    length, = struct.unpack('>I', data[33:37])
+    assert data[37:41] == b'IDAT'
+    rows = np.frombuffer(zlib.decompress(data[41:41 + length]),
+                         dtype=np.uint8).reshape(height, -1)
+    assert np.all(rows[:, 0] == 0)
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+def test_render_image(job, tmp_path):
+    robot_configuration, telemetry = job
+    renderer = OfflineRenderer(robot_configuration, 320, 240)
+    image = renderer.render_image(telemetry)
+    assert image.shape == (240, 320, 3) and image.dtype == np.uint8
+
+    # Only the two drawing moves are drawn
+    drawn = np.all(image == orange, axis=2)
+    x, y = np.nonzero(drawn.T)
+    corners = renderer.robot_to_image_coordinates([[0.02, 0.1], [0.06, 0.14]])
+    assert np.all((x >= np.floor(corners[:, 0].min()) - 1) &
+                  (x <= np.ceil(corners[:, 0].max()) + 1))
+    assert np.all((y >= np.floor(corners[:, 1].min()) - 1) &
+                  (y <= np.ceil(corners[:, 1].max()) + 1))
+    assert np.count_nonzero(drawn) > 0
+
+    write_png(tmp_path / 'job.png', image)
+    assert np.array_equal(read_png(tmp_path / 'job.png'), image)
+
+
+def test_frames(job, tmp_path):
+    robot_configuration, telemetry = job
+    renderer = OfflineRenderer(robot_configuration, 160, 120)
+    indices = renderer.get_frame_indices(telemetry, 10.0)
+    assert indices[0] == 0 and indices[-1] == len(telemetry) - 1
+    assert np.all(np.diff(indices) >= 0)
+
+    frames = list(renderer.render_frames(telemetry, 10.0))
+    assert len(frames) == len(indices)
+    assert np.array_equal(frames[-1], renderer.render_image(telemetry))
+    # Drawn pixels stay drawn, unless the arms cover them
+    first_sample = renderer.pen_path(telemetry)
+    for index, frame in zip(indices, frames):
+        drawn = np.all(frame == orange, axis=2)
+        assert np.all(first_sample[drawn] <= index)
+        covered = np.all(frame == 255, axis=2)
+        assert np.all((drawn | covered)[first_sample <= index])
+
+    assert write_png_frames(tmp_path / 'frames', frames) == len(frames)
+    assert np.array_equal(read_png(tmp_path / 'frames' / 'frame_000000.png'),
+                          frames[0])
+
+
+def test_gif_without_pillow(job, tmp_path, monkeypatch):
+    robot_configuration, telemetry = job
+    renderer = OfflineRenderer(robot_configuration, 160, 120)
+    monkeypatch.setattr(rendering.importlib.util, 'find_spec',
+                        lambda name: None)
+    with pytest.warns(UserWarning, match='Pillow'):
+        path = write_gif(str(tmp_path / 'job.gif'),
+                         renderer.render_frames(telemetry, 10.0), 10.0)
+    assert path == str(tmp_path / 'job')
+    assert len(list((tmp_path / 'job').iterdir())) == len(
+        renderer.get_frame_indices(telemetry, 10.0))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from parallel_robot.kernels import get_available_backends
+from parallel_robot.robot import ParallelRobot
+
+
+@pytest.mark.parametrize('backend', get_available_backends())
+def test_single_point_methods_match_batch(backend):
+    robot = ParallelRobot(0.08,
+                          0.08,
+                          0.12,
+                          np.array([0.001, -0.002]),
+                          backend=backend)
+    # Including points outside the workspace and singular joint positions
+    rng = np.random.default_rng(0)
+    cartesian_positions = np.concatenate(
+        (np.column_stack((rng.uniform(-0.25, 0.33, 1000),
+                          rng.uniform(-0.25, 0.25, 1000))),
+         [[0.04, 0.0], [0.0, 0.0], [0.081, -0.002]]))
+    joint_positions = np.concatenate(
+        (rng.uniform(-np.pi, np.pi, (1000, 2)),
+         [[0.0, 0.0], [np.pi / 2, np.pi / 2], [0.0, np.pi]]))
+
+    assert np.array_equal(
+        [robot.in_workspace(point) for point in cartesian_positions],
+        robot.in_workspace_batch(cartesian_positions))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results = [
+            ([robot.inverse_kinematics(point)
+              for point in cartesian_positions],
+             robot.inverse_kinematics_batch(cartesian_positions)),
+            ([robot.forward_kinematics(point) for point in joint_positions],
+             robot.forward_kinematics_batch(joint_positions)),
+        ]
+    for points, batch in results:
+        points = np.array(points)
+        if backend == 'python':
+            assert np.array_equal(points, batch, equal_nan=True)
+            continue
+        # The same operations, up to the last bits of the libm functions
+        assert np.array_equal(np.isnan(points), np.isnan(batch))
+        assert np.nanmax(np.abs(points - batch)) < 1e-12
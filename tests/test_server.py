@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+import pytest
+
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.server import (ADD_COMMANDS, ERROR, PING, PONG,
+                                   RobotClient, encode_frame, read_frame)
+
+
+@pytest.fixture
+def robot_simulation():
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               history_capacity=2**16)
+    robot_simulation.start()
+    yield robot_simulation
+    robot_simulation.stop_server()
+    robot_simulation.stop()
+
+
+def test_commands_and_telemetry(robot_simulation, tmp_path):
+    path = str(tmp_path / 'robot.sock')
+    assert robot_simulation.start_server(path) == path
+    angles = np.linspace(0, 2 * np.pi, 50)
+    points = np.column_stack((0.04 + 0.02 * np.cos(angles),
+                              0.12 + 0.02 * np.sin(angles)))
+
+    async def main():
+        clients = [await RobotClient.connect(path) for _ in range(3)]
+        await clients[1].subscribe(1)
+        await clients[2].subscribe(10)
+        # The subscriptions are handled before the next request
+        assert await clients[1].ping() == b''
+        assert await clients[2].ping() == b''
+        assert await clients[0].add_commands(points, True) == len(points)
+        assert await clients[0].ping(b'robot') == b'robot'
+        await clients[0].wait_idle()
+        last_sequence = (await clients[0].get_status())['sequence']
+
+        received = {}
+        for client, decimation in ((clients[1], 1), (clients[2], 10)):
+            samples = []
+            async for pushed in client.telemetry():
+                samples.append(pushed)
+                if pushed['sequence'][-1] > last_sequence - decimation:
+                    break
+            await client.subscribe(0)
+            received[decimation] = np.concatenate(samples)
+        for client in clients:
+            await client.close()
+        return received
+
+    received = asyncio.run(main())
+    for decimation, samples in received.items():
+        assert np.all(np.diff(samples['sequence']) == decimation)
+        assert np.all(samples['sequence'] % decimation == 0)
+        assert samples['command_index'].max() == len(points) - 1
+    assert np.array_equal(
+        robot_simulation.get_telemetry().cartesian_position, points[-1])
+
+
+def test_errors_over_tcp(robot_simulation):
+    host, port = robot_simulation.start_server()
+
+    async def main():
+        reader, writer = await asyncio.open_connection(host, port)
+        responses = []
+        for message_type, payload in ((99, b''), (ADD_COMMANDS, bytes(10)),
+                                      (PING, b'robot')):
+            writer.write(encode_frame(message_type, payload))
+            responses.append(await read_frame(reader))
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    assert asyncio.run(main()) == [(ERROR, b"Unknown message 99."),
+                                   (ERROR, b"Truncated commands."),
+                                   (PONG, b'robot')]
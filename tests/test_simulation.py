@@ -0,0 +1,36 @@
+import numpy as np
+
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+
+POINTS = np.array([[0.04, 0.12], [0.06, 0.12], [0.06, 0.14]])
+DRAWING = np.array([False, True, True])
+
+
+def run_job(real_time):
+    robot_simulation = ParallelRobotSimulation(0.08,
+                                               0.08,
+                                               0.12,
+                                               visualization=False,
+                                               real_time=real_time,
+                                               history_capacity=2**16)
+    # Queued before the start, so no idle samples come first
+    robot_simulation.add_commands(POINTS, DRAWING)
+    robot_simulation.start()
+    try:
+        robot_simulation.run_until_idle()
+        samples, _, overrun = robot_simulation.get_telemetry_since(0)
+    finally:
+        robot_simulation.stop()
+    assert not overrun
+    return samples
+
+
+def test_virtual_clock_matches_real_time():
+    expected = run_job(False)
+    samples = run_job(True)
+    assert len(expected) > 0 and len(samples) >= len(expected)
+    assert samples[:len(expected)].tobytes() == expected.tobytes()
+    # Then the robot idles at the last point
+    for field in ('joint_position', 'cartesian_position', 'drawing',
+                  'command_index'):
+        assert np.all(samples[len(expected):][field] == expected[-1][field])
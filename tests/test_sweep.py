@@ -0,0 +1,83 @@
+import numpy as np
+
+from parallel_robot.planner import LookAheadPlanner, MotionLimits
+from parallel_robot.robot import (condition_numbers, forward_kinematics,
+                                  inverse_kinematics)
+from parallel_robot.simulation import SAMPLING_TIME
+from parallel_robot.sweep import (configuration_grid, evaluate_configuration,
+                                  sweep_configurations)
+
+PARAMETERS = (0.08, 0.08, 0.12, np.array([0.0, 0.0]))
+
+
+def random_job(number_of_points=40):
+    rng = np.random.default_rng(0)
+    points = np.column_stack((rng.uniform(0.0, 0.08, number_of_points),
+                              rng.uniform(0.08, 0.16, number_of_points)))
+    return points, rng.random(number_of_points) < 0.5
+
+
+def test_condition_numbers():
+    points, _ = random_job()
+    # Against central differences of the forward kinematics
+    step = 1e-6
+    joint_positions = inverse_kinematics(points, *PARAMETERS)
+    columns = [(forward_kinematics(joint_positions + offset, *PARAMETERS) -
+                forward_kinematics(joint_positions - offset, *PARAMETERS)) /
+               (2 * step) for offset in ([step, 0.0], [0.0, step])]
+    jacobians = np.stack(columns, axis=-1)
+    assert np.allclose(condition_numbers(points, *PARAMETERS),
+                       np.linalg.cond(jacobians),
+                       rtol=1e-4)
+    # On the workspace boundary and outside
+    assert np.isinf(condition_numbers([[0.04, 0.0], [0.5, 0.5]],
+                                      *PARAMETERS)).all()
+
+
+def test_parallel_sweep_matches_serial():
+    points, drawing = random_job()
+    robot_configurations = configuration_grid(np.linspace(0.04, 0.16, 3),
+                                              np.linspace(0.06, 0.14, 3),
+                                              np.linspace(0.08, 0.2, 3))
+    serial = list(
+        sweep_configurations(robot_configurations,
+                             points,
+                             drawing,
+                             max_workers=1,
+                             chunk_size=4))
+    parallel = sorted(sweep_configurations(robot_configurations,
+                                           points,
+                                           drawing,
+                                           max_workers=2,
+                                           chunk_size=4),
+                      key=lambda result: result.index)
+    assert [result.index for result in serial] == list(
+        range(len(robot_configurations)))
+    for a, b in zip(serial, parallel):
+        assert a.robot_configuration is robot_configurations[a.index]
+        assert (a.index, a.reachable_fraction, a.execution_time,
+                a.drawing_area,
+                a.max_condition_number) == (b.index, b.reachable_fraction,
+                                            b.execution_time, b.drawing_area,
+                                            b.max_condition_number)
+    assert any(result.reachable_fraction == 1.0 for result in serial)
+    assert any(result.reachable_fraction < 1.0 for result in serial)
+
+
+def test_planned_execution_time():
+    points, drawing = random_job()
+    robot_configuration = configuration_grid([0.08], [0.08], [0.12])[0]
+    motion_limits = MotionLimits(max_joint_velocity=4.0)
+    result = evaluate_configuration(robot_configuration,
+                                    points,
+                                    drawing,
+                                    motion_limits=motion_limits)
+    initial_position = forward_kinematics(
+        robot_configuration.initial_joint_position[None], *PARAMETERS)[0]
+    trajectory, _, _, _ = LookAheadPlanner(robot_configuration,
+                                           motion_limits,
+                                           SAMPLING_TIME).plan(
+                                               initial_position, points,
+                                               drawing)
+    assert result.execution_time == len(trajectory) * SAMPLING_TIME
+    assert result.reachable_fraction == 1.0
@@ -0,0 +1,139 @@
+import threading
+import time
+import numpy as np
+
+from parallel_robot.tools import Telemetry, TelemetryHistory, TelemetrySharer
+
+
+def publish(telemetry_sharer, number_of_samples, first=1):
+    for value in range(first, first + number_of_samples):
+        telemetry_sharer.publish(np.array([value, -value]),
+                                 np.array([2.0 * value, -2.0 * value]),
+                                 value % 2 == 0, value * 0.001, value // 10)
+
+
+def test_nothing_published():
+    telemetry_sharer = TelemetrySharer(8)
+    assert telemetry_sharer.get_sequence() == 0
+    assert telemetry_sharer.get_telemetry() is None
+    samples, last_sequence, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert (len(samples), last_sequence, overrun) == (0, 0, False)
+
+
+def test_latest_telemetry_is_the_last_history_sample():
+    telemetry_sharer = TelemetrySharer(8)
+    publish(telemetry_sharer, 5)
+    telemetry = telemetry_sharer.get_telemetry()
+    samples, last_sequence, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert last_sequence == telemetry_sharer.get_sequence() == 5
+    assert not overrun
+    assert np.array_equal(samples['sequence'], np.arange(1, 6))
+    assert np.array_equal(telemetry.joint_position,
+                          samples['joint_position'][-1])
+    assert np.array_equal(telemetry.cartesian_position,
+                          samples['cartesian_position'][-1])
+    assert telemetry.drawing == samples['drawing'][-1]
+    assert np.array_equal(samples['timestamp'], np.arange(1, 6) * 0.001)
+    assert np.array_equal(samples['command_index'], np.arange(1, 6) // 10)
+
+
+def test_published_telemetry_is_copied():
+    telemetry_sharer = TelemetrySharer(8)
+    joint_position = np.array([1.0, 2.0])
+    telemetry_sharer.publish(joint_position, np.array([3.0, 4.0]), True)
+    joint_position[:] = 0.0
+    telemetry = telemetry_sharer.get_telemetry()
+    assert np.array_equal(telemetry.joint_position, [1.0, 2.0])
+    samples, _, _ = telemetry_sharer.get_telemetry_since(0)
+    assert np.array_equal(samples['joint_position'], [[1.0, 2.0]])
+
+
+def test_history_since_sequence_wraps_around():
+    telemetry_sharer = TelemetrySharer(8)
+    publish(telemetry_sharer, 13)
+    samples, last_sequence, overrun = telemetry_sharer.get_telemetry_since(9)
+    assert (last_sequence, overrun) == (13, False)
+    assert np.array_equal(samples['sequence'], [10, 11, 12, 13])
+    assert np.array_equal(samples['joint_position'][:, 0], [10, 11, 12, 13])
+    samples, _, overrun = telemetry_sharer.get_telemetry_since(13)
+    assert len(samples) == 0 and not overrun
+
+
+def test_history_overrun():
+    telemetry_sharer = TelemetrySharer(8)
+    publish(telemetry_sharer, 20)
+    samples, last_sequence, overrun = telemetry_sharer.get_telemetry_since(0)
+    assert (last_sequence, overrun) == (20, True)
+    # The last capacity samples, in order
+    assert np.array_equal(samples['sequence'], np.arange(13, 21))
+
+
+def test_sharers_on_the_same_buffer():
+    # As in process mode, where the buffer is shared memory
+    buffer = bytearray(TelemetrySharer.get_buffer_size(8))
+    writer = TelemetrySharer(8, buffer)
+    reader = TelemetrySharer(8, buffer)
+    publish(writer, 3)
+    assert reader.get_sequence() == 3
+    assert np.array_equal(reader.get_telemetry().joint_position, [3, -3])
+    samples, _, _ = reader.get_telemetry_since(1)
+    assert np.array_equal(samples['sequence'], [2, 3])
+
+
+def test_history_buffer_size():
+    capacity = 16
+    buffer = bytearray(TelemetryHistory.get_buffer_size(capacity))
+    history = TelemetryHistory(capacity, buffer)
+    history.append(1, 0.0, [1.0, 2.0], [3.0, 4.0], True, 7)
+    assert history.get_capacity() == capacity
+    samples, last_sequence, _ = history.get_since(0)
+    assert last_sequence == 1 and samples['command_index'][0] == 7
+
+
+def test_concurrent_reads_are_consistent():
+    # Readers must never see a torn sample, in the latest telemetry or in
+    # the history
+    telemetry_sharer = TelemetrySharer(64)
+    stop_event = threading.Event()
+    errors = []
+
+    def writer():
+        value = 0
+        while not stop_event.is_set():
+            value += 1
+            publish(telemetry_sharer, 1, value)
+
+    def check(sequence, joint_position, cartesian_position, drawing):
+        value = joint_position[0]
+        if (joint_position[1] != -value or
+                cartesian_position[0] != 2 * value or
+                cartesian_position[1] != -2 * value or
+                drawing != (value % 2 == 0) or
+                (sequence is not None and sequence != value)):
+            errors.append(value)
+
+    def reader():
+        telemetry = Telemetry(np.zeros(2), np.zeros(2), False)
+        sequence = 0
+        while not stop_event.is_set():
+            if telemetry_sharer.read_telemetry(telemetry):
+                check(None, telemetry.joint_position,
+                      telemetry.cartesian_position, telemetry.drawing)
+            samples, sequence, _ = telemetry_sharer.get_telemetry_since(
+                sequence)
+            if np.any(np.diff(samples['sequence']) != 1):
+                errors.append(samples['sequence'])
+            for sample in samples:
+                check(sample['sequence'], sample['joint_position'],
+                      sample['cartesian_position'], sample['drawing'])
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1.0)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    assert telemetry_sharer.get_sequence() > 0
+    assert not errors
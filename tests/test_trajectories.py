@@ -0,0 +1,61 @@
+import numpy as np
+
+from parallel_robot.trajectories import (constant_velocity,
+                                         constant_velocity_moves,
+                                         constant_velocity_number_of_samples)
+
+
+def list_constant_velocity(initial_position, final_position, max_velocity,
+                           sampling_time):
+    # Previous per-sample implementation
+    position_increment = np.abs(final_position - initial_position)
+    time_to_destination = np.max(position_increment) / max_velocity
+    if time_to_destination <= sampling_time:
+        return [final_position]
+    vx = (final_position[0] - initial_position[0]) / time_to_destination
+    vy = (final_position[1] - initial_position[1]) / time_to_destination
+    num_samples = int(time_to_destination / sampling_time)
+    trajectory = []
+    for i in range(num_samples):
+        t = (i + 1) * sampling_time
+        trajectory.append(
+            np.array([initial_position[0] + vx * t,
+                      initial_position[1] + vy * t]))
+    trajectory[-1] = final_position
+    return trajectory
+
+
+def test_constant_velocity_matches_per_sample_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        initial_position, final_position = rng.uniform(-0.2, 0.2, (2, 2))
+        expected = np.array(
+            list_constant_velocity(initial_position, final_position, 0.2,
+                                   0.001))
+        result = constant_velocity(initial_position, final_position, 0.2,
+                                   0.001)
+        assert np.array_equal(result, expected)
+        assert result.flags['C_CONTIGUOUS']
+        assert constant_velocity_number_of_samples(
+            initial_position[None], final_position[None], 0.2,
+            0.001)[0] == len(result)
+
+
+def test_short_move_is_a_single_jump():
+    result = constant_velocity([0.0, 0.0], [1e-5, 0.0], 0.2, 0.001)
+    assert np.array_equal(result, [[1e-5, 0.0]])
+
+
+def test_moves_match_constant_velocity():
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(-0.2, 0.2, (50, 2))
+    # Zero length move
+    positions[10] = positions[9]
+    samples, moves = constant_velocity_moves(positions[0], positions[1:], 0.2,
+                                             0.001)
+    assert np.array_equal(moves, np.sort(moves))
+    for index in range(1, len(positions)):
+        assert np.array_equal(
+            samples[moves == index - 1],
+            constant_velocity(positions[index - 1], positions[index], 0.2,
+                              0.001))
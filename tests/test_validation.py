@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+
+from parallel_robot.async_api import AsyncParallelRobotSimulation
+from parallel_robot.parallel_robot_simulation import ParallelRobotSimulation
+from parallel_robot.robot import ParallelRobot
+from parallel_robot.simulation import SAMPLING_TIME, Simulation
+from parallel_robot.tools import (Command, CommandSharer, RobotConfiguration,
+                                  TelemetrySharer, VirtualTimeManager)
+from parallel_robot.validation import validate_commands
+
+ROBOT_CONFIGURATION = RobotConfiguration(0.08, 0.08, 0.12,
+                                         np.array([0.0, 0.0]),
+                                         np.array([np.pi / 2, np.pi / 2]))
+INITIAL_POSITION = ParallelRobot(*ROBOT_CONFIGURATION).get_state()[1]
+POINTS = np.array([[0.04, 0.12], [0.06, 0.12], [0.06, 0.14], [0.02, 0.14]])
+OUTSIDE = np.array([0.04, 0.3])
+# OUTSIDE inserted before the third point
+BAD_POINTS = np.insert(POINTS, 2, OUTSIDE, axis=0)
+
+
+def test_valid_commands_are_kept():
+    result = validate_commands(INITIAL_POSITION, POINTS, True,
+                               ROBOT_CONFIGURATION)
+    assert result.is_valid()
+    assert np.array_equal(result.points, POINTS)
+    assert np.array_equal(result.command_indices, np.arange(len(POINTS)))
+
+
+def test_reject():
+    result = validate_commands(INITIAL_POSITION,
+                               BAD_POINTS, [True, True, False, True, True],
+                               ROBOT_CONFIGURATION,
+                               max_condition_number=None)
+    invalid_command, = result.invalid_commands
+    assert (invalid_command.command_index, invalid_command.reason,
+            invalid_command.clipped_position) == (2, 'workspace', None)
+    assert np.array_equal(result.points, POINTS)
+    assert np.array_equal(result.drawing, [True, True, True, True])
+    assert np.array_equal(result.command_indices, [0, 1, 3, 4])
+    assert not ParallelRobot(*ROBOT_CONFIGURATION).in_workspace(
+        invalid_command.position)
+
+
+def test_singularity_margin():
+    # The condition number is about 2.8 at the initial position
+    result = validate_commands(INITIAL_POSITION,
+                               POINTS,
+                               True,
+                               ROBOT_CONFIGURATION,
+                               max_condition_number=2.0)
+    assert result.invalid_commands
+    assert {
+        invalid_command.reason
+        for invalid_command in result.invalid_commands
+    } == {'singularity'}
+    assert validate_commands(INITIAL_POSITION,
+                             POINTS,
+                             True,
+                             ROBOT_CONFIGURATION,
+                             max_condition_number=1.0).points.size == 0
+
+
+def test_clip():
+    result = validate_commands(INITIAL_POSITION, BAD_POINTS, True,
+                               ROBOT_CONFIGURATION, 'clip')
+    invalid_command, = result.invalid_commands
+    assert invalid_command.command_index == 2
+    assert invalid_command.sample_index > 0
+    assert np.array_equal(result.points[2], invalid_command.clipped_position)
+    assert np.array_equal(np.delete(result.points, 2, axis=0), POINTS)
+    # The clipped move and the following ones are valid
+    assert validate_commands(INITIAL_POSITION, result.points, True,
+                             ROBOT_CONFIGURATION).is_valid()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        validate_commands(INITIAL_POSITION, POINTS, True, ROBOT_CONFIGURATION,
+                          'skip')
+    with pytest.raises(ValueError):
+        ParallelRobotSimulation(0.08, 0.08, 0.12, visualization=False,
+                                validation='skip')
+
+
+def headless_simulation(validation='reject'):
+    return ParallelRobotSimulation(*ROBOT_CONFIGURATION,
+                                   visualization=False,
+                                   real_time=False,
+                                   history_capacity=2**16,
+                                   validation=validation)
+
+
+def test_simulation_rejects_commands():
+    robot_simulation = headless_simulation()
+    with pytest.raises(ValueError):
+        robot_simulation.submit_command(Command(OUTSIDE, True))
+    assert robot_simulation.add_commands(BAD_POINTS, True) == len(BAD_POINTS)
+    robot_simulation.run_until_idle()
+    assert [
+        invalid_command.command_index
+        for invalid_command in robot_simulation.get_invalid_commands()
+    ] == [0, 3]
+    samples, _, _ = robot_simulation.get_telemetry_since(0)
+    assert not np.isnan(samples['joint_position']).any()
+    robot_simulation.stop()
+
+    # The other commands run to the same states as without validation
+    robot_simulation = headless_simulation(None)
+    robot_simulation.add_commands(POINTS, True)
+    robot_simulation.run_until_idle()
+    expected, _, _ = robot_simulation.get_telemetry_since(0)
+    robot_simulation.stop()
+    assert np.array_equal(samples['cartesian_position'],
+                          expected['cartesian_position'])
+
+
+def test_simulation_clips_commands():
+    robot_simulation = headless_simulation('clip')
+    future = robot_simulation.submit_command(Command(OUTSIDE, True))
+    robot_simulation.run_until_idle()
+    invalid_command, = robot_simulation.get_invalid_commands()
+    assert future.result(0).number_of_rejected_samples == 0
+    assert np.array_equal(robot_simulation.get_telemetry().cartesian_position,
+                          invalid_command.clipped_position)
+    robot_simulation.stop()
+
+
+def test_async_commands_are_validated():
+    robot_simulation = ParallelRobotSimulation(*ROBOT_CONFIGURATION,
+                                               visualization=False,
+                                               history_capacity=2**16,
+                                               validation='reject')
+    robot_simulation.start()
+
+    async def main():
+        async_simulation = AsyncParallelRobotSimulation(robot_simulation)
+        try:
+            await asyncio.wait_for(
+                async_simulation.add_commands(BAD_POINTS, True), 10.0)
+        finally:
+            async_simulation.close()
+
+    try:
+        asyncio.run(main())
+        invalid_command, = robot_simulation.get_invalid_commands()
+        assert invalid_command.command_index == 2
+        samples, _, overrun = robot_simulation.get_telemetry_since(0)
+        assert not overrun
+        assert not np.isnan(samples['joint_position']).any()
+        assert np.array_equal(
+            robot_simulation.get_telemetry().cartesian_position, POINTS[-1])
+    finally:
+        robot_simulation.stop()
+
+
+def test_unvalidated_start_is_checked():
+    # A move validated from another start is checked sample by sample
+    command_sharer = CommandSharer()
+    telemetry_sharer = TelemetrySharer(2**16)
+    simulation = Simulation(telemetry_sharer, command_sharer,
+                            ROBOT_CONFIGURATION)
+    future = command_sharer.submit_command(
+        Command(OUTSIDE, True, validated_start=POINTS[0]))
+    simulation.run_until_idle(threading.Event(),
+                              VirtualTimeManager(SAMPLING_TIME))
+    assert future.result(0).number_of_rejected_samples > 0
+    samples, _, _ = telemetry_sharer.get_telemetry_since(0)
+    assert not np.isnan(samples['joint_position']).any()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from parallel_robot import workspace_grid
+from parallel_robot.robot import in_workspace, inverse_kinematics
+from parallel_robot.tools import RobotConfiguration
+from parallel_robot.workspace_grid import (WorkspaceGrid, get_workspace_grid,
+                                           sample_segments)
+
+ROBOT_CONFIGURATIONS = [
+    RobotConfiguration(0.08, 0.08, 0.12, np.array([0.0, 0.0]),
+                       np.array([np.pi / 2, np.pi / 2])),
+    RobotConfiguration(0.05, 0.1, 0.1, np.array([0.01, -0.02]),
+                       np.array([np.pi / 2, np.pi / 2])),
+]
+
+
+def parameters(robot_configuration):
+    return (robot_configuration.motor_distance,
+            robot_configuration.base_arm_length,
+            robot_configuration.link_arm_length,
+            np.asarray(robot_configuration.tcp_offset))
+
+
+def test_inverse_kinematics_error_bound():
+    rng = np.random.default_rng(0)
+    for robot_configuration in ROBOT_CONFIGURATIONS:
+        grid = WorkspaceGrid(robot_configuration)
+        points = rng.uniform(-0.25, 0.3, (10**5, 2))
+        inside = in_workspace(points, *parameters(robot_configuration))
+        assert np.array_equal(grid.in_workspace(points), inside)
+
+        points = points[inside]
+        errors = np.abs((grid.inverse_kinematics(points) -
+                         inverse_kinematics(points, *parameters(
+                             robot_configuration)) + np.pi) % (2 * np.pi) -
+                        np.pi)
+        assert errors.max() <= grid.get_tolerance()
+        # Most points are interpolated, not exact
+        assert np.count_nonzero(errors.max(axis=1)) > 0.5 * len(points)
+
+
+def test_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace_grid, '_grids', {})
+    robot_configuration = ROBOT_CONFIGURATIONS[0]
+    grid = get_workspace_grid(robot_configuration, 0.004, 1e-3, tmp_path)
+    assert get_workspace_grid(robot_configuration, 0.004, 1e-3,
+                              tmp_path) is grid
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # From the disk cache
+    monkeypatch.setattr(workspace_grid, '_grids', {})
+    cached = get_workspace_grid(robot_configuration, 0.004, 1e-3, tmp_path)
+    assert cached is not grid and cached.get_key() == grid.get_key()
+    assert np.array_equal(cached.get_joint_positions(),
+                          grid.get_joint_positions(),
+                          equal_nan=True)
+    assert get_workspace_grid(robot_configuration, 0.002, 1e-3,
+                              None).get_key() != grid.get_key()
+
+
+def test_segments_reachable():
+    grid = WorkspaceGrid(ROBOT_CONFIGURATIONS[0], 0.004, 1e-3)
+    # The second segment crosses the hole under a motor, between two
+    # reachable points
+    points = np.array([[0.04, 0.05], [0.0, 0.05], [0.0, -0.05],
+                       [0.04, -0.05]])
+    assert np.all(grid.in_workspace(points))
+    assert grid.segments_reachable(points).tolist() == [True, False, True]
+    assert not grid.is_path_reachable(points)
+    assert grid.is_path_reachable(points[2:])
+
+    samples, segments = sample_segments(points[:2], 0.01)
+    assert np.array_equal(samples[[0, -1]], points[:2])
+    assert np.all(segments == 0) and len(samples) == 5